@@ -0,0 +1,3 @@
+"""
+Benchmarks of the image and polar map hot paths.
+"""
@@ -0,0 +1,69 @@
+"""
+Measurement of the peak memory consumed by a function call.
+"""
+
+import os
+import threading
+import time
+import tracemalloc
+from typing import Callable
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+STATM = "/proc/self/statm"
+
+
+def _rss() -> int:
+    """
+    Resident set size of this process in bytes.
+    """
+    with open(STATM, mode="r") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def peak_memory(func: Callable[[], object], interval: float = 0.001) -> int:
+    """
+    Measure the peak memory allocated while calling a function in bytes.
+
+    Memory allocated by numpy is traced with `tracemalloc`. Because memory
+    allocated by SimpleITK and OpenCV is invisible to it, the resident set size
+    of the process is sampled additionally (on Linux) and the larger increase is
+    reported.
+
+    Parameters
+    ----------
+    func: callable
+    interval: float
+        sampling interval of the resident set size in seconds
+
+    Returns
+    -------
+    int
+    """
+    sample_rss = os.path.exists(STATM)
+    stop = threading.Event()
+    peak_rss = [_rss() if sample_rss else 0]
+
+    def sample():
+        while not stop.is_set():
+            peak_rss[0] = max(peak_rss[0], _rss())
+            time.sleep(interval)
+
+    baseline_rss = peak_rss[0]
+    thread = threading.Thread(target=sample, daemon=True)
+    if sample_rss:
+        thread.start()
+
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak_traced = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        stop.set()
+        if sample_rss:
+            thread.join()
+            peak_rss[0] = max(peak_rss[0], _rss())
+
+    # keep the result alive until the measurement is finished
+    del result
+    return max(peak_traced, peak_rss[0] - baseline_rss)
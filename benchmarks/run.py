@@ -0,0 +1,374 @@
+"""
+Benchmark the image and polar map hot paths on synthetic phantoms.
+
+Each benchmark is run on phantoms of 64³, 128³ and 256³ voxels. The wall time
+(median over repetitions) and the peak memory are reported and compared
+against a stored baseline. Additionally, checks ensure that alternative
+implementations (e.g. the OpenCV resampling backend) are equivalent to the
+reference. Regressions and failed checks lead to a non-zero exit code.
+
+Usage:
+    python -m benchmarks.run                    # run and compare to the baseline
+    python -m benchmarks.run --sizes 64 128     # only run on some sizes
+    python -m benchmarks.run --update_baseline  # store the results as new baseline
+"""
+
+import argparse
+from dataclasses import dataclass
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import scipy
+import SimpleITK as sitk
+
+from myoloom.localization import estimate_reorientation
+from myoloom.phantom import lv_phantom, write_dicom
+from myoloom.pipeline import polar_map_image
+from myoloom.polar_map.polar_map import PolarMapState
+from myoloom.polar_map.render import PolarMapRenderer, segment_scores
+from myoloom.polar_map.sampling import (
+    AZIMUTH_ANGLES,
+    POLAR_ANGLES,
+    cartesian_grid,
+    default_config,
+    grid_params,
+    polar_grid,
+    reduce_polar_rep,
+)
+from myoloom.polar_map.segment import compute_segment_scores
+from myoloom.polar_map.util import weight_polar_rep
+from myoloom.util import load_image, pad_crop, reorient, to_short_axis
+from myoloom.widget.slice_view import SITKData, SliceViewState
+
+from .memory import peak_memory
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+SIZES = (64, 128, 256)
+RADII_STEP = 0.2
+
+
+class Context:
+    """
+    Intermediate results of the pipeline for a phantom of a given size
+    which are the inputs of the benchmarks.
+    """
+
+    def __init__(self, size: int, directory: str):
+        self.size = size
+
+        self.filename = os.path.join(directory, f"phantom_{size}.dcm")
+        write_dicom(lv_phantom(size), self.filename)
+
+        self.image = load_image(self.filename)
+        estimate = estimate_reorientation(self.image)
+        self.center, self.angles = estimate.center, estimate.angles
+
+        self.reoriented = reorient(self.image, self.center, self.angles)
+        self.sa_image = polar_map_image(self.reoriented)
+        self.sa_array = sitk.GetArrayFromImage(self.sa_image)
+        self.config = grid_params(**default_config(self.sa_array.shape[0]))
+
+        self.radii = np.arange(0, self.sa_array.shape[1] / 2, RADII_STEP)
+        self.grid = polar_grid(
+            self.sa_array, self.radii, AZIMUTH_ANGLES, POLAR_ANGLES, **self.config
+        )
+        self.polar_rep = scipy.ndimage.map_coordinates(self.sa_array, self.grid, order=3)
+        self.radial_activities = reduce_polar_rep(self.polar_rep)
+
+
+BENCHMARKS: Dict[str, Callable[[Context], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark.
+
+    A benchmark is a function which receives the context and
+    returns the callable to be measured.
+    """
+
+    def register(setup: Callable[[Context], Callable[[], object]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+@benchmark("load_image")
+def bench_load_image(ctx: Context):
+    return lambda: load_image(ctx.filename)
+
+
+@benchmark("pad_crop")
+def bench_pad_crop(ctx: Context):
+    target_shape = (round(200 / ctx.image.GetSpacing()[0]),) * 3
+    return lambda: pad_crop(ctx.image, target_shape=target_shape)
+
+
+@benchmark("img_reoriented")
+def bench_img_reoriented(ctx: Context):
+    return lambda: reorient(ctx.image, ctx.center, ctx.angles)
+
+
+@benchmark("img_reoriented_opencv")
+def bench_img_reoriented_opencv(ctx: Context):
+    return lambda: reorient(ctx.image, ctx.center, ctx.angles, backend="opencv")
+
+
+@benchmark("img_sa")
+def bench_img_sa(ctx: Context):
+    return lambda: to_short_axis(ctx.reoriented)
+
+
+@benchmark("img_sa_opencv")
+def bench_img_sa_opencv(ctx: Context):
+    return lambda: to_short_axis(ctx.reoriented, backend="opencv")
+
+
+@benchmark("quantized_image")
+def bench_quantized_image(ctx: Context):
+    state = SliceViewState(SITKData(ctx.reoriented))
+    return lambda: SliceViewState.quantized_image(state, SITKData(ctx.reoriented))
+
+
+@benchmark("window")
+def bench_window(ctx: Context):
+    state = SliceViewState(SITKData(ctx.reoriented))
+    clip_percentages = iter(np.tile(np.linspace(1.0, 0.1, 10), 10**6))
+    return lambda: state.clip_percentage.set(next(clip_percentages))
+
+
+@benchmark("polar_grid")
+def bench_polar_grid(ctx: Context):
+    return lambda: polar_grid(
+        ctx.sa_array, ctx.radii, AZIMUTH_ANGLES, POLAR_ANGLES, **ctx.config
+    )
+
+
+@benchmark("map_coordinates")
+def bench_map_coordinates(ctx: Context):
+    return lambda: scipy.ndimage.map_coordinates(ctx.sa_array, ctx.grid, order=3)
+
+
+@benchmark("weight_polar_rep")
+def bench_weight_polar_rep(ctx: Context):
+    pixel_size_mm = ctx.sa_image.GetSpacing()[0] * RADII_STEP
+    return lambda: weight_polar_rep(
+        ctx.polar_rep.copy(), pixel_size_mm=pixel_size_mm, sigma=3.0
+    )
+
+
+@benchmark("polar_map_image")
+def bench_polar_map_image(ctx: Context):
+    state = PolarMapState(ctx.radial_activities)
+    return lambda: PolarMapState.image(
+        state,
+        state.radial_activities,
+        state.n_samples,
+        state.draw_segment_scores,
+        state.colormap,
+    )
+
+
+@benchmark("render_polar_map")
+def bench_render_polar_map(ctx: Context):
+    renderer = PolarMapRenderer(ctx.radial_activities.shape)
+    return lambda: renderer.render(
+        ctx.radial_activities, segment_scores(ctx.radial_activities)
+    )
+
+
+@benchmark("compute_segment_scores")
+def bench_compute_segment_scores(ctx: Context):
+    return lambda: compute_segment_scores(ctx.radial_activities)
+
+
+CHECKS: Dict[str, Callable[[Context], Optional[str]]] = {}
+
+
+def check(name: str):
+    """
+    Register a check.
+
+    A check is a function which receives the context and
+    returns a description of the failure or None.
+    """
+
+    def register(func: Callable[[Context], Optional[str]]):
+        CHECKS[name] = func
+        return func
+
+    return register
+
+
+def compare_images(
+    expected: sitk.Image, actual: sitk.Image, tolerance: float = 0.05
+) -> Optional[str]:
+    """
+    Compare images voxel-wise with a tolerance relative to the maximum of the expected image.
+
+    The default tolerance allows for the sub-voxel precision of `cv.remap` (1/32 of a voxel)
+    at the sharp edges of the phantoms.
+    """
+    if expected.GetSize() != actual.GetSize():
+        return f"size {actual.GetSize()} != {expected.GetSize()}"
+
+    expected_array = sitk.GetArrayViewFromImage(expected)
+    difference = np.abs(expected_array - sitk.GetArrayViewFromImage(actual)).max()
+    if difference > tolerance * np.abs(expected_array).max():
+        return f"maximal difference {difference:.4f} exceeds {tolerance:.0%} of the maximum"
+    return None
+
+
+@check("reorient_opencv")
+def check_reorient_opencv(ctx: Context):
+    return compare_images(
+        ctx.reoriented, reorient(ctx.image, ctx.center, ctx.angles, backend="opencv")
+    )
+
+
+@check("to_short_axis_opencv")
+def check_to_short_axis_opencv(ctx: Context):
+    return compare_images(
+        to_short_axis(ctx.reoriented), to_short_axis(ctx.reoriented, backend="opencv")
+    )
+
+
+@check("render_polar_map")
+def check_render_polar_map(ctx: Context):
+    """
+    Compare the cubic convolution of the renderer (`cv.remap`) to the cubic
+    spline interpolation of `scipy.ndimage.map_coordinates` within the rings.
+
+    The kernels differ slightly at the sharp edges of the phantoms, which
+    is allowed by a tolerance of 10% of the gray values.
+    """
+    renderer = PolarMapRenderer(
+        ctx.radial_activities.shape, colormap="gray", draw_segments=False
+    )
+    actual = renderer.colorize(ctx.radial_activities)[..., 0].astype(float)
+
+    grid = cartesian_grid(ctx.radial_activities, n_samples=renderer.n_samples)
+    expected = scipy.ndimage.map_coordinates(ctx.radial_activities, grid, order=3)
+    expected = np.clip(255 * expected / expected.max(), 0, 255)
+
+    within = grid[0] <= ctx.radial_activities.shape[0] - 1
+    difference = np.abs(expected - actual)[within].max()
+    if difference > 0.1 * 255:
+        return f"maximal difference of {difference:.1f} gray values exceeds 10%"
+    return None
+
+
+@dataclass
+class Result:
+    time_ms: float
+    peak_mb: float
+
+
+def measure(func: Callable[[], object], repeat: int) -> Result:
+    """
+    Measure the peak memory of a first (warm-up) call and the
+    median wall time of subsequent calls.
+    """
+    peak = peak_memory(func)
+
+    times = []
+    for _ in range(repeat):
+        since = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - since)
+
+    return Result(time_ms=1000 * statistics.median(times), peak_mb=peak / 1024**2)
+
+
+def compare(
+    results: Dict[str, Result],
+    baseline: Dict[str, dict],
+    tolerance: float,
+) -> List[str]:
+    """
+    Compare results against a baseline.
+
+    A regression is reported if the time or memory increases by more
+    than `tolerance` (relative) and by more than 1ms or 1MB (absolute),
+    so that measurement noise of tiny values is ignored.
+
+    Returns
+    -------
+    list of str
+        descriptions of the regressions
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+
+        for metric, minimum in (("time_ms", 1.0), ("peak_mb", 1.0)):
+            value = getattr(result, metric)
+            reference = baseline[key][metric]
+            if value > reference * (1.0 + tolerance) and value - reference > minimum:
+                regressions.append(
+                    f"{key}: {metric} {value:.1f} > baseline {reference:.1f}"
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the image and polar map hot paths.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--benchmarks", type=str, nargs="+", default=list(BENCHMARKS.keys())
+    )
+    parser.add_argument("--checks", type=str, nargs="*", default=list(CHECKS.keys()))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="relative tolerance for regressions"
+    )
+    parser.add_argument(
+        "--update_baseline", action="store_true", help="store results as the new baseline"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            ctx = Context(size, directory)
+            for name in args.checks:
+                failure = CHECKS[name](ctx)
+                if failure is not None:
+                    failures.append(f"{name}[{size}]: {failure}")
+                print(f"{name + f'[{size}]':<32} {'ok' if failure is None else 'failed':>12}")
+            for name in args.benchmarks:
+                key = f"{name}[{size}]"
+                results[key] = measure(BENCHMARKS[name](ctx), repeat=args.repeat)
+                print(
+                    f"{key:<32} {results[key].time_ms:>10.2f}ms {results[key].peak_mb:>10.1f}MB"
+                )
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, mode="r") as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        baseline.update({key: vars(result) for key, result in results.items()})
+        with open(args.baseline, mode="w") as f:
+            json.dump(baseline, f, indent=2)
+        exit(0)
+
+    regressions = compare(results, baseline, tolerance=args.tolerance)
+    for regression in regressions:
+        print(f"Regression - {regression}")
+    for failure in failures:
+        print(f"Check failed - {failure}")
+    exit(1 if len(regressions) > 0 or len(failures) > 0 else 0)
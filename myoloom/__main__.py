@@ -3,11 +3,16 @@ import tkinter as tk
 from tkinter import ttk
 
 from .app import App
+from .catalog import Catalog, add_filter_arguments, query_filters
 from .polar_map.main import App as PolarMapApp
 from .polar_map.state import AppState as PolarMapState
-from .state import AppState
+from .prefetch import Prefetcher
+from .resampling import BACKENDS
+from .snapshot import load_state
+from .state import AppState, WorklistState
 from .widget.file_dialog import FileDialog
 from .widget.menu import MenuBar
+from .widget.scheduler import Debouncer
 
 parser = argparse.ArgumentParser(
     description="GUI for the reorientation of myocardial perfusion SPECT images.",
@@ -17,22 +22,102 @@ parser.add_argument(
     "--file", type=str, help="provide a SPECT image file for reorientation"
 )
 parser.add_argument(
-    "--state", type=str, help="provide a SPECT image file for reorientation"
+    "--state",
+    type=str,
+    help="restore a saved state - either JSON or a snapshot (.npz) including the derived images (see myoloom.snapshot)",
+)
+parser.add_argument(
+    "--worklist",
+    type=str,
+    nargs="+",
+    help="provide a directory or a list of SPECT image files to be reviewed one after another",
+)
+parser.add_argument(
+    "--catalog",
+    type=str,
+    help="catalog (SQLite file) used to select the DICOM series of worklist directories recursively (see myoloom.catalog)",
+)
+add_filter_arguments(parser)
+parser.add_argument(
+    "--n_prefetch",
+    type=int,
+    default=3,
+    help="number of studies of the worklist preloaded in the background",
+)
+parser.add_argument(
+    "--cache_size",
+    type=int,
+    default=1024,
+    help="memory limit in MB for preloaded studies",
+)
+parser.add_argument(
+    "--no_auto_reorientation",
+    action="store_true",
+    help="do not estimate the reorientation automatically when an image is loaded",
+)
+parser.add_argument(
+    "--polar_map_delay",
+    type=int,
+    default=500,
+    help="delay in ms after the last reorientation change before the polar map is updated",
+)
+parser.add_argument(
+    "--resampling_backend",
+    type=str,
+    choices=BACKENDS,
+    default="sitk",
+    help="backend used to reorient images - opencv resamples slices in parallel and is only worth"
+    " using on machines with many CPUs where `python -m benchmarks.run` shows it faster than sitk"
+    " (on a single CPU it is slower at every image size and needs about twice the memory)",
+)
+parser.add_argument(
+    "--profile",
+    type=str,
+    help="record cascades of state changes and write them as a Chrome trace to this file on exit",
 )
 args = parser.parse_args()
 
-import json
+import atexit
+
+if args.profile is not None:
+    from .profiler import ReactiveProfiler
+
+    profiler = ReactiveProfiler()
+    profiler.install()
+
+    def write_profile():
+        print(profiler.summary(last=20, min_duration=1e-3))
+        profiler.write_chrome_trace(args.profile)
+
+    atexit.register(write_profile)
 
 # create the app state
-app_state = AppState()
+prefetcher = Prefetcher(
+    max_bytes=args.cache_size * 1024**2, backend=args.resampling_backend
+)
+app_state = AppState(
+    prefetcher=prefetcher,
+    auto_reorientation=not args.no_auto_reorientation,
+    resampling_backend=args.resampling_backend,
+)
+worklist = WorklistState(
+    app_state.filename,
+    prefetcher=prefetcher,
+    n_prefetch=args.n_prefetch,
+    catalog=Catalog(args.catalog) if args.catalog is not None else None,
+    filters=query_filters(args),
+)
 
 # set initial file from args
 if args.file is not None:
     app_state.filename.value = args.file
 
+if args.worklist is not None:
+    worklist.set_files(args.worklist)
+polar_map_state = PolarMapState()
+
 if args.state is not None:
-    with open(args.state, mode="r") as f:
-        app_state.deserialize(json.load(f))
+    load_state(args.state, app_state, polar_map_state)
 
 root = tk.Tk()
 root.title("MyoLoom")
@@ -46,7 +131,7 @@ if app_state.filename.value == "":
 style = ttk.Style()
 style.theme_use("clam")
 
-menu_bar = MenuBar(root, app_state)
+menu_bar = MenuBar(root, app_state, worklist=worklist, polar_map_app_state=polar_map_state)
 notebook = ttk.Notebook(root)
 notebook.grid(sticky="nswe")
 notebook.rowconfigure(0, weight=1)
@@ -56,26 +141,44 @@ notebook.columnconfigure(0, weight=1)
 app = App(notebook, app_state)
 app.grid(sticky="nswe")
 
-polar_map_state = PolarMapState()
 polar_map_app = PolarMapApp(notebook, polar_map_state)
 polar_map_app.grid(sticky="nswe")
 
 notebook.add(app, text="Reorientation")
 notebook.add(polar_map_app, text="Polar Map")
 
-def filename_obs(self, *_):
+# Reorientation changes are propagated to the polar map. While the reorientation
+# tab is active, updates are debounced so that the polar map is only recomputed
+# once the user pauses. An update is skipped if the reorientation is unchanged.
+debouncer = Debouncer(root, delay=args.polar_map_delay)
+propagated = {"reorientation": None}
+
+
+def propagate_reorientation():
+    reorientation = (
+        app_state.filename.value,
+        tuple(app_state.reorientation.center.values()),
+        tuple(app_state.reorientation.angle.values()),
+    )
+    if reorientation == propagated["reorientation"] or app_state.filename.value == "":
+        return
+
+    propagated["reorientation"] = reorientation
     polar_map_state.input_image.set(app_state.img_reoriented.value)
 
+
+def on_reorientation_change(*_):
+    # propagate immediately (after pending events) if the polar map is visible
+    polar_map_visible = notebook.index(notebook.select()) == 1
+    debouncer.schedule(propagate_reorientation, delay=0 if polar_map_visible else None)
+
+
 def on_tab_change(event):
-    selected = event.widget.index(notebook.select())
-    if selected == 0:
-        if filename_obs not in app_state.filename._callbacks:
-            return
-        app_state.filename.remove_callback(filename_obs)
-    elif selected == 1:
-        app_state.filename.on_change(filename_obs, trigger=True)
+    if event.widget.index(notebook.select()) == 1:
+        debouncer.flush()
 
 
+app_state.img_reoriented.on_change(on_reorientation_change, trigger=True)
 notebook.bind("<<NotebookTabChanged>>", on_tab_change)
 
 root.bind("<Key-q>", lambda event: exit(0))
@@ -0,0 +1,441 @@
+"""
+Catalog of the DICOM series in a directory tree.
+
+Scanning an archive of tens of thousands of files for suitable studies is
+slow. The catalog indexes a directory recursively by reading only the headers
+of files (in a thread pool) and stores the classification of each series
+in an SQLite database:
+  * the view: transversal, short axis or horizontal/vertical long axis (see `myoloom.util.is_short_axis`)
+  * stress or rest acquisition - derived from the series, study and protocol descriptions
+  * gated studies and their number of gates (see `myoloom.gated`)
+
+A refresh only reads the headers of files which are new or whose modification
+time or size changed, so that the GUI and the pipeline can select studies
+without re-scanning the archive:
+
+    python -m myoloom.catalog archive/ --catalog catalog.sqlite --view short_axis --study stress
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass, fields
+import os
+import re
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import pydicom
+
+VIEWS = ("transversal", "short_axis", "horizontal_long_axis", "vertical_long_axis")
+# views of studies which can be reoriented, e.g. not exported long-axis views (see `myoloom.export`)
+STUDY_VIEWS = ("transversal", "short_axis")
+STUDIES = ("stress", "rest")
+
+# attributes of the series and its image required to classify a file as DICOM
+_REQUIRED_KEYWORDS = ("SeriesInstanceUID", "Modality", "Rows", "Columns", "BitsAllocated")
+# codes of the view code sequence (see `myoloom.phantom.write_dicom`)
+_VIEW_CODES = {
+    "G-A117": "transversal",
+    "G-A186": "short_axis",
+    "G-A18B": "horizontal_long_axis",
+    "G-A18A": "vertical_long_axis",
+}
+_STUDY_PATTERNS = {
+    "stress": re.compile(r"(\b|_)(stress|belastung)(\b|_)", re.IGNORECASE),
+    "rest": re.compile(r"(\b|_)(rest|ruhe)(\b|_)", re.IGNORECASE),
+}
+
+
+@dataclass
+class SeriesInfo:
+    """
+    Header information of a file in the catalog.
+
+    Attributes
+    ----------
+    filename: str
+    mtime: float
+        modification time of the file when it was indexed
+    size: int
+        size of the file in bytes when it was indexed
+    dicom: bool
+        the file is a DICOM file - other files are kept in the catalog
+        so that they are not read again on a refresh
+    patient_id: str, optional
+    study_uid: str, optional
+    series_uid: str, optional
+    description: str, optional
+        series description
+    modality: str, optional
+    view: str, optional
+        one of `VIEWS` or None if unknown
+    study: str, optional
+        one of `STUDIES` or None if unknown
+    n_gates: int
+        number of gates (1 if the study is not gated)
+    n_frames: int
+    """
+
+    filename: str
+    mtime: float
+    size: int
+    dicom: bool = False
+    patient_id: Optional[str] = None
+    study_uid: Optional[str] = None
+    series_uid: Optional[str] = None
+    description: Optional[str] = None
+    modality: Optional[str] = None
+    view: Optional[str] = None
+    study: Optional[str] = None
+    n_gates: int = 1
+    n_frames: int = 1
+
+    @property
+    def gated(self) -> bool:
+        return self.n_gates > 1
+
+
+_COLUMNS = [f.name for f in fields(SeriesInfo)]
+
+
+def _view(ds: pydicom.Dataset) -> Optional[str]:
+    try:
+        view_code = ds.DetectorInformationSequence[0].ViewCodeSequence[0]
+    except (AttributeError, IndexError):
+        return None
+    if view_code.get("CodingSchemeDesignator") != "SNM3":
+        return None
+    return _VIEW_CODES.get(view_code.get("CodeValue"))
+
+
+def _study(ds: pydicom.Dataset) -> Optional[str]:
+    descriptions = " ".join(
+        str(ds.get(keyword, ""))
+        for keyword in ("SeriesDescription", "StudyDescription", "ProtocolName")
+    )
+    matches = [study for study, pattern in _STUDY_PATTERNS.items() if pattern.search(descriptions)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def _is_complete(ds: pydicom.Dataset, size: int) -> bool:
+    """
+    Test if a header describes a series with an image whose pixel data
+    fits into the file, which is not the case for truncated files.
+    """
+    if any(keyword not in ds for keyword in _REQUIRED_KEYWORDS):
+        return False
+
+    file_meta = getattr(ds, "file_meta", None)
+    transfer_syntax = None if file_meta is None else file_meta.get("TransferSyntaxUID")
+    if transfer_syntax is not None and transfer_syntax.is_compressed:
+        return True
+
+    n_bytes = (
+        int(ds.Rows)
+        * int(ds.Columns)
+        * int(ds.get("NumberOfFrames", 1) or 1)
+        * int(ds.get("SamplesPerPixel", 1) or 1)
+        * int(ds.BitsAllocated)
+        // 8
+    )
+    return n_bytes <= size
+
+
+def read_series_info(filename: str, mtime: float, size: int) -> SeriesInfo:
+    """
+    Classify a file by reading its header only.
+
+    Parameters
+    ----------
+    filename: str
+    mtime: float
+        modification time of the file
+    size: int
+        size of the file in bytes
+
+    Returns
+    -------
+    SeriesInfo
+        with `dicom=False` if the file could not be read as DICOM or
+        is incomplete, e.g. truncated or without pixel data
+    """
+    try:
+        ds = pydicom.dcmread(filename, stop_before_pixels=True)
+        if not _is_complete(ds, size):
+            return SeriesInfo(filename, mtime, size)
+
+        return SeriesInfo(
+            filename,
+            mtime,
+            size,
+            dicom=True,
+            patient_id=ds.get("PatientID"),
+            study_uid=ds.get("StudyInstanceUID"),
+            series_uid=ds.get("SeriesInstanceUID"),
+            description=ds.get("SeriesDescription"),
+            modality=ds.get("Modality"),
+            view=_view(ds),
+            study=_study(ds),
+            n_gates=int(ds.get("NumberOfTimeSlots", 1) or 1),
+            n_frames=int(ds.get("NumberOfFrames", 1) or 1),
+        )
+    except Exception:
+        # besides `InvalidDicomError` and `OSError`, pydicom raises various errors for
+        # corrupt values, which are parsed lazily - a corrupt file must not abort a refresh
+        return SeriesInfo(filename, mtime, size)
+
+
+def walk_files(directory: str) -> Iterator[Tuple[str, float, int]]:
+    """
+    Recursively list all (non-hidden) files in a directory.
+
+    Yields
+    ------
+    str, float, int
+        filename, modification time and size
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                yield entry.path, stat.st_mtime, stat.st_size
+
+
+class Catalog:
+    """
+    Catalog of DICOM series stored in an SQLite database.
+
+    The connection is created in the constructing thread and
+    should only be used by it.
+
+    Parameters
+    ----------
+    filename: str
+        the database file - use ":memory:" for a temporary catalog
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS series (
+                filename TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                dicom INTEGER NOT NULL,
+                patient_id TEXT,
+                study_uid TEXT,
+                series_uid TEXT,
+                description TEXT,
+                modality TEXT,
+                view TEXT,
+                study TEXT,
+                n_gates INTEGER NOT NULL,
+                n_frames INTEGER NOT NULL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS series_view ON series (view, study)")
+        self._connection.commit()
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def refresh(
+        self, directory: str, max_workers: Optional[int] = None
+    ) -> Tuple[int, int, int]:
+        """
+        Index a directory tree incrementally.
+
+        Headers are only read for files which are new or whose modification time
+        or size changed. Files which no longer exist are removed from the catalog.
+
+        Parameters
+        ----------
+        directory: str
+        max_workers: int, optional
+            number of threads reading headers
+
+        Returns
+        -------
+        int, int, int
+            number of added, updated and removed files
+        """
+        directory = os.path.abspath(directory)
+        prefix = os.path.join(directory, "")
+        indexed: Dict[str, Tuple[float, int]] = {
+            filename: (mtime, size)
+            for filename, mtime, size in self._connection.execute(
+                "SELECT filename, mtime, size FROM series WHERE filename LIKE ? ESCAPE '\\'",
+                (_escape_like(prefix) + "%",),
+            )
+        }
+
+        changed = []
+        n_added = 0
+        for filename, mtime, size in walk_files(directory):
+            known = indexed.pop(filename, None)
+            if known == (mtime, size):
+                continue
+            n_added += known is None
+            changed.append((filename, mtime, size))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            infos = executor.map(lambda args: read_series_info(*args), changed)
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO series VALUES ({', '.join('?' * len(_COLUMNS))})",
+                (astuple(info) for info in infos),
+            )
+
+        self._connection.executemany(
+            "DELETE FROM series WHERE filename = ?", ((filename,) for filename in indexed)
+        )
+        self._connection.commit()
+        return n_added, len(changed) - n_added, len(indexed)
+
+    def query(
+        self,
+        directory: Optional[str] = None,
+        view: Optional[Union[str, Sequence[str]]] = None,
+        study: Optional[str] = None,
+        gated: Optional[bool] = None,
+        patient_id: Optional[str] = None,
+    ) -> List[SeriesInfo]:
+        """
+        Select DICOM series in alphabetical order of their filenames.
+
+        Parameters
+        ----------
+        directory: str, optional
+            only series within this directory tree
+        view: str or sequence of str, optional
+            one or some of `VIEWS`
+        study: str, optional
+            one of `STUDIES`
+        gated: bool, optional
+            only gated or only ungated studies
+        patient_id: str, optional
+
+        Returns
+        -------
+        list of SeriesInfo
+        """
+        conditions, values = ["dicom = 1"], []
+        if directory is not None:
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            values.append(_escape_like(os.path.join(os.path.abspath(directory), "")) + "%")
+        if view is not None:
+            views = [view] if isinstance(view, str) else list(view)
+            conditions.append(f"view IN ({', '.join('?' * len(views))})")
+            values.extend(views)
+        for column, value in (("study", study), ("patient_id", patient_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if gated is not None:
+            conditions.append("n_gates > 1" if gated else "n_gates <= 1")
+
+        rows = self._connection.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM series"
+            f" WHERE {' AND '.join(conditions)} ORDER BY filename",
+            values,
+        )
+        return [SeriesInfo(*row) for row in rows]
+
+    def filenames(self, directory: Optional[str] = None, **filters) -> List[str]:
+        """
+        Select the filenames of DICOM series (see `query`).
+        """
+        return [info.filename for info in self.query(directory, **filters)]
+
+    def pairs(self, directory: Optional[str] = None, **filters) -> List[Tuple[str, str]]:
+        """
+        Select pairs of the stress and the rest series of patients (see `query`).
+
+        The stress and rest series of a patient are paired in alphabetical
+        order of their filenames. Series whose study is unknown or which
+        have no counterpart are skipped.
+
+        Returns
+        -------
+        list of tuple of str
+            filenames of the stress and the rest series
+        """
+        filters.pop("study", None)
+        series: Dict[str, Dict[Optional[str], List[str]]] = {study: {} for study in STUDIES}
+        for info in self.query(directory, **filters):
+            if info.study is not None:
+                series[info.study].setdefault(info.patient_id, []).append(info.filename)
+
+        return [
+            pair
+            for patient_id, stress in series["stress"].items()
+            for pair in zip(stress, series["rest"].get(patient_id, []))
+        ]
+
+
+def add_filter_arguments(
+    parser: argparse.ArgumentParser, view: Optional[Sequence[str]] = STUDY_VIEWS
+) -> None:
+    """
+    Add arguments to select series from the catalog (see `query_filters`).
+
+    Parameters
+    ----------
+    parser: argparse.ArgumentParser
+    view: sequence of str, optional
+        the default views - series of all views are selected by default if None
+    """
+    parser.add_argument(
+        "--view",
+        type=str,
+        nargs="+",
+        choices=VIEWS,
+        default=None if view is None else list(view),
+        help="only series of these views",
+    )
+    parser.add_argument("--study", type=str, choices=STUDIES, help="only stress or rest series")
+    parser.add_argument("--gated", action="store_true", help="only gated studies")
+    parser.add_argument("--ungated", action="store_true", help="only ungated studies")
+
+
+def query_filters(args: argparse.Namespace) -> dict:
+    """
+    Filters of `Catalog.query` of parsed arguments (see `add_filter_arguments`).
+    """
+    gated = True if args.gated else (False if args.ungated else None)
+    return {"view": args.view, "study": args.study, "gated": gated}
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Index the DICOM series of a directory tree and select studies.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("directory", type=str)
+    parser.add_argument("--catalog", type=str, default="catalog.sqlite")
+    parser.add_argument("--max_workers", type=int, help="number of threads reading headers")
+    add_filter_arguments(parser, view=None)
+    args = parser.parse_args()
+
+    with Catalog(args.catalog) as catalog:
+        added, updated, removed = catalog.refresh(args.directory, max_workers=args.max_workers)
+        print(f"Indexed {args.directory}: {added} added, {updated} updated, {removed} removed")
+
+        for info in catalog.query(args.directory, **query_filters(args)):
+            print(f"{info.filename}: {info.view or 'unknown'}, {info.study or '-'}, {info.n_gates} gate(s)")
@@ -0,0 +1,461 @@
+"""
+Export of reoriented volumes for downstream tools.
+
+The short-axis (SA), horizontal long axis (HLA) and vertical long axis (VLA)
+volumes of a study are written as NIfTI or DICOM files. Their geometry locates
+each voxel at the physical point of the loaded study it was resampled from,
+so that the volumes overlay the study in viewers (see `patient_geometry`).
+
+Volumes are exported from the app with the File->Export Volumes menu item or
+headless for many studies:
+
+    python -m myoloom.export studies/*.dcm --output_dir volumes --reorientations segment_scores.csv
+
+Reorientations are read from the output of `python -m myoloom.pipeline` or
+estimated. Studies are exported by a bounded thread pool (resampling and
+encoding in SimpleITK release the GIL), so that only the volumes of
+`max_workers` studies are held in memory at a time.
+"""
+
+import argparse
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+from typing import Deque, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pydicom
+from pydicom.errors import InvalidDicomError
+from pydicom.uid import generate_uid
+import SimpleITK as sitk
+
+from .phantom import write_dicom
+from .pipeline import complete_reorientation, relative_names
+from .prefetch import prepare_image
+from .util import reorient, reorientation_transform, short_axis_transform, to_short_axis
+
+VIEWS = ("sa", "hla", "vla")
+FORMATS = {"nifti": ".nii.gz", "dicom": ".dcm"}
+# attributes of the patient and study copied from a DICOM study to exported volumes
+DICOM_ATTRIBUTES = (
+    "PatientName",
+    "PatientID",
+    "PatientBirthDate",
+    "PatientSex",
+    "StudyInstanceUID",
+    "StudyID",
+    "StudyDate",
+    "StudyTime",
+    "StudyDescription",
+    "AccessionNumber",
+    "ReferringPhysicianName",
+)
+
+Reorientation = Tuple[Tuple[float, float, float], Tuple[float, float, float]]
+
+
+def patient_geometry(sitk_img: sitk.Image, transform: sitk.Transform) -> sitk.Image:
+    """
+    Locate the voxels of a resampled image at the physical points they were sampled from.
+
+    Resampling does not change the geometry of an image so that the voxels
+    of a reoriented image are located as in the original image. Instead,
+    the origin and the direction are transformed.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+        an image resampled with a rigid transform
+    transform: sitk.Transform
+        the rigid transform which maps physical points of the resampled
+        image to physical points of the original image
+
+    Returns
+    -------
+    sitk.Image
+        a shallow copy with the transformed geometry
+    """
+    origin = np.array(sitk_img.GetOrigin())
+    direction = np.array(sitk_img.GetDirection()).reshape((3, 3))
+
+    transformed_origin = np.array(transform.TransformPoint(origin.tolist()))
+    transformed_direction = np.stack(
+        [
+            np.array(transform.TransformPoint((origin + axis).tolist())) - transformed_origin
+            for axis in direction.T
+        ],
+        axis=1,
+    )
+
+    sitk_img = sitk_img[:]
+    sitk_img.SetOrigin(transformed_origin.tolist())
+    sitk_img.SetDirection(transformed_direction.ravel().tolist())
+    return sitk_img
+
+
+def short_axis_views(
+    img_sa: sitk.Image, views: Sequence[str] = VIEWS
+) -> Dict[str, sitk.Image]:
+    """
+    Derive the views of a short-axis image (see `myoloom.util.to_short_axis`).
+
+    The axes are permuted and flipped as in `myoloom.polar_map.config_view`,
+    which does not change the physical points of the voxels.
+
+    Parameters
+    ----------
+    img_sa: sitk.Image
+    views: sequence of str
+        any of `VIEWS`
+
+    Returns
+    -------
+    dict of str and sitk.Image
+    """
+    derive = {
+        "sa": lambda: img_sa,
+        "hla": lambda: sitk.Flip(sitk.PermuteAxes(img_sa, (0, 2, 1)), (False, False, True)),
+        "vla": lambda: sitk.PermuteAxes(sitk.Flip(img_sa, (False, False, True)), (2, 1, 0)),
+    }
+    return {view: derive[view]() for view in views}
+
+
+def reoriented_views(
+    sitk_img: sitk.Image,
+    center: Tuple[float, float, float],
+    angles: Tuple[float, float, float],
+    img_sa: Optional[sitk.Image] = None,
+    views: Sequence[str] = VIEWS,
+    geometry: bool = True,
+) -> Dict[str, sitk.Image]:
+    """
+    Compute the views of a reoriented image.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+        the image in transversal view
+    center, angles:
+        see `myoloom.util.reorient`
+    img_sa: sitk.Image, optional
+        the short-axis image if it is already computed, e.g. by the app
+    views: sequence of str
+        any of `VIEWS`
+    geometry: bool
+        locate the voxels at the physical points of the image (see `patient_geometry`)
+        - otherwise, the views have the geometry of the resampled image
+
+    Returns
+    -------
+    dict of str and sitk.Image
+    """
+    if img_sa is None:
+        img_sa = to_short_axis(reorient(sitk_img, center=center, angles=angles))
+
+    if geometry:
+        # the reoriented image has the geometry of the image
+        transform = sitk.CompositeTransform(
+            [reorientation_transform(sitk_img, center, angles), short_axis_transform(sitk_img)]
+        )
+        img_sa = patient_geometry(img_sa, transform)
+    return short_axis_views(img_sa, views)
+
+
+def dicom_attributes(filename: str) -> Optional[dict]:
+    """
+    Read the attributes in `DICOM_ATTRIBUTES` of a study or None if it is not a DICOM file.
+    """
+    try:
+        ds = pydicom.dcmread(filename, stop_before_pixels=True)
+    except (InvalidDicomError, OSError):
+        return None
+    return {keyword: ds[keyword].value for keyword in DICOM_ATTRIBUTES if keyword in ds}
+
+
+def write_views(
+    views: Mapping[str, sitk.Image],
+    basename: str,
+    format: str = "nifti",
+    attributes: Optional[dict] = None,
+) -> List[str]:
+    """
+    Write views as files named `<basename>_<view><extension>`.
+
+    NIfTI files are written compressed in single precision. DICOM files are
+    written as multi-frame NM images (see `myoloom.phantom.write_dicom`)
+    whose values are scaled to the range of 16-bit integers and which are
+    tagged with the code of their view.
+
+    Parameters
+    ----------
+    views: mapping of str and sitk.Image
+    basename: str
+        path of the files without the view and the extension
+    format: str
+        one of `FORMATS`
+    attributes: dict, optional
+        DICOM attributes of the patient and study (see `dicom_attributes`)
+
+    Returns
+    -------
+    list of str
+        the written filenames
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}, expected one of {list(FORMATS)}")
+
+    filenames = []
+    for view, sitk_img in views.items():
+        filename = f"{basename}_{view}{FORMATS[format]}"
+        if format == "nifti":
+            sitk.WriteImage(sitk.Cast(sitk_img, sitk.sitkFloat32), filename, useCompression=True)
+        else:
+            _max = sitk.GetArrayViewFromImage(sitk_img).max()
+            _attributes = {} if attributes is None else dict(attributes)
+            _attributes["SeriesInstanceUID"] = generate_uid()
+            _attributes["SeriesDescription"] = f"MyoLoom {view.upper()}"
+            write_dicom(
+                sitk_img,
+                filename,
+                scale=np.iinfo(np.uint16).max / _max if _max > 0 else 1.0,
+                attributes=_attributes,
+                view=view,
+            )
+        filenames.append(filename)
+    return filenames
+
+
+def export_study(
+    filename: str,
+    output_dir: str,
+    center: Optional[Tuple[float, float, float]] = None,
+    angles: Optional[Tuple[float, float, float]] = None,
+    views: Sequence[str] = VIEWS,
+    format: str = "nifti",
+    geometry: bool = True,
+    name: Optional[str] = None,
+) -> List[str]:
+    """
+    Load, reorient and export a study.
+
+    Parameters
+    ----------
+    filename: str
+    output_dir: str
+    center, angles:
+        see `myoloom.pipeline.process` - estimated if not provided
+    views, geometry:
+        see `reoriented_views`
+    format: str
+        one of `FORMATS`
+    name: str, optional
+        basename of the written files (see `write_views`) - defaults
+        to the name of the file without its extension
+
+    Returns
+    -------
+    list of str
+        the written filenames
+    """
+    prepared = prepare_image(filename)
+    center, angles = complete_reorientation(prepared.sitk_img, center, angles, prepared.angles)
+
+    name = _strip_extension(os.path.basename(filename)) if name is None else name
+    basename = os.path.join(output_dir, name)
+    return write_views(
+        reoriented_views(prepared.sitk_img, center, angles, views=views, geometry=geometry),
+        basename,
+        format=format,
+        attributes=dicom_attributes(filename) if format == "dicom" else None,
+    )
+
+
+def export_studies(
+    filenames: Iterable[str],
+    output_dir: str,
+    reorientations: Optional[Mapping[str, Reorientation]] = None,
+    views: Sequence[str] = VIEWS,
+    format: str = "nifti",
+    geometry: bool = True,
+    max_workers: Optional[int] = None,
+) -> List[str]:
+    """
+    Export many studies with a bounded thread pool.
+
+    At most `max_workers` studies are submitted at once, so that only
+    their volumes are held in memory for arbitrarily many studies.
+
+    Parameters
+    ----------
+    filenames: iterable of str
+    output_dir: str
+    reorientations: mapping of str and tuple, optional
+        center and angles by the name of a study (see `find_reorientation`)
+        - the reorientation of other studies is estimated
+    views, format, geometry:
+        see `export_study`
+    max_workers: int, optional
+        number of threads - defaults to the number of CPUs
+
+    Returns
+    -------
+    list of str
+        the written filenames
+
+    Raises
+    ------
+    ValueError
+        if studies would be exported to the same files (see `study_names`)
+    """
+    reorientations = {} if reorientations is None else reorientations
+    max_workers = os.cpu_count() if max_workers is None else max_workers
+    filenames = list(filenames)
+    names = study_names(filenames)
+
+    written = []
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for filename in filenames:
+            center, angles = find_reorientation(reorientations, filename)
+
+            if len(pending) >= max_workers:
+                written.extend(pending.popleft().result())
+            pending.append(
+                executor.submit(
+                    export_study,
+                    filename,
+                    output_dir,
+                    center=center,
+                    angles=angles,
+                    views=views,
+                    format=format,
+                    geometry=geometry,
+                    name=names[filename],
+                )
+            )
+
+        for future in pending:
+            written.extend(future.result())
+    return written
+
+
+def study_names(filenames: Sequence[str]) -> Dict[str, str]:
+    """
+    Name the exported files of studies.
+
+    Studies are named by their filename without the extension. If
+    files of the same name are exported, all studies are named by their
+    path relative to the common directory of the files (with separators
+    replaced by `_`).
+
+    Raises
+    ------
+    ValueError
+        if the names of studies are not unique (e.g., the same file is
+        given twice or `a/b.dcm` and `a_b.dcm` are exported)
+    """
+    names = {filename: _strip_extension(os.path.basename(filename)) for filename in filenames}
+    if len(set(names.values())) < len(filenames):
+        relative = relative_names(filenames)
+        names = {
+            filename: _strip_extension(relative[filename]).replace(os.sep, "_")
+            for filename in filenames
+        }
+
+    counts = Counter(names[filename] for filename in filenames)
+    if len(counts) < len(filenames):
+        duplicates = sorted({filename for filename in filenames if counts[names[filename]] > 1})
+        raise ValueError(f"Studies would be exported to the same files: {duplicates}")
+    return names
+
+
+def _strip_extension(filename: str) -> str:
+    # `.nii.gz` is a single extension, but dots in DICOM UIDs are not
+    if filename.endswith(".nii.gz"):
+        return filename[: -len(".nii.gz")]
+    return os.path.splitext(filename)[0]
+
+
+def find_reorientation(
+    reorientations: Mapping[str, Reorientation], filename: str
+) -> Union[Reorientation, Tuple[None, None]]:
+    """
+    Find the reorientation of a study by its name in the output of the pipeline.
+
+    Studies are named by their path relative to a directory (see
+    `myoloom.pipeline.relative_names`), so that the longest name which
+    is a trailing part of the path of the study is used.
+
+    Returns
+    -------
+    tuple
+        center and angles or None and None if the study is not found
+    """
+    parts = os.path.normpath(os.path.abspath(filename)).split(os.sep)
+    for i in range(len(parts)):
+        name = os.path.join(*parts[i:])
+        if name in reorientations:
+            return reorientations[name]
+    return None, None
+
+
+def read_reorientations(filename: str) -> Dict[str, Reorientation]:
+    """
+    Read the reorientations of studies from the CSV output of `python -m myoloom.pipeline`.
+
+    Only the first row of each study is used, e.g. the sum of a gated study.
+
+    Returns
+    -------
+    dict of str and tuple
+        center and angles by the name of a study
+    """
+    table = pd.read_csv(filename).drop_duplicates(subset="filename")
+    return {
+        row["filename"]: (
+            tuple(row[f"center_idx_{axis}"] for axis in "xyz"),
+            tuple(row[f"angle_{axis}"] for axis in "xyz"),
+        )
+        for _, row in table.iterrows()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the reoriented short-axis and long-axis volumes of MPI SPECT images.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("files", type=str, nargs="+", help="SPECT image files")
+    parser.add_argument("--output_dir", type=str, default="volumes")
+    parser.add_argument("--format", type=str, choices=list(FORMATS), default="nifti")
+    parser.add_argument("--views", type=str, nargs="+", choices=VIEWS, default=list(VIEWS))
+    parser.add_argument(
+        "--reorientations",
+        type=str,
+        help="CSV output of myoloom.pipeline with the reorientation of studies - estimated otherwise",
+    )
+    parser.add_argument(
+        "--no_geometry",
+        action="store_true",
+        help="keep the geometry of the resampled image instead of locating voxels at the points they were sampled from",
+    )
+    parser.add_argument(
+        "--max_workers", type=int, help="number of studies exported concurrently"
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    reorientations = (
+        read_reorientations(args.reorientations) if args.reorientations is not None else None
+    )
+    written = export_studies(
+        args.files,
+        args.output_dir,
+        reorientations=reorientations,
+        views=args.views,
+        format=args.format,
+        geometry=not args.no_geometry,
+        max_workers=args.max_workers,
+    )
+    print(f"Exported {len(written)} volumes to {args.output_dir}")
@@ -0,0 +1,207 @@
+"""
+Loading of ECG-gated SPECT studies.
+
+A gated study contains a volume per gate (time slot) of the cardiac cycle.
+All gates are stored as frames of a single multi-frame DICOM file, which
+would be read by `myoloom.util.load_image` as one volume stacking all gates.
+
+The header of a study is parsed once (see `GatedHeader`) and shared by all
+gates. Frames are streamed from the file, so that only the gates currently
+assembled are held in memory instead of the whole study.
+"""
+
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+from pydicom.pixels import iter_pixels
+import SimpleITK as sitk
+
+from .util import correct_image, is_short_axis, square_pad, to_transversal
+
+
+@dataclass
+class GatedHeader:
+    """
+    Header of a gated study.
+
+    Attributes
+    ----------
+    filename: str
+    reader: sitk.ImageFileReader
+        provides the meta information of the file
+    n_gates: int
+    n_slices: int
+        number of slices of each gate
+    gate_of_frame: NDArray
+        index of the gate of each frame
+    slice_of_frame: NDArray
+        index of the slice of each frame
+    short_axis: bool
+        the gates are stored in short-axis view
+    """
+
+    filename: str
+    reader: sitk.ImageFileReader
+    n_gates: int
+    n_slices: int
+    gate_of_frame: NDArray
+    slice_of_frame: NDArray
+    short_axis: bool
+
+
+def _metadata(reader: sitk.ImageFileReader, key: str) -> Optional[str]:
+    return reader.GetMetaData(key) if reader.HasMetaDataKey(key) else None
+
+
+def _vector(reader: sitk.ImageFileReader, key: str) -> Optional[NDArray]:
+    value = _metadata(reader, key)
+    if value is None:
+        return None
+    return np.array(value.split("\\"), dtype=int) - 1
+
+
+def read_header(filename: str) -> GatedHeader:
+    """
+    Parse the header of a gated study without reading its pixel data.
+
+    Parameters
+    ----------
+    filename: str
+
+    Returns
+    -------
+    GatedHeader
+    """
+    reader = sitk.ImageFileReader()
+    reader.LoadPrivateTagsOn()
+    reader.SetFileName(filename)
+    reader.ReadImageInformation()
+
+    n_frames = reader.GetSize()[2]
+    n_gates = int(_metadata(reader, "0054|0071") or 1)
+    n_slices = n_frames // n_gates
+
+    # frames are ordered by gate and then by slice if the vectors are not available
+    gate_of_frame = _vector(reader, "0054|0070")
+    if gate_of_frame is None or len(gate_of_frame) != n_frames:
+        gate_of_frame = np.arange(n_frames) // n_slices
+    slice_of_frame = _vector(reader, "0054|0080")
+    if slice_of_frame is None or len(slice_of_frame) != n_frames:
+        slice_of_frame = np.arange(n_frames) % n_slices
+
+    return GatedHeader(
+        filename=filename,
+        reader=reader,
+        n_gates=n_gates,
+        n_slices=n_slices,
+        gate_of_frame=gate_of_frame,
+        slice_of_frame=slice_of_frame,
+        short_axis=is_short_axis(filename),
+    )
+
+
+def is_gated(filename: str) -> bool:
+    """
+    Test if a file contains a gated study with more than one gate.
+    """
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(filename)
+    reader.ReadImageInformation()
+    return int(_metadata(reader, "0054|0071") or 1) > 1
+
+
+def _to_image(
+    volume: NDArray, header: GatedHeader, target_range: float, backend: str
+) -> Tuple[sitk.Image, Optional[Tuple[float, float]]]:
+    """
+    Convert the (raw) volume of a gate into an image as prepared by `myoloom.prefetch.prepare_image`.
+    """
+    reader = header.reader
+
+    slope = float(_metadata(reader, "0028|1053") or 1.0)
+    intercept = float(_metadata(reader, "0028|1052") or 0.0)
+    if slope != 1.0 or intercept != 0.0:
+        volume = volume * slope + intercept
+
+    sitk_img = sitk.GetImageFromArray(volume)
+    sitk_img.SetSpacing(reader.GetSpacing())
+    sitk_img.SetOrigin(reader.GetOrigin())
+    sitk_img.SetDirection(reader.GetDirection())
+    sitk_img = correct_image(sitk_img, reader, target_range=target_range)
+
+    if not header.short_axis:
+        return square_pad(sitk_img), None
+    return to_transversal(sitk_img, backend=backend)
+
+
+def iter_gates(
+    header: GatedHeader, target_range: float = 300, backend: str = "sitk"
+) -> Iterator[Tuple[int, sitk.Image, Optional[Tuple[float, float]]]]:
+    """
+    Stream the gates of a study.
+
+    Each gate is yielded as soon as all its frames are read.
+
+    Parameters
+    ----------
+    header: GatedHeader
+    target_range: float
+        see `myoloom.util.load_image`
+    backend: str
+        resampling backend used for short-axis studies (see `myoloom.resampling.BACKENDS`)
+
+    Yields
+    ------
+    int
+        index of the gate
+    sitk.Image
+        the gate prepared as by `myoloom.prefetch.prepare_image`
+    tuple of float or None
+        angles of short-axis studies (see `myoloom.util.to_transversal`)
+    """
+    volumes = {}
+    counts = np.zeros(header.n_gates, dtype=int)
+
+    for index, frame in enumerate(iter_pixels(header.filename)):
+        gate = header.gate_of_frame[index]
+        if gate not in volumes:
+            volumes[gate] = np.empty((header.n_slices, *frame.shape), dtype=np.float64)
+        volumes[gate][header.slice_of_frame[index]] = frame
+
+        counts[gate] += 1
+        if counts[gate] == header.n_slices:
+            yield (int(gate), *_to_image(volumes.pop(gate), header, target_range, backend))
+
+
+def load_summed_image(
+    filename: str, target_range: float = 300, backend: str = "sitk"
+) -> Tuple[sitk.Image, Optional[Tuple[float, float]]]:
+    """
+    Load the sum of all gates of a study, which corresponds to an ungated acquisition.
+
+    Parameters
+    ----------
+    filename: str
+    target_range: float
+        see `myoloom.util.load_image`
+    backend: str
+        resampling backend used for short-axis studies (see `myoloom.resampling.BACKENDS`)
+
+    Returns
+    -------
+    sitk.Image
+        the summed image prepared as by `myoloom.prefetch.prepare_image`
+    tuple of float or None
+        angles of short-axis studies (see `myoloom.util.to_transversal`)
+    """
+    header = read_header(filename)
+
+    summed = None
+    for index, frame in enumerate(iter_pixels(filename)):
+        if summed is None:
+            summed = np.zeros((header.n_slices, *frame.shape), dtype=np.float64)
+        summed[header.slice_of_frame[index]] += frame
+
+    return _to_image(summed, header, target_range, backend)
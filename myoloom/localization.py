@@ -0,0 +1,241 @@
+"""
+Automatic localization of the left ventricle (LV) in MPI SPECT images.
+
+The estimates are used to initialize the reorientation and the
+sampling parameters of polar maps, so that users only have to
+fine-tune them.
+"""
+
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+import scipy
+import SimpleITK as sitk
+
+# direction in which the apex points in the patient coordinate system (LPS),
+# which is to the left, anterior, and inferior
+APEX_DIRECTION = np.array([1.0, -1.0, -1.0]) / np.sqrt(3)
+
+
+@dataclass
+class ReorientationEstimate:
+    """
+    Estimated reorientation parameters.
+
+    Attributes
+    ----------
+    center: tuple of float
+        heart center as a continuous index (x, y, z)
+    angles: tuple of float
+        rotation around the x, y, and z axes in radians
+    """
+
+    center: Tuple[float, float, float]
+    angles: Tuple[float, float, float]
+
+
+def _largest_component(mask: NDArray[bool], weights: NDArray) -> NDArray[bool]:
+    """
+    Select the connected component of a mask with the largest summed weight.
+    """
+    labels, n_labels = scipy.ndimage.label(mask)
+    if n_labels == 0:
+        return mask
+
+    sums = scipy.ndimage.sum_labels(weights, labels, index=np.arange(1, n_labels + 1))
+    return labels == (np.argmax(sums) + 1)
+
+
+def _myocardium_mask(
+    img: NDArray, threshold: float, low_threshold: float
+) -> NDArray[bool]:
+    """
+    Segment the myocardium by hysteresis thresholding.
+
+    The component with the most activity above `threshold` is extended
+    by the voxels above `low_threshold` connected to it, so that regions
+    with reduced perfusion, e.g. an apical defect, are part of the mask.
+    Thresholds are relative to the maximum of the image.
+    """
+    seed = _largest_component(img > threshold * img.max(), img)
+    labels, _ = scipy.ndimage.label(img > low_threshold * img.max())
+    return np.isin(labels, np.unique(labels[seed]))
+
+
+def long_axis_angles(direction: NDArray) -> Tuple[float, float, float]:
+    """
+    Compute the reorientation angles which align a long axis direction
+    (from base to apex) with the apex direction of a horizontal long axis view.
+
+    Parameters
+    ----------
+    direction: NDArray
+        long axis direction in physical coordinates (x, y, z)
+
+    Returns
+    -------
+    tuple of float
+        rotation around the x, y, and z axes in radians
+    """
+    x, y, z = direction / np.linalg.norm(direction)
+    """
+    The reorientation resamples the image with a rotation R = Rz * Rx
+    (see `sitk.Euler3DTransform`) which maps the apex direction of
+    the output (0, -1, 0) onto the long axis direction of the input:
+    R * (0, -1, 0) = (sin(az) * cos(ax), -cos(az) * cos(ax), -sin(ax))
+    """
+    angle_x = -np.arcsin(np.clip(z, -1.0, 1.0))
+    angle_z = np.arctan2(x, -y)
+    return (float(angle_x), 0.0, float(angle_z))
+
+
+def estimate_reorientation(
+    sitk_img: sitk.Image,
+    target_size: int = 48,
+    threshold: float = 0.5,
+    low_threshold: float = 0.2,
+) -> Optional[ReorientationEstimate]:
+    """
+    Estimate the heart center and the orientation of its long axis.
+
+    The image is downsampled and the LV myocardium is segmented (see
+    `_myocardium_mask`). Its centroid is the heart center and its principal
+    axis (PCA of the voxel positions) is the long axis. Positions are not
+    weighted by activity, so that perfusion defects do not tilt the axis.
+    The direction of the long axis is chosen so that the apex points
+    to the left, anterior, and inferior.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+        image in transversal view
+    target_size: int
+        the image is downsampled to approximately this size for the estimation
+    threshold, low_threshold: float
+        thresholds relative to the maximum used to segment the myocardium
+
+    Returns
+    -------
+    ReorientationEstimate, optional
+        None if the image is empty
+    """
+    factor = max(1, round(max(sitk_img.GetSize()) / target_size))
+    small = sitk.BinShrink(sitk_img, [factor] * 3)
+
+    img = sitk.GetArrayFromImage(small)
+    img = scipy.ndimage.gaussian_filter(img, sigma=1.0)
+    if img.max() <= 0.0:
+        return None
+
+    mask = _myocardium_mask(img, threshold, low_threshold)
+    if mask.sum() < 4:
+        return None
+
+    # positions of the myocardium in (x, y, z) order
+    positions = np.argwhere(mask)[:, ::-1].astype(float)
+
+    center = positions.mean(axis=0)
+    # map from the downsampled to the original index
+    center_idx = (center + 0.5) * factor - 0.5
+
+    # principal axis in physical coordinates
+    spacing = np.array(small.GetSpacing())
+    direction_matrix = np.array(small.GetDirection()).reshape((3, 3))
+    points = (positions - center) * spacing @ direction_matrix.T
+    covariance = np.cov(points, rowvar=False)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    long_axis = eigenvectors[:, np.argmax(eigenvalues)]
+
+    if long_axis @ APEX_DIRECTION < 0:
+        long_axis = -long_axis
+
+    return ReorientationEstimate(
+        center=tuple(map(float, center_idx)),
+        angles=long_axis_angles(long_axis),
+    )
+
+
+def estimate_sampling_params(
+    img_sa: NDArray,
+    threshold: float = 0.5,
+    low_threshold: float = 0.2,
+    wedge: float = np.deg2rad(45),
+) -> Optional[dict[str, int]]:
+    """
+    Estimate the apex position and the basal planes in a short-axis image.
+
+    These are the parameters configured in `ConfigViewState`. The myocardium
+    is segmented (see `_myocardium_mask`) and edges are located where the
+    activity drops below `threshold` of the activity of the adjacent wall:
+    the apex in the maximum activity per slice and the basal planes in the
+    maximum activity per slice of the septal (left) and the lateral (right)
+    wall, so that a base which is not perpendicular to the long axis is
+    sampled as in `polar_grid`.
+
+    Parameters
+    ----------
+    img_sa: NDArray
+        image in short-axis view with the apex at the first slices
+    threshold, low_threshold: float
+        thresholds relative to the maximum used to segment the myocardium
+    wedge: float
+        half angle in radians of the septal and the lateral wall around the x axis
+
+    Returns
+    -------
+    dict, optional
+        `center_z` (the slice at which the spherical apex model ends),
+        `pos_line_septal`, and `pos_line_lateral` (the basal planes) or
+        None if the myocardium cannot be found
+    """
+    shape = np.array(img_sa.shape)
+
+    # restrict the search to a cylinder around the long axis
+    ys, xs = np.ogrid[: shape[1], : shape[2]]
+    ys, xs = ys - shape[1] // 2, xs - shape[2] // 2
+    distances = np.sqrt(ys**2 + xs**2)
+    cylinder = distances < 0.4 * min(shape[1:])
+
+    img = scipy.ndimage.gaussian_filter(img_sa, sigma=1.0) * cylinder[np.newaxis]
+    if img.max() <= 0.0:
+        return None
+
+    mask = _myocardium_mask(img, threshold, low_threshold)
+    slices = np.flatnonzero(mask.any(axis=(1, 2)))
+    if len(slices) < 3:
+        return None
+    img = np.where(mask, img, 0.0)
+
+    # the apex is located relative to the activity of the apical cap,
+    # which may be reduced by a defect
+    activities = img.max(axis=(1, 2))
+    apex_activity = activities[slices[0] : slices[0] + 2].max()
+    apex = slices[0] + np.argmax(activities[slices[0] :] >= threshold * apex_activity)
+
+    # the basal planes and the radius are estimated in the basal half,
+    # where the myocardium is cylindrical
+    mid = (apex + slices[-1]) // 2
+    angles = np.arctan2(ys, xs)
+    bases = {}
+    for name, angle in (("pos_line_septal", np.pi), ("pos_line_lateral", 0.0)):
+        in_wedge = np.abs(np.angle(np.exp(1j * (angles - angle)))) <= wedge
+        wall = (img * in_wedge).max(axis=(1, 2))
+        # the wall is followed from the mid-ventricle so that activity
+        # beyond the base, e.g. of the valve plane, is not included
+        above = wall[mid:] >= threshold * np.median(wall[mid : slices[-1] + 1])
+        bases[name] = int(mid + np.argmin(np.append(above, False)) - 1)
+    # the septal base cannot lie beyond the lateral base (see `ConfigView.set_pos_line_septal`)
+    bases["pos_line_septal"] = min(bases["pos_line_septal"], bases["pos_line_lateral"])
+
+    basal = np.zeros(mask.shape, dtype=bool)
+    basal[mid : slices[-1] + 1] = True
+    radius = np.average(
+        np.broadcast_to(distances, mask.shape)[np.logical_and(mask, basal)],
+        weights=img[np.logical_and(mask, basal)],
+    )
+
+    base = min(bases.values())
+    center_z = int(np.clip(round(apex + radius), apex + 1, base - 1))
+    return {"center_z": center_z, **bases}
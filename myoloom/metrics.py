@@ -0,0 +1,173 @@
+"""
+Latency metrics of the processing steps.
+
+Durations are recorded with timers and aggregated per session into histograms,
+so that latencies (e.g. p50/p95) can be compared across releases:
+
+    with timer("sampling"):
+        ...
+
+    @timed("load_image")
+    def load_image(...):
+        ...
+
+Metrics are shown in the debug panel of the GUI (see `myoloom.widget.metrics_view`)
+and can be written as JSON lines in batch mode (see `Metrics.open`).
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import functools
+import json
+import threading
+import time
+from typing import Callable, Deque, Dict, Iterator, Optional, TextIO
+
+import numpy as np
+
+
+class Histogram:
+    """
+    Durations recorded for a metric.
+
+    Parameters
+    ----------
+    max_samples: int
+        the number of samples kept to compute percentiles - older samples are discarded
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.count = 0
+        self.total = 0.0
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.samples.append(duration)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Summarize the histogram.
+
+        Returns
+        -------
+        dict
+            the number of samples and the mean, p50, p95 and maximum in milliseconds
+        """
+        samples = 1000 * np.array(self.samples)
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / max(self.count, 1),
+            "p50_ms": float(np.percentile(samples, 50)) if len(samples) > 0 else 0.0,
+            "p95_ms": float(np.percentile(samples, 95)) if len(samples) > 0 else 0.0,
+            "max_ms": float(samples.max()) if len(samples) > 0 else 0.0,
+        }
+
+
+class Metrics:
+    """
+    Registry of the histograms of a session.
+
+    Recording is thread-safe as the processing steps run
+    in background threads as well.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._output: Optional[TextIO] = None
+
+    def record(self, name: str, duration: float, **attributes) -> None:
+        """
+        Record the duration of a processing step.
+
+        Parameters
+        ----------
+        name: str
+            name of the metric
+        duration: float
+            duration in seconds
+        attributes:
+            additional values written to the JSON lines output, e.g. the filename
+        """
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].add(duration)
+
+            if self._output is not None:
+                event = {
+                    "metric": name,
+                    "duration_ms": 1000 * duration,
+                    "time": time.time(),
+                    **attributes,
+                }
+                self._output.write(json.dumps(event) + "\n")
+
+    @contextmanager
+    def timer(self, name: str, **attributes) -> Iterator[None]:
+        """
+        Time a block of code (see `record`).
+        """
+        since = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - since, **attributes)
+
+    def timed(self, name: str) -> Callable[[Callable], Callable]:
+        """
+        Decorator to time each call of a function (see `record`).
+        """
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summarize all histograms (see `Histogram.summary`).
+        """
+        with self._lock:
+            return {
+                name: histogram.summary()
+                for name, histogram in sorted(self.histograms.items())
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+
+    def open(self, filename: str) -> None:
+        """
+        Write each recorded duration as a JSON line to a file.
+        """
+        self.close()
+        with self._lock:
+            self._output = open(filename, mode="a")
+
+    def close(self) -> None:
+        """
+        Write the summary of the session as a final JSON line and close the output.
+        """
+        if self._output is None:
+            return
+
+        summary = self.summary()
+        with self._lock:
+            self._output.write(json.dumps({"summary": summary, "time": time.time()}) + "\n")
+            self._output.close()
+            self._output = None
+
+
+# metrics of the current session
+METRICS = Metrics()
+timer = METRICS.timer
+timed = METRICS.timed
@@ -0,0 +1,555 @@
+"""
+Synthetic phantoms of the left ventricular (LV) myocardium.
+
+Phantoms allow benchmarking and testing without patient data.
+Perfusion defects can be placed in the segments of the polar map
+(see `myoloom.polar_map.segment.SEGMENTS`) so that the expected
+segment scores of a phantom are known.
+
+Usage:
+    python -m myoloom.phantom phantoms --n 100 --defects 2 --noise 0.1
+"""
+
+import argparse
+from dataclasses import dataclass
+import functools
+import os
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from numpy.typing import NDArray
+import pandas as pd
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+import scipy
+import SimpleITK as sitk
+
+from .localization import APEX_DIRECTION, long_axis_angles
+from .pipeline import process_image
+from .polar_map.segment import SEGMENTS, Segment
+
+NM_IMAGE_STORAGE = "1.2.840.10008.5.1.4.1.1.20"
+VENDORS = ("siemens", "ge")
+# SNOMED codes (code value, code meaning) of the views written to the view code sequence
+VIEW_CODES = {
+    "transverse": ("G-A117", "Transverse"),
+    "sa": ("G-A186", "Short Axis"),
+    "hla": ("G-A18B", "Horizontal Long Axis"),
+    "vla": ("G-A18A", "Vertical Long Axis"),
+}
+
+
+@dataclass
+class Defect:
+    """
+    A perfusion defect covering a segment of the polar map.
+
+    Attributes
+    ----------
+    segment: int or str
+        id of the segment or its location and name, e.g. "basal anterior" or "apex"
+    severity: float
+        relative reduction of the activity in the segment in [0, 1]
+    """
+
+    segment: Union[int, str]
+    severity: float = 0.5
+
+
+def find_segment(segment: Union[int, str]) -> Segment:
+    """
+    Find a segment in `SEGMENTS` by its id or by its location and name.
+
+    Parameters
+    ----------
+    segment: int or str
+        e.g., 1, "basal anterior", "apical septal", or "apex"
+
+    Returns
+    -------
+    Segment
+    """
+    for _segment in SEGMENTS:
+        if segment in (
+            _segment.id,
+            f"{_segment.location} {_segment.name}",
+            _segment.name if _segment.location == "apex" else None,
+        ):
+            return _segment
+    raise ValueError(f"Unknown segment {segment!r}")
+
+
+def expected_segment_scores(
+    defects: Iterable[Defect] = (),
+    size: int = 64,
+    n_gates: int = 1,
+    weighting: bool = True,
+    **kwargs,
+) -> List[int]:
+    """
+    Compute the segment scores expected from `myoloom.pipeline` for a phantom.
+
+    Even without defects, the scores are below 100 because of partial
+    volume effects at the borders of the myocardium, and a defect also
+    reduces the scores of neighboring segments. Therefore, the noise-free
+    phantom is processed by the pipeline in the same way as the phantom,
+    so that the scores of a phantom with noise only deviate by the effect
+    of the noise on the estimated reorientation and the sampled activities.
+
+    Parameters
+    ----------
+    defects: iterable of Defect
+    size: int
+        number of voxels in each dimension
+    n_gates: int
+        number of gates - the scores of the summed gates of a gated study (see `gated_phantom`)
+    weighting: bool
+        see `myoloom.pipeline.process`
+    kwargs:
+        further parameters of `lv_phantom`, e.g. the `direction` - `noise` and `seed` are ignored
+
+    Returns
+    -------
+    list of int
+        the score of each segment in `SEGMENTS`
+    """
+    kwargs = {key: value for key, value in kwargs.items() if key not in ("noise", "seed")}
+    phantom = lv_phantom if n_gates == 1 else functools.partial(gated_phantom, n_gates=n_gates)
+    sitk_img = phantom(size, defects=list(defects), **kwargs)
+    if n_gates > 1:
+        sitk_img = functools.reduce(sitk.Add, sitk_img)
+    return process_image("phantom", sitk_img, weighting=weighting).segment_scores
+
+
+def lv_phantom(
+    size: int = 64,
+    field_of_view: float = 300.0,
+    offset: Tuple[float, float, float] = (10.0, -5.0, 10.0),
+    direction: Tuple[float, float, float] = tuple(APEX_DIRECTION),
+    length: float = 40.0,
+    radius: float = 25.0,
+    thickness: float = 10.0,
+    base: float = 35.0,
+    activity: float = 100.0,
+    defects: Iterable[Defect] = (),
+    extracardiac: float = 0.0,
+    fwhm: float = 0.0,
+    noise: float = 0.0,
+    seed: Optional[int] = None,
+) -> sitk.Image:
+    """
+    Create an image of the LV myocardium modeled as an ellipsoidal shell.
+
+    The apical half of the shell is a prolate ellipsoid and the basal half
+    a cylinder, which is open at the base.
+
+    Defects are placed in the segments as they are sampled by the polar map:
+    the azimuth angles follow the short-axis view created with the
+    reorientation angles of the long axis (see `long_axis_angles`) and the
+    myocardium is divided along the long axis into the apex (the apical cap
+    of the size of the radius) and three rings of equal length.
+
+    Parameters
+    ----------
+    size: int
+        number of voxels in each dimension
+    field_of_view: float
+        extent of the image in mm in each dimension
+    offset: tuple of float
+        offset of the heart center from the image center in mm
+    direction: tuple of float
+        long axis direction from base to apex (in LPS coordinates)
+    length: float
+        distance from the center to the (outer) apex in mm
+    radius: float
+        outer radius of the ventricle in mm
+    thickness: float
+        wall thickness in mm
+    base: float
+        distance from the center to the basal plane in mm
+    activity: float
+        activity in the myocardium
+    defects: iterable of Defect
+        perfusion defects in segments of the polar map
+    extracardiac: float
+        activity of the liver relative to the myocardium, which is
+        modeled as an ellipsoid to the right and inferior of the heart
+    fwhm: float
+        full width at half maximum in mm of a Gaussian blur modeling
+        the resolution of the scanner
+    noise: float
+        standard deviation of additive Gaussian noise relative to `activity`
+    seed: int, optional
+        seed of the random number generator used for noise
+
+    Returns
+    -------
+    sitk.Image
+    """
+    spacing = field_of_view / size
+    direction = np.array(direction, dtype=float)
+    direction = direction / np.linalg.norm(direction)
+
+    # physical coordinates (x, y, z) relative to the heart center
+    center = (np.array([size] * 3) / 2.0) * spacing + np.array(offset)
+    axis = (np.arange(size) * spacing)[:, np.newaxis] - center[np.newaxis]
+    x = axis[:, 0][np.newaxis, np.newaxis, :]
+    y = axis[:, 1][np.newaxis, :, np.newaxis]
+    z = axis[:, 2][:, np.newaxis, np.newaxis]
+
+    # decompose positions into the component along the long axis and the distance to it
+    along = direction[0] * x + direction[1] * y + direction[2] * z
+    distance = np.sqrt(np.maximum((x**2 + y**2 + z**2) - along**2, 0.0))
+
+    outer = _ellipsoid_distance(along, distance, length, radius)
+    inner = _ellipsoid_distance(along, distance, length - thickness, radius - thickness)
+    myocardium = np.logical_and(outer <= 1.0, inner > 1.0)
+    myocardium = np.logical_and(myocardium, along >= -base)
+    img = np.where(myocardium, activity, 0.0)
+
+    defects = list(defects)
+    if len(defects) > 0:
+        # position of the myocardium in the polar map
+        rotation = _short_axis_rotation(long_axis_angles(direction))
+        sa_x, sa_y = (
+            rotation[0, i] * x + rotation[1, i] * y + rotation[2, i] * z for i in range(2)
+        )
+        azimuth = np.mod(np.arctan2(sa_x, -sa_y), 2 * np.pi)
+        # the apex ends where the radius of the ventricle is reached (see `estimate_sampling_params`)
+        apex_start = length - (radius - thickness / 2.0)
+        ring = (apex_start - along) / (apex_start + base)
+
+        for defect in defects:
+            segment = find_segment(defect.segment)
+            if segment.location == "apex":
+                mask = along > apex_start
+            else:
+                index = ("apical", "mid", "basal").index(segment.location)
+                mask = np.logical_and(ring >= index / 3.0, ring < (index + 1) / 3.0)
+                mask = np.logical_and(mask, _in_angle_range(azimuth, segment.angle_range))
+            img[np.logical_and(mask, myocardium)] *= 1.0 - defect.severity
+
+    if extracardiac > 0.0:
+        liver = (
+            ((x + 60.0) / 70.0) ** 2 + ((y - 10.0) / 60.0) ** 2 + ((z + 75.0) / 40.0) ** 2
+        ) <= 1.0
+        img = img + np.where(liver, extracardiac * activity, 0.0)
+
+    if fwhm > 0.0:
+        sigma = fwhm / (2.0 * np.sqrt(2.0 * np.log(2.0))) / spacing
+        img = scipy.ndimage.gaussian_filter(img, sigma=sigma)
+
+    if noise > 0.0:
+        rng = np.random.default_rng(seed)
+        img = np.maximum(img + rng.normal(0.0, noise * activity, size=img.shape), 0.0)
+
+    sitk_img = sitk.GetImageFromArray(img)
+    sitk_img.SetSpacing((spacing,) * 3)
+    return sitk_img
+
+
+def random_phantom(
+    rng: np.random.Generator,
+    size: int = 64,
+    n_defects: int = 1,
+    max_tilt: float = 15.0,
+    n_gates: int = 1,
+    **kwargs,
+) -> Tuple[Union[sitk.Image, List[sitk.Image]], List[Defect], Tuple[float, float, float]]:
+    """
+    Create a phantom with random defects and a random orientation.
+
+    Parameters
+    ----------
+    rng: np.random.Generator
+    size: int
+        number of voxels in each dimension
+    n_defects: int
+        number of segments with a defect
+    max_tilt: float
+        maximal deviation of the long axis from `APEX_DIRECTION` in degrees
+    n_gates: int
+        number of gates - a gated study (see `gated_phantom`) is created if larger than one
+    kwargs:
+        further parameters of `lv_phantom`
+
+    Returns
+    -------
+    sitk.Image or list of sitk.Image
+        the image or the images of the gates
+    list of Defect
+    tuple of float
+        the long axis direction (see `lv_phantom`)
+    """
+    segments = rng.choice(len(SEGMENTS), size=n_defects, replace=False)
+    defects = [
+        Defect(SEGMENTS[i].id, severity=round(float(rng.uniform(0.3, 0.8)), 2))
+        for i in segments
+    ]
+
+    tilt = np.tan(np.deg2rad(max_tilt)) * rng.uniform(-1.0, 1.0, 3) / np.sqrt(3)
+    direction = tuple(map(float, APEX_DIRECTION + tilt))
+    phantom = lv_phantom if n_gates == 1 else functools.partial(gated_phantom, n_gates=n_gates)
+    sitk_img = phantom(
+        size,
+        direction=direction,
+        defects=defects,
+        seed=int(rng.integers(2**31)),
+        **kwargs,
+    )
+    return sitk_img, defects, direction
+
+
+def gated_phantom(
+    size: int = 64,
+    n_gates: int = 8,
+    contraction: float = 0.2,
+    radius: float = 25.0,
+    thickness: float = 10.0,
+    **kwargs,
+) -> List[sitk.Image]:
+    """
+    Create the frames of an ECG-gated study of the LV myocardium.
+
+    Over the cardiac cycle, the ventricle contracts from end-diastole
+    (first gate) to end-systole (middle gate) and relaxes again:
+    the radius decreases and the wall thickens.
+
+    Parameters
+    ----------
+    size: int
+        number of voxels in each dimension
+    n_gates: int
+        number of gates (frames) of the cardiac cycle
+    contraction: float
+        relative change of the radius and the wall thickness at end-systole
+    radius: float
+        outer radius of the ventricle at end-diastole in mm
+    thickness: float
+        wall thickness at end-diastole in mm
+    kwargs:
+        further parameters of `lv_phantom`
+
+    Returns
+    -------
+    list of sitk.Image
+        an image per gate
+    """
+    gates = []
+    for gate in range(n_gates):
+        phase = np.sin(np.pi * gate / n_gates) ** 2
+        gates.append(
+            lv_phantom(
+                size,
+                radius=radius * (1.0 - contraction * phase),
+                thickness=thickness * (1.0 + contraction * phase),
+                **kwargs,
+            )
+        )
+    return gates
+
+
+def _in_angle_range(angles: NDArray, angle_range: Tuple[float, float]) -> NDArray[bool]:
+    """
+    Test if angles are in an angle range which may wrap around 0 (see `segment_mask`).
+    """
+    if angle_range[0] > angle_range[1]:
+        return np.logical_or(angles >= angle_range[0], angles < angle_range[1])
+    return np.logical_and(angle_range[0] <= angles, angles < angle_range[1])
+
+
+def _short_axis_rotation(angles: Tuple[float, float, float]) -> NDArray:
+    """
+    Rotation from the axes of the short-axis view (see `myoloom.util.to_short_axis`)
+    of a reoriented image into the physical space of the original image.
+
+    The columns are the x, y and z axes of the short-axis view.
+    """
+    reorientation = sitk.Euler3DTransform((0.0, 0.0, 0.0), *angles)
+    short_axis = sitk.Euler3DTransform((0.0, 0.0, 0.0), 0.0, np.rad2deg(-90), 0.0)
+    permutation = sitk.PermuteAxes(sitk.Image([1, 1, 1], sitk.sitkUInt8), (2, 0, 1))
+    return (
+        np.array(reorientation.GetMatrix()).reshape((3, 3))
+        @ np.array(short_axis.GetMatrix()).reshape((3, 3))
+        @ np.array(permutation.GetDirection()).reshape((3, 3))
+    )
+
+
+def _ellipsoid_distance(
+    along: NDArray, distance: NDArray, length: float, radius: float
+) -> NDArray:
+    """
+    Normalized distance to the surface of the LV model (1 at the surface).
+    """
+    return np.sqrt((np.maximum(along, 0.0) / length) ** 2 + (distance / radius) ** 2)
+
+
+def write_dicom(
+    sitk_img: Union[sitk.Image, List[sitk.Image]],
+    filename: str,
+    scale: float = 10.0,
+    vendor: str = "siemens",
+    attributes: Optional[dict] = None,
+    view: Optional[str] = None,
+) -> None:
+    """
+    Write an image as a multi-frame NM DICOM file as written by SPECT devices.
+
+    The images of a gated study (see `gated_phantom`) are written as time slots,
+    which contain all slices of a gate one after another.
+
+    The file contains the vendor specific tags evaluated by `myoloom.util.load_image`:
+      * siemens: values are scaled by the `PixelScaleFactor`
+      * ge: `SpacingBetweenSlices` is twice the `SliceThickness` (as written by the
+        GE Discovery NM530c) and values are stored unscaled
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image or list of sitk.Image
+        an image or the images of the gates of a gated study
+    filename: str
+    scale: float
+        values are stored as integers multiplied by this scale (siemens only)
+    vendor: str
+        one of `VENDORS`
+    attributes: dict, optional
+        DICOM attributes by keyword which replace the generated ones,
+        e.g. of the patient and study of an exported image (see `myoloom.export`)
+    view: str, optional
+        one of `VIEW_CODES` - transverse or short axis depending on the direction if not provided
+    """
+    if vendor not in VENDORS:
+        raise ValueError(f"Unknown vendor {vendor!r}, expected one of {VENDORS}")
+    if view is not None and view not in VIEW_CODES:
+        raise ValueError(f"Unknown view {view!r}, expected one of {list(VIEW_CODES)}")
+    scale = scale if vendor == "siemens" else 1.0
+
+    gates = [sitk_img] if isinstance(sitk_img, sitk.Image) else list(sitk_img)
+    sitk_img = gates[0]
+
+    img = np.concatenate([sitk.GetArrayFromImage(gate) for gate in gates])
+    img = np.clip(np.round(img * scale), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = NM_IMAGE_STORAGE
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.Modality = "NM"
+    ds.PatientName = "Phantom"
+    ds.PatientID = "phantom"
+
+    n_slices = img.shape[0] // len(gates)
+    ds.Rows, ds.Columns = img.shape[1:]
+    ds.NumberOfFrames = img.shape[0]
+    ds.NumberOfSlices = n_slices
+    ds.SliceVector = list(range(1, n_slices + 1)) * len(gates)
+    if len(gates) == 1:
+        ds.FrameIncrementPointer = pydicom.tag.Tag(0x0054, 0x0080)
+    else:
+        ds.FrameIncrementPointer = [
+            pydicom.tag.Tag(0x0054, 0x0070),
+            pydicom.tag.Tag(0x0054, 0x0080),
+        ]
+        ds.NumberOfTimeSlots = len(gates)
+        ds.TimeSlotVector = np.repeat(np.arange(1, len(gates) + 1), n_slices).tolist()
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+
+    spacing = sitk_img.GetSpacing()
+    ds.PixelSpacing = [spacing[1], spacing[0]]
+    ds.SliceThickness = spacing[2]
+    ds.SpacingBetweenSlices = spacing[2] if vendor == "siemens" else 2 * spacing[2]
+
+    direction = np.array(sitk_img.GetDirection()).reshape((3, 3))
+    detector = Dataset()
+    detector.ImagePositionPatient = list(sitk_img.GetOrigin())
+    detector.ImageOrientationPatient = [*direction[:, 0], *direction[:, 1]]
+    if view is None:
+        view = "transverse" if np.allclose(direction, np.eye(3)) else "sa"
+    detector.ViewCodeSequence = Sequence([_view_code(view)])
+    ds.DetectorInformationSequence = Sequence([detector])
+
+    if vendor == "siemens":
+        ds.Manufacturer = "SIEMENS NM"
+        block = ds.private_block(0x0033, "MEDCOM OOG 1", create=True)
+        block.add_new(0x38, "FL", scale)
+    else:
+        ds.Manufacturer = "GE MEDICAL SYSTEMS"
+
+    if attributes is not None:
+        for keyword, value in attributes.items():
+            setattr(ds, keyword, value)
+
+    ds.PixelData = img.tobytes()
+    ds.save_as(filename, enforce_file_format=True)
+
+
+def _view_code(view: str) -> Dataset:
+    """
+    Code of a view (see `VIEW_CODES`).
+    """
+    view_code = Dataset()
+    view_code.CodingSchemeDesignator = "SNM3"
+    view_code.CodeValue, view_code.CodeMeaning = VIEW_CODES[view]
+    return view_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate LV phantoms with perfusion defects and their expected segment scores.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("directory", type=str, help="output directory")
+    parser.add_argument("--n", type=int, default=10, help="number of phantoms")
+    parser.add_argument("--size", type=int, default=64)
+    parser.add_argument("--defects", type=int, default=1, help="number of defects per phantom")
+    parser.add_argument("--extracardiac", type=float, default=0.0)
+    parser.add_argument("--fwhm", type=float, default=0.0)
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--vendor", type=str, choices=VENDORS, default=VENDORS[0])
+    parser.add_argument(
+        "--gates", type=int, default=1, help="number of gates of an ECG-gated study"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+
+    rows = []
+    for i in range(args.n):
+        phantom_kwargs = dict(
+            size=args.size, extracardiac=args.extracardiac, fwhm=args.fwhm, n_gates=args.gates
+        )
+        sitk_img, defects, direction = random_phantom(
+            rng, n_defects=args.defects, noise=args.noise, **phantom_kwargs
+        )
+        expected_scores = expected_segment_scores(defects, direction=direction, **phantom_kwargs)
+
+        filename = f"phantom_{i:04d}.dcm"
+        write_dicom(sitk_img, os.path.join(args.directory, filename), vendor=args.vendor)
+        rows.append(
+            {
+                "filename": filename,
+                "segment_scores": ";".join(map(str, expected_scores)),
+                "defects": ";".join(
+                    f"{defect.segment}:{defect.severity}" for defect in defects
+                ),
+            }
+        )
+    pd.DataFrame(rows).to_csv(
+        os.path.join(args.directory, "expected_scores.csv"), index=False
+    )
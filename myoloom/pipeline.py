@@ -0,0 +1,649 @@
+"""
+Headless processing of MPI SPECT images.
+
+The pipeline performs the same steps as the app without user interaction:
+loading, reorientation, short-axis conversion, polar map sampling and the
+computation of segment scores. Reorientation and sampling parameters are
+estimated automatically (see `myoloom.localization`) if not provided.
+Gated studies are processed per gate (see `process_gated`) and stress and
+rest acquisitions as pairs (see `process_paired`). Short-axis images can be
+sampled in their stored orientation without reorientation (see `process_short_axis`).
+"""
+
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+import pandas as pd
+import SimpleITK as sitk
+
+from .catalog import Catalog, add_filter_arguments, query_filters
+from .gated import is_gated, iter_gates, load_summed_image, read_header
+from .localization import estimate_reorientation, estimate_sampling_params
+from .metrics import METRICS, timer
+from .polar_map.normals import NormalDatabase
+from .polar_map.sampling import (
+    compute_radial_activities,
+    compute_radial_activities_batch,
+    default_config,
+    grid_params,
+)
+from .polar_map.segment import compute_segment_scores
+from .prefetch import prepare_image
+from .registration import register_rigid
+from .resampling import resample_linear
+from .results import ResultsWriter
+from .util import is_short_axis, load_image, pad_crop, reorient, short_axis_angles, to_short_axis
+
+
+@dataclass
+class PipelineResult:
+    """
+    Result of processing an image with the pipeline.
+
+    Attributes
+    ----------
+    filename: str
+    center: tuple of float
+        heart center as a continuous index (x, y, z)
+    angles: tuple of float
+        rotation around the x, y, and z axes in radians
+    config: dict
+        position of the apex model and the basal planes (see `ConfigViewState`)
+    radial_activities: NDArray
+    segment_scores: list of int
+    """
+
+    filename: str
+    center: Tuple[float, float, float]
+    angles: Tuple[float, float, float]
+    config: dict[str, int]
+    radial_activities: NDArray = field(repr=False)
+    segment_scores: List[int]
+
+
+def polar_map_image(sitk_img: sitk.Image, target_range: float = 200) -> sitk.Image:
+    """
+    Prepare a reoriented image for polar map sampling.
+
+    The image is cropped to `target_range` mm and converted to short-axis view.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+        a reoriented image (see `myoloom.util.reorient`)
+    target_range: float
+        the range in mm in each dimension
+
+    Returns
+    -------
+    sitk.Image
+    """
+    target_shape = (round(target_range / sitk_img.GetSpacing()[0]),) * 3
+    return to_short_axis(pad_crop(sitk_img, target_shape=target_shape))
+
+
+def complete_reorientation(
+    sitk_img: sitk.Image,
+    center: Optional[Tuple[float, float, float]],
+    angles: Optional[Tuple[float, float, float]],
+    short_axis_angles: Optional[Tuple[float, float]],
+) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
+    """
+    Complete the reorientation of an image by estimating missing parameters.
+    """
+    if center is not None and angles is not None:
+        return center, angles
+
+    estimate = estimate_reorientation(sitk_img)
+    if estimate is None:
+        estimate_center = tuple(s / 2.0 for s in sitk_img.GetSize())
+        estimate_angles = (0.0, 0.0, 0.0)
+    else:
+        estimate_center, estimate_angles = estimate.center, estimate.angles
+
+    if short_axis_angles is not None:
+        estimate_angles = (short_axis_angles[0], 0.0, short_axis_angles[1])
+
+    center = estimate_center if center is None else center
+    angles = estimate_angles if angles is None else angles
+    return center, angles
+
+
+def _sampling_config(img: NDArray, config: Optional[dict[str, int]]) -> dict[str, int]:
+    """
+    Estimate the sampling parameters of a short-axis image if not provided.
+    """
+    if config is None:
+        config = estimate_sampling_params(img)
+        config = config if config is not None else default_config(img.shape[0])
+    return config
+
+
+def process_image(
+    filename: str,
+    sitk_img: sitk.Image,
+    center: Optional[Tuple[float, float, float]] = None,
+    angles: Optional[Tuple[float, float, float]] = None,
+    config: Optional[dict[str, int]] = None,
+    weighting: bool = True,
+    short_axis_angles: Optional[Tuple[float, float]] = None,
+) -> PipelineResult:
+    """
+    Process a prepared image (see `myoloom.prefetch.prepare_image`) to segment scores.
+
+    Parameters
+    ----------
+    filename: str
+        file of the image
+    sitk_img: sitk.Image
+        the image in transversal view
+    center, angles, config, weighting:
+        see `process`
+    short_axis_angles: tuple of float, optional
+        angles of a short-axis image (see `myoloom.prefetch.PreparedImage`)
+
+    Returns
+    -------
+    PipelineResult
+    """
+    center, angles = complete_reorientation(sitk_img, center, angles, short_axis_angles)
+
+    sa_image = polar_map_image(reorient(sitk_img, center=center, angles=angles))
+    img = sitk.GetArrayFromImage(sa_image)
+
+    config = _sampling_config(img, config)
+
+    radial_activities = compute_radial_activities(
+        img,
+        **grid_params(**config),
+        weighting=weighting,
+        spacing=sa_image.GetSpacing()[0],
+    )
+
+    return PipelineResult(
+        filename=filename,
+        center=tuple(center),
+        angles=tuple(angles),
+        config=config,
+        radial_activities=radial_activities,
+        segment_scores=compute_segment_scores(radial_activities),
+    )
+
+
+def process(
+    filename: str,
+    center: Optional[Tuple[float, float, float]] = None,
+    angles: Optional[Tuple[float, float, float]] = None,
+    config: Optional[dict[str, int]] = None,
+    weighting: bool = True,
+) -> PipelineResult:
+    """
+    Process an image from loading to segment scores.
+
+    Parameters
+    ----------
+    filename: str
+    center: tuple of float, optional
+        heart center as a continuous index - estimated if not provided
+    angles: tuple of float, optional
+        reorientation angles in radians - taken from the header of short-axis
+        images or estimated if not provided
+    config: dict, optional
+        position of the apex model and the basal planes - estimated if not provided
+    weighting: bool
+        weight the polar representation during sampling
+
+    Returns
+    -------
+    PipelineResult
+    """
+    prepared = prepare_image(filename)
+    return process_image(
+        filename,
+        prepared.sitk_img,
+        center=center,
+        angles=angles,
+        config=config,
+        weighting=weighting,
+        short_axis_angles=prepared.angles,
+    )
+
+
+def process_short_axis(
+    filename: str,
+    config: Optional[dict[str, int]] = None,
+    weighting: bool = True,
+    target_range: float = 200,
+) -> PipelineResult:
+    """
+    Process a short-axis image in its stored orientation to segment scores.
+
+    The stored orientation is accepted, so that the image is sampled directly.
+    This skips the rotation back to a transversal view, the reorientation and
+    the conversion into short-axis view, which are slow and blur the image.
+
+    Parameters
+    ----------
+    filename: str
+        a short-axis image (see `myoloom.util.is_short_axis`)
+    config, weighting:
+        see `process`
+    target_range: float
+        see `polar_map_image`
+
+    Returns
+    -------
+    PipelineResult
+        the center is the image center and the angles are
+        those of the stored orientation
+    """
+    sitk_img = load_image(filename)
+    angles = short_axis_angles(sitk_img.GetDirection())
+
+    target_shape = (round(target_range / sitk_img.GetSpacing()[0]),) * 3
+    sa_image = pad_crop(sitk_img, target_shape=target_shape)
+    img = sitk.GetArrayFromImage(sa_image)
+
+    config = _sampling_config(img, config)
+
+    radial_activities = compute_radial_activities(
+        img,
+        **grid_params(**config),
+        weighting=weighting,
+        spacing=sa_image.GetSpacing()[0],
+    )
+
+    return PipelineResult(
+        filename=filename,
+        center=tuple(s / 2.0 for s in sitk_img.GetSize()),
+        angles=(angles[0], 0.0, angles[1]),
+        config=config,
+        radial_activities=radial_activities,
+        segment_scores=compute_segment_scores(radial_activities),
+    )
+
+
+@dataclass
+class GatedPipelineResult:
+    """
+    Result of processing a gated study with the pipeline.
+
+    Attributes
+    ----------
+    summed: PipelineResult
+        result of the sum of all gates, which determines the reorientation
+        and the sampling parameters of all gates
+    gates: list of PipelineResult
+        result per gate
+    """
+
+    summed: PipelineResult
+    gates: List[PipelineResult]
+
+
+def process_gated(
+    filename: str,
+    center: Optional[Tuple[float, float, float]] = None,
+    angles: Optional[Tuple[float, float, float]] = None,
+    config: Optional[dict[str, int]] = None,
+    weighting: bool = True,
+    max_workers: Optional[int] = None,
+) -> GatedPipelineResult:
+    """
+    Process all gates of a gated study (see `myoloom.gated`) to segment scores.
+
+    The reorientation and the sampling parameters are estimated once on the
+    sum of all gates and applied to every gate, so that the polar maps of
+    the gates are comparable and share a cached sampling grid.
+    Gates are streamed from the file and processed by a thread pool. At most
+    `max_workers` gates are in memory, which requires a first pass over the
+    file to compute the sum if parameters have to be estimated.
+
+    Parameters
+    ----------
+    filename: str
+    center, angles, config, weighting:
+        see `process`
+    max_workers: int, optional
+        number of gates processed in parallel - defaults to the number of CPUs
+
+    Returns
+    -------
+    GatedPipelineResult
+    """
+    header = read_header(filename)
+    max_workers = os.cpu_count() if max_workers is None else max_workers
+
+    summed = None
+    if center is None or angles is None or config is None:
+        sitk_img, short_axis_angles = load_summed_image(filename)
+        summed = process_image(
+            filename,
+            sitk_img,
+            center=center,
+            angles=angles,
+            config=config,
+            weighting=weighting,
+            short_axis_angles=short_axis_angles,
+        )
+        center, angles, config = summed.center, summed.angles, summed.config
+
+    gates = [None] * header.n_gates
+    sum_img = None
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gate") as executor:
+        pending = {}
+        for gate, sitk_img, _ in iter_gates(header):
+            if summed is None:
+                sum_img = sitk_img if sum_img is None else sum_img + sitk_img
+
+            # bound the number of gates in memory
+            if len(pending) >= max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    gates[pending.pop(future)] = future.result()
+
+            future = executor.submit(
+                process_image, filename, sitk_img, center, angles, config, weighting
+            )
+            pending[future] = gate
+
+        for future, gate in pending.items():
+            gates[gate] = future.result()
+
+    if summed is None:
+        summed = process_image(filename, sum_img, center, angles, config, weighting)
+
+    return GatedPipelineResult(summed=summed, gates=gates)
+
+
+@dataclass
+class PairedPipelineResult:
+    """
+    Result of processing the stress and rest acquisitions of a study.
+
+    Attributes
+    ----------
+    stress: PipelineResult
+    rest: PipelineResult
+        result of the rest image registered to the stress image
+    transform: tuple of float
+        parameters of the rigid transform registering rest to stress
+        (see `sitk.Euler3DTransform.GetParameters`)
+    reversibility: NDArray
+        difference of the radial activities (rest - stress) - positive values
+        indicate a reversible perfusion defect
+    segment_differences: list of int
+        difference of the segment scores (rest - stress) of each segment in `SEGMENTS`
+    """
+
+    stress: PipelineResult
+    rest: PipelineResult
+    transform: Tuple[float, ...]
+    reversibility: NDArray = field(repr=False)
+    segment_differences: List[int]
+
+
+def process_paired(
+    stress_filename: str,
+    rest_filename: str,
+    center: Optional[Tuple[float, float, float]] = None,
+    angles: Optional[Tuple[float, float, float]] = None,
+    config: Optional[dict[str, int]] = None,
+    weighting: bool = True,
+) -> PairedPipelineResult:
+    """
+    Process the stress and rest acquisitions of a study.
+
+    The rest image is registered to the stress image once. Afterwards, the
+    reorientation and the sampling parameters are estimated on the stress image
+    only and both images are sampled with the same polar grid in a single pass.
+    Thus, the polar maps are directly comparable.
+
+    Parameters
+    ----------
+    stress_filename: str
+    rest_filename: str
+    center, angles, config, weighting:
+        see `process` - they apply to the stress image
+
+    Returns
+    -------
+    PairedPipelineResult
+    """
+    stress = prepare_image(stress_filename)
+    rest = prepare_image(rest_filename)
+
+    transform = register_rigid(stress.sitk_img, rest.sitk_img)
+    rest_img = resample_linear(rest.sitk_img, transform, reference=stress.sitk_img)
+
+    center, angles = complete_reorientation(stress.sitk_img, center, angles, stress.angles)
+    sa_images = [
+        polar_map_image(reorient(sitk_img, center=center, angles=angles))
+        for sitk_img in (stress.sitk_img, rest_img)
+    ]
+    imgs = [sitk.GetArrayFromImage(sa_image) for sa_image in sa_images]
+    config = _sampling_config(imgs[0], config)
+
+    radial_activities = compute_radial_activities_batch(
+        imgs,
+        **grid_params(**config),
+        weighting=weighting,
+        spacing=sa_images[0].GetSpacing()[0],
+    )
+
+    stress_result, rest_result = (
+        PipelineResult(
+            filename=filename,
+            center=tuple(center),
+            angles=tuple(angles),
+            config=config,
+            radial_activities=activities,
+            segment_scores=compute_segment_scores(activities),
+        )
+        for filename, activities in zip((stress_filename, rest_filename), radial_activities)
+    )
+
+    return PairedPipelineResult(
+        stress=stress_result,
+        rest=rest_result,
+        transform=transform.GetParameters(),
+        reversibility=rest_result.radial_activities - stress_result.radial_activities,
+        segment_differences=[
+            rest_score - stress_score
+            for stress_score, rest_score in zip(
+                stress_result.segment_scores, rest_result.segment_scores
+            )
+        ],
+    )
+
+
+def relative_names(filenames: Sequence[str], directory: Optional[str] = None) -> Dict[str, str]:
+    """
+    Name files by their path relative to a directory, so that files of
+    the same name in different directories can be told apart in outputs.
+
+    Parameters
+    ----------
+    filenames: sequence of str
+    directory: str, optional
+        defaults to the common directory of the files
+
+    Returns
+    -------
+    dict of str and str
+        the name of each file
+    """
+    if len(filenames) == 0:
+        return {}
+
+    paths = [os.path.abspath(filename) for filename in filenames]
+    if directory is None:
+        directory = os.path.commonpath([os.path.dirname(path) for path in paths])
+    return {filename: os.path.relpath(path, directory) for filename, path in zip(filenames, paths)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Automatically compute polar maps and segment scores of MPI SPECT images.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "files", type=str, nargs="+", help="SPECT image files or directories (see --catalog)"
+    )
+    parser.add_argument(
+        "--output", type=str, default="segment_scores.csv", help="output csv file"
+    )
+    parser.add_argument(
+        "--catalog",
+        type=str,
+        help="catalog (SQLite file) used to select the DICOM series of directories recursively (see myoloom.catalog)",
+    )
+    add_filter_arguments(parser)
+    parser.add_argument(
+        "--no_weighting", action="store_true", help="disable weighting during sampling"
+    )
+    parser.add_argument(
+        "--stored_orientation",
+        action="store_true",
+        help="sample short-axis images in their stored orientation without reorientation",
+    )
+    parser.add_argument(
+        "--paired",
+        action="store_true",
+        help="process the files as pairs of stress and rest acquisitions (stress1 rest1 stress2 rest2 ...)"
+        " - series of directories are paired by patient with --catalog",
+    )
+    parser.add_argument(
+        "--radial_activities",
+        type=str,
+        help="directory to store the radial activities of each study as .npy file",
+    )
+    parser.add_argument(
+        "--results",
+        type=str,
+        help="additionally write the results including radial activities to this Parquet file",
+    )
+    parser.add_argument(
+        "--normals",
+        type=str,
+        help="normal database (see myoloom.polar_map.normals) to compute summed scores",
+    )
+    parser.add_argument(
+        "--metrics", type=str, help="write latency metrics as JSON lines to this file"
+    )
+    args = parser.parse_args()
+
+    # outputs are named by the path of a file relative to the directory it is selected
+    # from or to the common directory of the files given explicitly
+    names = {}
+    if args.catalog is not None:
+        with Catalog(args.catalog) as catalog:
+            files = []
+            for filename in args.files:
+                if not os.path.isdir(filename):
+                    files.append(filename)
+                    continue
+                catalog.refresh(filename)
+                if args.paired:
+                    selected = [
+                        pair_filename
+                        for pair in catalog.pairs(filename, **query_filters(args))
+                        for pair_filename in pair
+                    ]
+                else:
+                    selected = catalog.filenames(filename, **query_filters(args))
+                names.update(relative_names(selected, filename))
+                files.extend(selected)
+        args.files = files
+    names.update(relative_names([filename for filename in args.files if filename not in names]))
+
+    if args.paired and len(args.files) % 2 != 0:
+        parser.error("--paired requires pairs of stress and rest files")
+
+    if args.metrics is not None:
+        METRICS.open(args.metrics)
+
+    if args.radial_activities is not None:
+        os.makedirs(args.radial_activities, exist_ok=True)
+    normals = NormalDatabase.load(args.normals) if args.normals is not None else None
+    writer = ResultsWriter(args.results) if args.results is not None else None
+
+    def row(result: PipelineResult, **columns) -> dict:
+        if args.radial_activities is not None:
+            # files of subdirectories are stored in the same subdirectories
+            name = os.path.splitext(names[result.filename])[0]
+            name = "_".join(map(str, [name, *columns.values()]))
+            npy_filename = os.path.join(args.radial_activities, f"{name}.npy")
+            os.makedirs(os.path.dirname(npy_filename), exist_ok=True)
+            np.save(npy_filename, result.radial_activities.astype(np.float32))
+
+        scores = {}
+        if normals is not None:
+            scores["summed_score"] = int(normals.summed_score(result.radial_activities))
+
+        if writer is not None:
+            writer.write(result, **columns, **scores)
+
+        return {
+            "filename": names[result.filename],
+            **columns,
+            "segment_scores": ";".join(map(str, result.segment_scores)),
+            **scores,
+            **dict(zip(["angle_x", "angle_y", "angle_z"], result.angles)),
+            **dict(zip(["center_idx_x", "center_idx_y", "center_idx_z"], result.center)),
+        }
+
+    rows = []
+    if args.paired:
+        pairs = zip(args.files[::2], args.files[1::2])
+        for stress_filename, rest_filename in pairs:
+            with timer("process_paired", filename=stress_filename):
+                result = process_paired(
+                    stress_filename, rest_filename, weighting=not args.no_weighting
+                )
+            print(f"{stress_filename}/{rest_filename}: {result.segment_differences}")
+
+            rows.append(row(result.stress, study="stress"))
+            rows.append(row(result.rest, study="rest"))
+            rows.append(
+                {
+                    "filename": names[rest_filename],
+                    "study": "difference",
+                    "segment_scores": ";".join(map(str, result.segment_differences)),
+                }
+            )
+    else:
+        for filename in args.files:
+            if args.stored_orientation and not is_gated(filename) and is_short_axis(filename):
+                with timer("process_short_axis", filename=filename):
+                    result = process_short_axis(filename, weighting=not args.no_weighting)
+                print(f"{filename}: {result.segment_scores}")
+                rows.append(row(result))
+                continue
+
+            if not is_gated(filename):
+                with timer("process", filename=filename):
+                    result = process(filename, weighting=not args.no_weighting)
+                print(f"{filename}: {result.segment_scores}")
+                rows.append(row(result))
+                continue
+
+            with timer("process_gated", filename=filename):
+                result = process_gated(filename, weighting=not args.no_weighting)
+            print(f"{filename}: {result.summed.segment_scores}")
+            rows.append(row(result.summed, gate="sum"))
+            for gate, gate_result in enumerate(result.gates):
+                print(f"{filename}[gate {gate}]: {gate_result.segment_scores}")
+                rows.append(row(gate_result, gate=gate))
+
+    with timer("export"):
+        pd.DataFrame(rows).to_csv(args.output, index=False)
+        if writer is not None:
+            writer.close()
+
+    METRICS.close()
@@ -25,8 +25,11 @@ from widget_state import (
     computed,
 )
 
+from ..localization import estimate_sampling_params
+from ..widget.scheduler import FrameScheduler
 from ..widget.slice_view import SITKData, SliceView, SliceViewState
 
+from .sampling import default_config, grid_params
 from .test import label_locations, LABELS_SA, LABELS_HLA, LABELS_VLA
 
 
@@ -87,12 +90,18 @@ class ConfigViewState(HigherOrderState):
         self.pos_line_lateral = IntState(0)
         self.pos_line_septal = IntState(0)
         self.weighting = BoolState(True)
+        # true while a line is dragged so that only a preview is computed
+        self.dragging = BoolState(False)
+        # true while the line positions of a frame are updated, so that they are applied together
+        self.updating = BoolState(False)
 
         self.pos_line_lateral_vla = self.pos_line_lateral.transform(
             self_to_other=lambda s: IntState(self.img_vla.value.GetSize()[0] - s.value),
             other_to_self=lambda s: IntState(self.img_vla.value.GetSize()[0] - s.value),
         )
 
+        # fingerprint of the short-axis image the sampling parameters are initialized for
+        self._config_fingerprint = None
         self.img_sa.on_change(self.init_config, trigger=True)
 
     @computed
@@ -111,20 +120,31 @@ class ConfigViewState(HigherOrderState):
         img = sitk.GetImageFromArray(img)
         return SITKData(img)
 
-    def init_config(self, sitk_hla: SITKData):
-        # TODO: we should try to estimate these values
-        self.center_z.value = sitk_hla.value.GetSize()[0] // 2
-        self.pos_line_lateral.value = self.center_z.value + round(
-            2.0 * self.center_z.value / 3.0
-        )
-        self.pos_line_septal.value = self.pos_line_lateral.value
+    def init_config(self, img_sa: SITKData):
+        config = estimate_sampling_params(sitk.GetArrayFromImage(img_sa.value))
+        if config is None:
+            config = default_config(img_sa.value.GetSize()[0])
 
-    def sampling_params(self):
-        center_z = self.center_z.value
-        n_lateral = self.pos_line_lateral.value - center_z + 1
-        n_septal = self.pos_line_septal.value - center_z + 1
+        with self:
+            self.center_z.value = config["center_z"]
+            self.pos_line_lateral.value = config["pos_line_lateral"]
+            self.pos_line_septal.value = config["pos_line_septal"]
+        self._config_fingerprint = img_sa.fingerprint
+
+    def is_initialized(self) -> bool:
+        """
+        Test if the sampling parameters are initialized for the current short-axis image.
 
-        return {"center_z": center_z, "n_lateral": n_lateral, "n_septal": n_septal}
+        This is not the case while they are estimated for a new image (see `init_config`).
+        """
+        return self._config_fingerprint == self.img_sa.fingerprint
+
+    def sampling_params(self):
+        return grid_params(
+            center_z=self.center_z.value,
+            pos_line_septal=self.pos_line_septal.value,
+            pos_line_lateral=self.pos_line_lateral.value,
+        )
 
 
 class ConfigView(ttk.Frame):
@@ -133,6 +153,8 @@ class ConfigView(ttk.Frame):
         super().__init__(parent)
 
         self.state = state
+        # line positions are updated at most once per frame while dragging
+        self.scheduler = FrameScheduler(self, flushing=self.state.updating)
 
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=5, minsize=256)
@@ -196,6 +218,7 @@ class ConfigView(ttk.Frame):
             ),
         )
         self.line_center_z.tag_bind("<B1-Motion>", self.on_motion_line_center)
+        self.line_center_z.tag_bind("<ButtonRelease-1>", self.on_release_line)
         self.overlay_items.append(self.line_center_z)
 
         self.line_septal = Line(
@@ -233,6 +256,8 @@ class ConfigView(ttk.Frame):
 
         self.line_septal.tag_bind("<B1-Motion>", self.on_motion_line_septal)
         self.line_lateral.tag_bind("<B1-Motion>", self.on_motion_line_lateral)
+        self.line_septal.tag_bind("<ButtonRelease-1>", self.on_release_line)
+        self.line_lateral.tag_bind("<ButtonRelease-1>", self.on_release_line)
 
         self.line_vla = Line(
             self.vla.canvas,
@@ -249,6 +274,7 @@ class ConfigView(ttk.Frame):
             ),
         )
         self.line_vla.tag_bind("<B1-Motion>", self.on_motion_line_vla)
+        self.line_vla.tag_bind("<ButtonRelease-1>", self.on_release_line)
         self.overlay_items.append(self.line_vla)
 
         text_offset_horizontal = 4
@@ -281,29 +307,48 @@ class ConfigView(ttk.Frame):
         self.overlay_items.append(self.text_pos_septal)
         self.overlay_items.append(self.text_pos_lateral)
 
+    def start_drag(self):
+        if not self.state.dragging.value:
+            self.state.dragging.value = True
+
+    def on_release_line(self, *_):
+        # apply the last position and trigger the full computation
+        self.scheduler.flush()
+        self.state.dragging.value = False
+
     def on_motion_line_vla(self, event, _):
         x = self.slice_view.image.to_image(event.x, event.y)[0]
         x = max(0, x)
-        self.state.pos_line_lateral_vla.set(x)
+        self.start_drag()
+        self.scheduler.schedule(
+            "pos_line_lateral", lambda: self.state.pos_line_lateral_vla.set(x)
+        )
 
     def on_motion_line_center(self, event, _):
         y = self.slice_view.image.to_image(event.x, event.y)[1]
         y = min(self.state.pos_line_septal.value - 1, y)
-        self.state.center_z.set(y)
+        self.start_drag()
+        self.scheduler.schedule("center_z", lambda: self.state.center_z.set(y))
 
     def on_motion_line_septal(self, event, _):
         y = self.slice_view.image.to_image(event.x, event.y)[1]
         y = max(self.state.center_z.value + 1, y)
-        self.state.pos_line_septal.set(y)
-
-        if self.state.pos_line_septal.value > self.state.pos_line_lateral.value:
-            self.state.pos_line_lateral.value = self.state.pos_line_septal.value
+        self.start_drag()
+        self.scheduler.schedule("pos_line", lambda: self.set_pos_line_septal(y))
 
     def on_motion_line_lateral(self, event, _):
         y = self.slice_view.image.to_image(event.x, event.y)[1]
         y = min(self.state.img_sa.value.GetSize()[2], y)
-        self.state.pos_line_lateral.set(y)
+        self.start_drag()
+        self.scheduler.schedule("pos_line", lambda: self.set_pos_line_lateral(y))
 
+    def set_pos_line_septal(self, y: int):
+        self.state.pos_line_septal.set(y)
+        if self.state.pos_line_septal.value > self.state.pos_line_lateral.value:
+            self.state.pos_line_lateral.value = self.state.pos_line_septal.value
+
+    def set_pos_line_lateral(self, y: int):
+        self.state.pos_line_lateral.set(y)
         if self.state.pos_line_lateral.value < self.state.pos_line_septal.value:
             self.state.pos_line_septal.value = self.state.pos_line_lateral.value
 
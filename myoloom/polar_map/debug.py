@@ -8,7 +8,6 @@ TODO: Display radial activities
 """
 
 import os
-import time
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk
@@ -38,6 +37,7 @@ from widget_state import (
     StringState,
 )
 
+from ..metrics import timer
 from ..util import load_image, square_pad, get_empty_image, normalize_image
 from ..widget.scale import Scale, ScaleState
 from ..widget.slice_view import SITKData, SliceView, SliceViewState
@@ -134,23 +134,19 @@ class AppState(HigherOrderState):
     ) -> ObjectState:
         img = sitk.GetArrayFromImage(self.sitk_sa.value)
 
-        # since = time.time()
-        grid = polar_grid(
-            img,
-            radii.value,
-            azimuth_angles.value,
-            polar_angles.value,
-            **config_view_state.sampling_params(),
-        )
-        polar_rep = scipy.ndimage.map_coordinates(img, grid, order=3)
+        with timer("sampling"):
+            grid = polar_grid(
+                img,
+                radii.value,
+                azimuth_angles.value,
+                polar_angles.value,
+                **config_view_state.sampling_params(),
+            )
+            polar_rep = scipy.ndimage.map_coordinates(img, grid, order=3)
 
         if enable_weighting.value:
             pixel_size_mm = self.sitk_sa.value.GetSpacing()[0] * self.radii_step.value
             polar_rep = weight_polar_rep(polar_rep, pixel_size_mm=pixel_size_mm, sigma=sigma.value)
-
-        # print(
-        #     f"Sampling with grid {grid[0].shape} took {1000*(time.time() - since):.3f}ms"
-        # )
         return ObjectState(polar_rep)
 
     @computed
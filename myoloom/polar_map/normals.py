@@ -0,0 +1,259 @@
+"""
+Normal database of polar maps.
+
+A normal database contains the mean and standard deviation of the radial
+activities of studies without perfusion defects, per pixel of the polar map
+and per segment in `SEGMENTS`. New studies are scored against it with
+z-scores and a summed score.
+
+The database is built by streaming radial activities (e.g. `.npy` files
+written by `python -m myoloom.pipeline --radial_activities <directory>`)
+so that thousands of studies do not have to fit into memory:
+
+    python -m myoloom.polar_map.normals build normals/*.npy --output normals.npz
+    python -m myoloom.polar_map.normals score study.npy --database normals.npz
+"""
+
+import argparse
+from dataclasses import dataclass
+import os
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .sampling import CANONICAL_SHAPE, to_canonical
+from .segment import SEGMENTS, segment_means
+
+# a segment scores a point for each threshold its z-score falls below (0-4 points)
+SCORE_THRESHOLDS = (-2.0, -3.0, -4.0, -5.0)
+
+
+class RunningStatistics:
+    """
+    Running mean and variance of arrays using Welford's algorithm.
+
+    Batches are combined with the parallel variant of the algorithm (Chan et al.),
+    which is numerically stable and requires a single pass over the data.
+
+    Parameters
+    ----------
+    shape: tuple of int
+        shape of a sample
+    """
+
+    def __init__(self, shape: Tuple[int, ...]):
+        self.count = 0
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self._m2 = np.zeros(shape, dtype=np.float64)
+
+    def update(self, batch: NDArray) -> None:
+        """
+        Add a batch of samples of shape (n, *shape).
+        """
+        n = batch.shape[0]
+        if n == 0:
+            return
+
+        batch_mean = batch.mean(axis=0, dtype=np.float64)
+        batch_m2 = ((batch - batch_mean) ** 2).sum(axis=0)
+
+        count = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * (n / count)
+        self._m2 += batch_m2 + delta**2 * (self.count * n / count)
+        self.count = count
+
+    @property
+    def std(self) -> NDArray:
+        """
+        Sample standard deviation.
+        """
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return np.sqrt(self._m2 / (self.count - 1))
+
+
+@dataclass
+class NormalDatabase:
+    """
+    Reference statistics of normal studies.
+
+    Attributes
+    ----------
+    count: int
+        number of studies
+    mean: NDArray
+        mean radial activities of shape `CANONICAL_SHAPE`
+    std: NDArray
+        standard deviation of the radial activities of shape `CANONICAL_SHAPE`
+    segment_mean: NDArray
+        mean activity of each segment in `SEGMENTS`
+    segment_std: NDArray
+        standard deviation of the activity of each segment in `SEGMENTS`
+    """
+
+    count: int
+    mean: NDArray
+    std: NDArray
+    segment_mean: NDArray
+    segment_std: NDArray
+
+    def save(self, filename: str) -> None:
+        """
+        Store the database as a compressed npz file in single precision.
+        """
+        np.savez_compressed(
+            filename,
+            count=self.count,
+            mean=self.mean.astype(np.float32),
+            std=self.std.astype(np.float32),
+            segment_mean=self.segment_mean.astype(np.float32),
+            segment_std=self.segment_std.astype(np.float32),
+        )
+
+    @classmethod
+    def load(cls, filename: str) -> "NormalDatabase":
+        with np.load(filename) as data:
+            return cls(
+                count=int(data["count"]),
+                mean=data["mean"],
+                std=data["std"],
+                segment_mean=data["segment_mean"],
+                segment_std=data["segment_std"],
+            )
+
+    def z_scores(self, radial_activities: NDArray, min_std: float = 1e-3) -> NDArray:
+        """
+        Compute z-score polar maps.
+
+        Parameters
+        ----------
+        radial_activities: NDArray
+            radial activities of a study or a stack of studies of shape (..., *CANONICAL_SHAPE)
+        min_std: float
+            lower bound of the standard deviation to avoid divisions by zero
+
+        Returns
+        -------
+        NDArray
+            negative values indicate a reduced activity compared to normal studies
+        """
+        return (radial_activities - self.mean) / np.maximum(self.std, min_std)
+
+    def segment_z_scores(self, radial_activities: NDArray, min_std: float = 1e-3) -> NDArray:
+        """
+        Compute the z-score of each segment in `SEGMENTS`.
+
+        Returns
+        -------
+        NDArray
+            of shape (..., len(SEGMENTS))
+        """
+        means = segment_means(radial_activities)
+        return (means - self.segment_mean) / np.maximum(self.segment_std, min_std)
+
+    def summed_score(self, radial_activities: NDArray) -> NDArray:
+        """
+        Compute the summed score of studies, e.g. the summed stress score
+        of stress acquisitions.
+
+        Each segment scores 0 to 4 points depending on its
+        z-score (see `SCORE_THRESHOLDS`) and the points are summed.
+
+        Returns
+        -------
+        NDArray
+            of shape (...) as integers
+        """
+        z_scores = self.segment_z_scores(radial_activities)
+        points = (z_scores[..., np.newaxis] < np.array(SCORE_THRESHOLDS)).sum(axis=-1)
+        return points.sum(axis=-1)
+
+
+def build_normal_database(
+    radial_activities: Iterable[NDArray], batch_size: int = 256
+) -> NormalDatabase:
+    """
+    Build a normal database by streaming the radial activities of normal studies.
+
+    At most `batch_size` studies are held in memory at once.
+
+    Parameters
+    ----------
+    radial_activities: iterable of NDArray
+        radial activities of each study - they are resampled to `CANONICAL_SHAPE`
+        if required (see `to_canonical`)
+    batch_size: int
+
+    Returns
+    -------
+    NormalDatabase
+    """
+    pixels = RunningStatistics(CANONICAL_SHAPE)
+    segments = RunningStatistics((len(SEGMENTS),))
+
+    batch = np.empty((batch_size, *CANONICAL_SHAPE), dtype=np.float32)
+
+    def update(n: int):
+        pixels.update(batch[:n])
+        segments.update(segment_means(batch[:n]))
+
+    n = 0
+    for activities in radial_activities:
+        batch[n] = to_canonical(activities)
+        n += 1
+        if n == batch_size:
+            update(n)
+            n = 0
+    update(n)
+
+    return NormalDatabase(
+        count=pixels.count,
+        mean=pixels.mean,
+        std=pixels.std,
+        segment_mean=segments.mean,
+        segment_std=segments.std,
+    )
+
+
+def load_radial_activities(filenames: Iterable[str]) -> Iterator[NDArray]:
+    """
+    Load radial activities stored as `.npy` files one after another.
+    """
+    for filename in filenames:
+        yield np.load(filename, mmap_mode="r")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build a normal database of polar maps and score studies against it.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_build = subparsers.add_parser("build", help="build a normal database")
+    parser_build.add_argument("files", type=str, nargs="+", help="radial activities (.npy)")
+    parser_build.add_argument("--output", type=str, default="normals.npz")
+    parser_build.add_argument("--batch_size", type=int, default=256)
+
+    parser_score = subparsers.add_parser("score", help="score studies against a database")
+    parser_score.add_argument("files", type=str, nargs="+", help="radial activities (.npy)")
+    parser_score.add_argument("--database", type=str, default="normals.npz")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        database = build_normal_database(
+            load_radial_activities(args.files), batch_size=args.batch_size
+        )
+        database.save(args.output)
+        print(f"Built a normal database of {database.count} studies: {args.output}")
+    else:
+        database = NormalDatabase.load(args.database)
+        for filename, activities in zip(args.files, load_radial_activities(args.files)):
+            activities = to_canonical(activities)
+            z_scores = np.round(database.segment_z_scores(activities), 1)
+            print(
+                f"{os.path.basename(filename)}: summed score {database.summed_score(activities)}"
+                f", segment z-scores {z_scores.tolist()}"
+            )
@@ -1,13 +1,10 @@
 import io
-import math
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk
 
 import cv2 as cv
 import numpy as np
-from numpy.typing import NDArray
-import scipy
 
 from reacTk.state import PointState
 from reacTk.state.util import to_tk_var
@@ -26,49 +23,15 @@ from widget_state import (
 )
 
 from ..colormap import colormaps
-
-from .sampling import cartesian_grid
-from .segment import SEGMENTS, segment_vertices, segment_center, segment_mask
-
-
-def draw_segments_grid(polar_map: NDArray) -> NDArray:
-    """
-    Note: we use OpenCV to draw the lines instead of tk
-    because it supports anti aliasing which looks a lot better
-    """
-    cy, cx = np.array(polar_map.shape[:2]) // 2
-    for radius in np.array([0.25, 0.5, 0.75]) * polar_map.shape[0] // 2:
-        polar_map = cv.circle(
-            polar_map,
-            (cx, cy),
-            radius=round(radius),
-            color=(0, 0, 0),
-            thickness=1,
-            lineType=cv.LINE_AA,
-        )
-    # draw the outermost circle a pixel closer to cover
-    # aliasing artifacts
-    polar_map = cv.circle(
-        polar_map,
-        (cx, cy),
-        radius=polar_map.shape[0] // 2 - 1,
-        color=(0, 0, 0),
-        thickness=1,
-        lineType=cv.LINE_AA,
-    )
-
-    for segment in SEGMENTS[:-1]:
-        vertices = segment_vertices(segment, polar_map.shape[0] // 2)
-        polar_map = cv.line(
-            polar_map,
-            vertices[0],
-            vertices[1],
-            color=(0, 0, 0),
-            thickness=1,
-            lineType=cv.LINE_AA,
-        )
-
-    return polar_map
+from ..metrics import timer
+
+from .render import cached_renderer
+from .sampling import CANONICAL_SHAPE
+from .segment import (
+    SEGMENTS,
+    compute_segment_scores,
+    segment_center,
+)
 
 
 class PolarMapState(HigherOrderState):
@@ -95,50 +58,21 @@ class PolarMapState(HigherOrderState):
         draw_segment_scores: BoolState,
         colormap: StringState,
     ) -> ImageData:
-        grid = cartesian_grid(self.radial_activities.value, n_samples=n_samples.value)
-        image = scipy.ndimage.map_coordinates(
-            self.radial_activities.value, grid, order=3, mode="constant", cval=0.0
+        renderer = cached_renderer(
+            radial_activities.value.shape,
+            n_samples.value,
+            colormap.value,
+            draw_segment_scores.value,
         )
-
-        if image.max() == 0 or math.isnan(image.max()):
-            return ImageData(
-                np.zeros((n_samples.value, n_samples.value, 3), dtype=np.uint8)
-            )
-
-        image = image / image.max()
-        image = (255 * image).astype(np.uint8)
-        # apply colormap
-        image = colormaps[colormap.value][image]
-        # mask the polar map circle because some colormaps are not black at zero
-        mask = np.zeros(image.shape[:2], np.uint8)
-        mask = cv.circle(mask, (mask.shape[1] // 2, mask.shape[0] // 2), radius=mask.shape[0] // 2, color=255, thickness=-1)
-        image = cv.bitwise_and(image, image, mask=mask)
-        # Note: we should resize before drawing the segments grid, so that lines are sharp
-        image = cv.resize(image, (512, 512))
-
-
-        if draw_segment_scores.value:
-            image = draw_segments_grid(image)
-
-        # image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
-        return ImageData(image)
+        return ImageData(renderer.render(radial_activities.value))
 
     def compute_segment_scores(self, radial_activities: ImageData) -> None:
-        radial_activities = radial_activities.value
-
-        for segment, segment_score in zip(SEGMENTS, self.segment_scores):
-            mask = segment_mask(radial_activities, segment)
-            activity = radial_activities[mask]
-
-            if activity.max() == 0 or math.isnan(activity.max()):
-                score = 0
-            else:
-                score = round(100 * np.average(activity))
-
+        scores = compute_segment_scores(radial_activities.value)
+        for segment_score, score in zip(self.segment_scores, scores):
             segment_score.value = score
 
 
-polar_map_state = PolarMapState(np.zeros((32, 128)))
+polar_map_state = PolarMapState(np.zeros(CANONICAL_SHAPE, dtype=np.float32))
 
 
 class PolarMap(ttk.Frame):
@@ -220,15 +154,18 @@ class PolarMap(ttk.Frame):
         if necessary, because the font looks terrible of the image is retrieved from
         the canvas via `postscript`.
         """
-        img = self.state.image.value
-        img = cv.cvtColor(img, cv.COLOR_RGB2BGR)
+        img = self.state.image.value.copy()
         if self.state.draw_segment_scores.value:
-            for segment, segment_score in zip(SEGMENTS, self.state.segment_scores):
-                text_position = segment_center(segment, img.shape[0] // 2)
-                text_position = (text_position[0] - 20, text_position[1] + 10)
-                text = f"{segment_score.value}"
-                cv.putText(img, text, text_position, fontFace=cv.FONT_HERSHEY_SIMPLEX, lineType=cv.LINE_AA, fontScale=1.0, color=(255, 255, 255), thickness=2)
+            renderer = cached_renderer(
+                self.state.radial_activities.value.shape,
+                self.state.n_samples.value,
+                self.state.colormap.value,
+                True,
+            )
+            renderer.draw_scores(img, [s.value for s in self.state.segment_scores])
+        img = cv.cvtColor(img, cv.COLOR_RGB2BGR)
 
-        cv.imwrite(filename, img)
+        with timer("export"):
+            cv.imwrite(filename, img)
 
 
@@ -0,0 +1,356 @@
+"""
+Headless rendering of polar maps, e.g. for reports.
+
+A `PolarMapRenderer` precomputes everything which only depends on the shape
+of the radial activities and the size of the rendered images: the cartesian
+sampling map (see `cartesian_grid`), the mask of the polar map circle, the
+overlay of the segments grid and the layout of the segment scores. Rendering
+a polar map then only requires a remap, a colormap lookup, a resize and
+drawing the scores, so that many polar maps can be rendered quickly:
+
+    python -m myoloom.polar_map.render radial_activities/*.npy --output_dir reports --format png
+
+Rendered images are encoded and written by a thread pool (OpenCV releases the GIL),
+so that rendering and encoding overlap.
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import functools
+import os
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2 as cv
+import numpy as np
+from numpy.typing import NDArray
+
+from ..colormap import colormaps
+from ..metrics import timed
+from .sampling import CANONICAL_SHAPE, cartesian_grid, to_canonical
+from .segment import SEGMENTS, segment_center, segment_means, segment_vertices
+
+FORMATS = ("png", "tiff", "jpg")
+
+
+def draw_segments_grid(polar_map: NDArray) -> NDArray:
+    """
+    Note: we use OpenCV to draw the lines instead of tk
+    because it supports anti aliasing which looks a lot better
+    """
+    cy, cx = np.array(polar_map.shape[:2]) // 2
+    for radius in np.array([0.25, 0.5, 0.75]) * polar_map.shape[0] // 2:
+        polar_map = cv.circle(
+            polar_map,
+            (cx, cy),
+            radius=round(radius),
+            color=(0, 0, 0),
+            thickness=1,
+            lineType=cv.LINE_AA,
+        )
+    # draw the outermost circle a pixel closer to cover
+    # aliasing artifacts
+    polar_map = cv.circle(
+        polar_map,
+        (cx, cy),
+        radius=polar_map.shape[0] // 2 - 1,
+        color=(0, 0, 0),
+        thickness=1,
+        lineType=cv.LINE_AA,
+    )
+
+    for segment in SEGMENTS[:-1]:
+        vertices = segment_vertices(segment, polar_map.shape[0] // 2)
+        polar_map = cv.line(
+            polar_map,
+            vertices[0],
+            vertices[1],
+            color=(0, 0, 0),
+            thickness=1,
+            lineType=cv.LINE_AA,
+        )
+
+    return polar_map
+
+
+def segment_scores(radial_activities: NDArray) -> NDArray:
+    """
+    Compute the score of each segment in `SEGMENTS` like `compute_segment_scores`
+    but vectorized for a stack of radial activities.
+
+    Returns
+    -------
+    NDArray
+        of shape (..., len(SEGMENTS)) as integers
+    """
+    means = np.nan_to_num(segment_means(radial_activities))
+    return np.round(100 * means).astype(int)
+
+
+class PolarMapRenderer:
+    """
+    Render radial activities as polar map images.
+
+    Parameters
+    ----------
+    shape: tuple of int
+        shape of the radial activities
+    n_samples: int
+        number of samples in x and y direction of the polar map
+    size: int
+        size of the rendered image - the polar map is resized
+        before drawing the segments grid so that lines are sharp
+    colormap: str
+        name of a colormap in `myoloom.colormap.colormaps`
+    draw_segments: bool
+        draw the segments grid
+    font_scale: float, optional
+        font scale of segment scores - defaults to a scale relative to `size`
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, int] = CANONICAL_SHAPE,
+        n_samples: int = 256,
+        size: int = 512,
+        colormap: str = "prism",
+        draw_segments: bool = True,
+        font_scale: Optional[float] = None,
+    ):
+        self.shape = shape
+        self.n_samples = n_samples
+        self.size = size
+
+        grid_y, grid_x = cartesian_grid(np.empty(shape), n_samples=n_samples)
+        # fixed-point maps are faster to remap than floating-point maps
+        self._map1, self._map2 = cv.convertMaps(
+            grid_x.astype(np.float32), grid_y.astype(np.float32), cv.CV_16SC2
+        )
+
+        # the colormap is applied with cv.LUT which requires a table of shape (256, 1, 3)
+        self._lut = np.ascontiguousarray(colormaps[colormap][:, np.newaxis])
+
+        # mask the polar map circle because some colormaps are not black at zero
+        mask = np.zeros((n_samples, n_samples), np.uint8)
+        mask = cv.circle(
+            mask, (n_samples // 2, n_samples // 2), radius=n_samples // 2, color=255, thickness=-1
+        )
+        self._mask = mask
+
+        # the segments grid is drawn once on a white image, which yields the
+        # factor by which each pixel is darkened by the anti-aliased lines
+        self._overlay = None
+        if draw_segments:
+            self._overlay = draw_segments_grid(np.full((size, size, 3), 255, dtype=np.uint8))
+
+        self.font_scale = size / 512 if font_scale is None else font_scale
+        self._thickness = max(1, round(2 * self.font_scale))
+        self._centers = [segment_center(segment, size // 2) for segment in SEGMENTS]
+        self._text_origins: Dict[Tuple[int, str], Tuple[int, int]] = {}
+
+    def colorize(self, radial_activities: NDArray) -> NDArray:
+        """
+        Render radial activities as a colored polar map without annotations.
+
+        Returns
+        -------
+        NDArray
+            RGB image of shape (n_samples, n_samples, 3)
+        """
+        image = cv.remap(
+            np.asarray(radial_activities, dtype=np.float32),
+            self._map1,
+            self._map2,
+            cv.INTER_CUBIC,
+            # the outermost ring is extended to the circle border, which is cut by the mask
+            borderMode=cv.BORDER_REPLICATE,
+        )
+
+        _max = image.max()
+        if _max <= 0 or np.isnan(_max):
+            return np.zeros((self.n_samples, self.n_samples, 3), dtype=np.uint8)
+
+        image = cv.convertScaleAbs(image, alpha=255.0 / _max)
+        image = cv.LUT(cv.merge((image, image, image)), self._lut)
+        return cv.bitwise_and(image, image, mask=self._mask)
+
+    def _text_origin(self, index: int, text: str) -> Tuple[int, int]:
+        key = (index, text)
+        if key not in self._text_origins:
+            (width, height), _ = cv.getTextSize(
+                text, cv.FONT_HERSHEY_SIMPLEX, self.font_scale, self._thickness
+            )
+            x, y = self._centers[index]
+            self._text_origins[key] = (x - width // 2, y + height // 2)
+        return self._text_origins[key]
+
+    def draw_scores(self, image: NDArray, scores: Sequence[int]) -> NDArray:
+        """
+        Draw segment scores centered in their segment in-place.
+
+        Parameters
+        ----------
+        image: NDArray
+            rendered image of shape (size, size, 3)
+        scores: sequence of int
+            a score per segment in `SEGMENTS`
+        """
+        for index, score in enumerate(scores):
+            text = str(score)
+            cv.putText(
+                image,
+                text,
+                self._text_origin(index, text),
+                fontFace=cv.FONT_HERSHEY_SIMPLEX,
+                fontScale=self.font_scale,
+                color=(255, 255, 255),
+                thickness=self._thickness,
+                lineType=cv.LINE_AA,
+            )
+        return image
+
+    @timed("polar_map_render")
+    def render(
+        self, radial_activities: NDArray, scores: Optional[Sequence[int]] = None
+    ) -> NDArray:
+        """
+        Render a polar map.
+
+        Parameters
+        ----------
+        radial_activities: NDArray
+            of shape `shape`
+        scores: sequence of int, optional
+            segment scores drawn into the polar map - they are not drawn if None
+
+        Returns
+        -------
+        NDArray
+            RGB image of shape (size, size, 3)
+        """
+        image = self.colorize(radial_activities)
+        if self.size != self.n_samples:
+            image = cv.resize(image, (self.size, self.size))
+        if self._overlay is not None:
+            image = cv.multiply(image, self._overlay, scale=1 / 255)
+        if scores is not None:
+            image = self.draw_scores(image, scores)
+        return image
+
+
+@functools.lru_cache(maxsize=4)
+def cached_renderer(
+    shape: Tuple[int, int], n_samples: int, colormap: str, draw_segments: bool
+) -> PolarMapRenderer:
+    """
+    Create a renderer which is shared by all polar maps with the same
+    parameters, e.g. while the radial activities of the GUI change.
+    """
+    return PolarMapRenderer(
+        shape, n_samples=n_samples, colormap=colormap, draw_segments=draw_segments
+    )
+
+
+def write_image(filename: str, image: NDArray) -> None:
+    """
+    Write an RGB image, where the format is derived from the file extension.
+    """
+    if not cv.imwrite(filename, cv.cvtColor(image, cv.COLOR_RGB2BGR)):
+        raise IOError(f"Could not write image {filename}")
+
+
+def render_polar_maps(
+    radial_activities: Iterable[NDArray],
+    filenames: Iterable[str],
+    scores: Optional[Iterable[Sequence[int]]] = None,
+    renderer: Optional[PolarMapRenderer] = None,
+    draw_scores: bool = True,
+    max_workers: Optional[int] = None,
+) -> List[str]:
+    """
+    Render many polar maps and write them as images.
+
+    The polar maps are rendered one after another and encoded by a thread pool.
+    At most two images per thread wait for their encoding so that
+    the memory stays bounded for arbitrarily many polar maps.
+
+    Parameters
+    ----------
+    radial_activities: iterable of NDArray
+        radial activities of each study - they are resampled to the shape
+        of the renderer if required (see `to_canonical`)
+    filenames: iterable of str
+        output filename of each study - the extension determines the format (see `FORMATS`)
+    scores: iterable of sequence of int, optional
+        segment scores of each study - computed from the radial activities if not provided
+    renderer: PolarMapRenderer, optional
+        defaults to a renderer for `CANONICAL_SHAPE`
+    draw_scores: bool
+        draw the segment scores
+    max_workers: int, optional
+        number of threads encoding images - defaults to the number of CPUs
+
+    Returns
+    -------
+    list of str
+        the written filenames
+    """
+    renderer = PolarMapRenderer() if renderer is None else renderer
+    max_workers = os.cpu_count() if max_workers is None else max_workers
+    scores = iter(scores) if scores is not None else None
+
+    written = []
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for activities, filename in zip(radial_activities, filenames):
+            activities = to_canonical(activities, renderer.shape)
+
+            _scores = None
+            if draw_scores:
+                _scores = next(scores) if scores is not None else segment_scores(activities)
+
+            image = renderer.render(activities, _scores)
+
+            if len(pending) >= 2 * max_workers:
+                pending.popleft().result()
+            pending.append(executor.submit(write_image, filename, image))
+            written.append(filename)
+
+        for future in pending:
+            future.result()
+    return written
+
+
+if __name__ == "__main__":
+    from .normals import load_radial_activities
+
+    parser = argparse.ArgumentParser(
+        description="Render polar maps of radial activities (.npy) as images.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("files", type=str, nargs="+", help="radial activities (.npy)")
+    parser.add_argument("--output_dir", type=str, default="polar_maps")
+    parser.add_argument("--format", type=str, choices=FORMATS, default="png")
+    parser.add_argument("--size", type=int, default=512, help="size of the images")
+    parser.add_argument("--colormap", type=str, choices=list(colormaps.keys()), default="prism")
+    parser.add_argument("--no_segments", action="store_true", help="do not draw the segments grid")
+    parser.add_argument("--no_scores", action="store_true", help="do not draw the segment scores")
+    parser.add_argument("--max_workers", type=int, help="number of threads encoding images")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    filenames = [
+        os.path.join(args.output_dir, f"{os.path.splitext(os.path.basename(f))[0]}.{args.format}")
+        for f in args.files
+    ]
+    renderer = PolarMapRenderer(
+        size=args.size, colormap=args.colormap, draw_segments=not args.no_segments
+    )
+    written = render_polar_maps(
+        load_radial_activities(args.files),
+        filenames,
+        renderer=renderer,
+        draw_scores=not args.no_scores,
+        max_workers=args.max_workers,
+    )
+    print(f"Rendered {len(written)} polar maps to {args.output_dir}")
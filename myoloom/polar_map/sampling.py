@@ -1,5 +1,53 @@
+import functools
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
 import numpy as np
 from numpy.typing import NDArray
+import scipy
+
+from ..metrics import timed
+from .util import weight_polar_rep
+
+# sampling angles used to compute polar maps
+AZIMUTH_ANGLES = np.deg2rad(np.arange(0, 360, 1))
+POLAR_ANGLES = np.deg2rad(np.arange(0, 90, (90 / 10) - 0.001))
+
+# shape (rings, azimuths) of radial activities independent of the image and the
+# sampling resolution - the first quarter of the rings is the apex
+CANONICAL_SHAPE = (64, 360)
+
+# resolutions (radial step, azimuth step in degrees) of progressive sampling
+# the coarse resolution is fast enough for interactive feedback
+COARSE_RESOLUTION = (1.0, 6.0)
+FULL_RESOLUTION = (0.2, 1.0)
+
+
+def default_config(n_slices: int) -> dict[str, int]:
+    """
+    Default position of the apex model and the basal planes
+    for a short-axis image with `n_slices` slices.
+    """
+    center_z = n_slices // 2
+    pos_line_lateral = center_z + round(2.0 * center_z / 3.0)
+    return {
+        "center_z": center_z,
+        "pos_line_septal": pos_line_lateral,
+        "pos_line_lateral": pos_line_lateral,
+    }
+
+
+def grid_params(
+    center_z: int, pos_line_septal: int, pos_line_lateral: int
+) -> dict[str, int]:
+    """
+    Convert the position of the apex model and the basal planes into
+    parameters of `polar_grid`.
+    """
+    return {
+        "center_z": center_z,
+        "n_lateral": pos_line_lateral - center_z + 1,
+        "n_septal": pos_line_septal - center_z + 1,
+    }
 
 
 def polar_grid(
@@ -142,3 +190,426 @@ def cartesian_grid(
     grid_x = max_angle * angles / (2.0 * np.pi)  # normalize to input image range
 
     return (grid_y, grid_x)
+
+
+@functools.lru_cache(maxsize=4)
+def cached_polar_grid(
+    shape: Tuple[int, int, int],
+    radii_step: float = 0.2,
+    azimuth_step: float = 1.0,
+    center_z: int = None,
+    n_septal: int = None,
+    n_lateral: int = None,
+) -> tuple[NDArray, NDArray, NDArray]:
+    """
+    Create a polar sampling grid (see `polar_grid`) for images of a shape.
+
+    The grid only depends on the shape of an image and the sampling parameters.
+    Thus, it is cached so that images of the same shape, e.g. the gates of a
+    gated study, are sampled without recomputing the grid.
+    The returned arrays are read-only as they are shared.
+
+    Parameters
+    ----------
+    shape: tuple of int
+        shape of the image (in short-axis view)
+    radii_step: float
+        sampling step along the radius
+    azimuth_step: float
+        sampling step of the azimuth angles in degrees
+    center_z, n_septal, n_lateral: int
+        see `polar_grid`
+
+    Returns
+    -------
+    tuple of NDArray
+        z, y, x coordinates (see `polar_grid`)
+    """
+    radii = np.arange(0, shape[1] / 2, radii_step)
+    azimuth_angles = (
+        AZIMUTH_ANGLES
+        if azimuth_step == 1.0
+        else np.deg2rad(np.arange(0, 360, azimuth_step))
+    )
+
+    grid = polar_grid(
+        np.broadcast_to(0.0, shape),
+        radii,
+        azimuth_angles,
+        POLAR_ANGLES,
+        center_z=center_z,
+        n_septal=n_septal,
+        n_lateral=n_lateral,
+    )
+    for coordinates in grid:
+        coordinates.flags.writeable = False
+    return grid
+
+
+def spline_coefficients(image: NDArray) -> NDArray:
+    """
+    Compute the cubic spline coefficients of an image.
+
+    Sampling with `scipy.ndimage.map_coordinates(coefficients, grid, order=3, prefilter=False)`
+    is equivalent to sampling the image with `order=3`, but the prefilter
+    is computed only once if an image is sampled repeatedly.
+    """
+    return scipy.ndimage.spline_filter(image, order=3, output=np.float64, mode="constant")
+
+
+@timed("sampling")
+def sample_polar_rep(
+    image: NDArray,
+    center_z: int = None,
+    n_septal: int = None,
+    n_lateral: int = None,
+    radii_step: float = 0.2,
+    coefficients: Optional[NDArray] = None,
+    azimuth_step: float = 1.0,
+) -> NDArray:
+    """
+    Resample an image with a polar grid (see `polar_grid`).
+
+    Parameters
+    ----------
+    image: NDArray
+        the image (in short-axis view)
+    center_z, n_septal, n_lateral: int
+        see `polar_grid`
+    radii_step: float
+        sampling step along the radius
+    coefficients: NDArray, optional
+        spline coefficients of the image (see `spline_coefficients`)
+    azimuth_step: float
+        sampling step of the azimuth angles in degrees
+
+    Returns
+    -------
+    NDArray
+    """
+    grid = cached_polar_grid(
+        image.shape,
+        radii_step=radii_step,
+        azimuth_step=azimuth_step,
+        center_z=center_z,
+        n_septal=n_septal,
+        n_lateral=n_lateral,
+    )
+
+    if coefficients is None:
+        return scipy.ndimage.map_coordinates(image, grid, order=3)
+    return scipy.ndimage.map_coordinates(coefficients, grid, order=3, prefilter=False)
+
+
+@timed("sampling")
+def sample_polar_reps(
+    images: Sequence[NDArray],
+    center_z: int = None,
+    n_septal: int = None,
+    n_lateral: int = None,
+    radii_step: float = 0.2,
+    coefficients: Optional[Sequence[NDArray]] = None,
+    azimuth_step: float = 1.0,
+) -> List[NDArray]:
+    """
+    Resample images of the same shape with the same polar grid in a single pass.
+
+    The spline coefficients of the images are stacked along the z axis and the
+    grid is repeated with offsets along z, so that a single `map_coordinates`
+    call samples all images with the same result as sampling each image.
+
+    Parameters
+    ----------
+    images: sequence of NDArray
+        the images (in short-axis view) of the same shape
+    center_z, n_septal, n_lateral: int
+        see `polar_grid`
+    radii_step: float
+        sampling step along the radius
+    coefficients: sequence of NDArray, optional
+        spline coefficients of the images (see `spline_coefficients`)
+    azimuth_step: float
+        sampling step of the azimuth angles in degrees
+
+    Returns
+    -------
+    list of NDArray
+        the polar representation of each image (see `sample_polar_rep`)
+    """
+    shape = images[0].shape
+    if any(image.shape != shape for image in images):
+        raise ValueError("All images sampled in a single pass must have the same shape")
+
+    coefficients = (
+        [spline_coefficients(image) for image in images]
+        if coefficients is None
+        else coefficients
+    )
+
+    # `map_coordinates` extends the coefficients of a single image by mirroring
+    # them at its borders and samples outside of the image are zero - the stacked
+    # coefficients are padded by mirrored slices covering the support of the cubic
+    # spline, so that samples near the border do not read the adjacent image
+    pad = 2
+    stacked = np.concatenate(
+        [np.pad(c, ((pad, pad), (0, 0), (0, 0)), mode="reflect") for c in coefficients]
+    )
+    offset = shape[0] + 2 * pad
+
+    grid_z, grid_y, grid_x = cached_polar_grid(
+        shape,
+        radii_step=radii_step,
+        azimuth_step=azimuth_step,
+        center_z=center_z,
+        n_septal=n_septal,
+        n_lateral=n_lateral,
+    )
+    outside = np.logical_or(grid_z < 0, grid_z > shape[0] - 1)
+    # offsets are added in double precision, so that the positions within each image are kept
+    grid_z = grid_z.astype(np.float64)
+    grid = (
+        np.concatenate([grid_z + pad + i * offset for i in range(len(images))]),
+        np.concatenate([grid_y] * len(images)),
+        np.concatenate([grid_x] * len(images)),
+    )
+
+    polar_reps = scipy.ndimage.map_coordinates(stacked, grid, order=3, prefilter=False)
+    polar_reps = np.split(polar_reps, len(images))
+    for polar_rep in polar_reps:
+        polar_rep[outside] = 0.0
+    return polar_reps
+
+
+def to_canonical(
+    radial_activities: NDArray, shape: Tuple[int, int] = CANONICAL_SHAPE
+) -> NDArray[np.float32]:
+    """
+    Resample radial activities linearly to a fixed shape.
+
+    Rings are resampled between the first and the last ring. Azimuths are
+    sampled starting at 0° (see `radial_activities`), so that azimuth `j` of
+    the target is located at `j * n_azimuths / shape[1]` and wraps around,
+    e.g. a coarse result with 60 azimuths is interpolated between 354° and 0°.
+    The interpolation is computed in floating point because the fixed-point
+    maps of OpenCV shift values noticeably for coarse results.
+
+    Parameters
+    ----------
+    radial_activities: NDArray
+        radial activities of any shape (rings, azimuths)
+    shape: tuple of int
+        the target shape
+
+    Returns
+    -------
+    NDArray[np.float32]
+    """
+    radial_activities = radial_activities.astype(np.float32, copy=False)
+    if radial_activities.shape == tuple(shape):
+        return radial_activities
+
+    n_rings, n_azimuths = radial_activities.shape
+    rings = (np.arange(shape[0]) + 0.5) * (n_rings / shape[0]) - 0.5
+    rings = np.clip(rings, 0, n_rings - 1)
+    lower = np.floor(rings).astype(int)
+    upper = np.minimum(lower + 1, n_rings - 1)
+    weights = (rings - lower)[:, np.newaxis]
+    radial_activities = (1 - weights) * radial_activities[lower] + weights * radial_activities[upper]
+
+    azimuths = np.arange(shape[1]) * (n_azimuths / shape[1])
+    lower = np.floor(azimuths).astype(int)
+    upper = (lower + 1) % n_azimuths
+    weights = azimuths - lower
+    radial_activities = (1 - weights) * radial_activities[:, lower] + weights * radial_activities[:, upper]
+    return radial_activities.astype(np.float32)
+
+
+def stack_radial_activities(radial_activities: Iterable[NDArray]) -> NDArray[np.float32]:
+    """
+    Stack the radial activities of many studies into one contiguous array
+    of shape (n, *CANONICAL_SHAPE) for vectorized statistics.
+    """
+    radial_activities = list(radial_activities)
+    stack = np.empty((len(radial_activities), *CANONICAL_SHAPE), dtype=np.float32)
+    for i, activities in enumerate(radial_activities):
+        stack[i] = to_canonical(activities)
+    return stack
+
+
+def reduce_polar_rep(polar_rep: NDArray) -> NDArray:
+    """
+    Compute normalized radial activities by selecting the maximum
+    activity along the radius of a polar representation.
+
+    The result has the canonical shape `CANONICAL_SHAPE`.
+    """
+    radial_activities = np.max(polar_rep, axis=1)
+
+    # The polar rep can be/is likely imbalanced along the z axis.
+    # This is because it contains n=#polar_angles slices for the apex and m slices for the cylindrical region.
+    # According to the polar map model m should be 3*n.
+    # This is ensured by resampling the apex to the first quarter of the canonical rings
+    # and the cylindrical region to the remaining rings.
+    n_rings, n_azimuths = CANONICAL_SHAPE
+    activities_apex = to_canonical(
+        radial_activities[: len(POLAR_ANGLES)], (n_rings // 4, n_azimuths)
+    )
+    activities_other = to_canonical(
+        radial_activities[len(POLAR_ANGLES) :], (n_rings - n_rings // 4, n_azimuths)
+    )
+    radial_activities = np.concat([activities_apex, activities_other], axis=0)
+
+    # normalize the activities
+    if radial_activities.max() > 0.0:
+        radial_activities = radial_activities / radial_activities.max()
+
+    return radial_activities
+
+
+def compute_radial_activities(
+    image: NDArray,
+    center_z: int = None,
+    n_septal: int = None,
+    n_lateral: int = None,
+    weighting: bool = True,
+    spacing: float = 1.0,
+    sigma: float = 3.0,
+    radii_step: float = 0.2,
+    coefficients: Optional[NDArray] = None,
+    azimuth_step: float = 1.0,
+) -> NDArray:
+    """
+    Compute radial activities which are the basis of a polar map.
+
+    The image is resampled with a polar grid (see `polar_grid`) and
+    the maximum activity along the radius is selected.
+
+    Parameters
+    ----------
+    image: NDArray
+        the image (in short-axis view)
+    center_z, n_septal, n_lateral: int
+        see `polar_grid`
+    weighting: bool
+        weight the polar representation (see `weight_polar_rep`)
+    spacing: float
+        spacing of the image in mm
+    sigma: float
+        sigma used for weighting
+    radii_step: float
+        sampling step along the radius
+    coefficients: NDArray, optional
+        spline coefficients of the image (see `spline_coefficients`)
+    azimuth_step: float
+        sampling step of the azimuth angles in degrees
+
+    Returns
+    -------
+    NDArray
+        radial activities normalized to [0, 1] of shape `CANONICAL_SHAPE` - the first
+        axis corresponds to rings (apex first) and the second axis to azimuth angles
+    """
+    polar_rep = sample_polar_rep(
+        image,
+        center_z=center_z,
+        n_septal=n_septal,
+        n_lateral=n_lateral,
+        radii_step=radii_step,
+        coefficients=coefficients,
+        azimuth_step=azimuth_step,
+    )
+
+    return _radial_activities(polar_rep, weighting, spacing, sigma, radii_step)
+
+
+def _radial_activities(
+    polar_rep: NDArray, weighting: bool, spacing: float, sigma: float, radii_step: float
+) -> NDArray:
+    if weighting:
+        pixel_size_mm = spacing * radii_step
+        polar_rep = weight_polar_rep(polar_rep, pixel_size_mm=pixel_size_mm, sigma=sigma)
+
+    return reduce_polar_rep(polar_rep)
+
+
+def compute_radial_activities_batch(
+    images: Sequence[NDArray],
+    center_z: int = None,
+    n_septal: int = None,
+    n_lateral: int = None,
+    weighting: bool = True,
+    spacing: float = 1.0,
+    sigma: float = 3.0,
+    radii_step: float = 0.2,
+    azimuth_step: float = 1.0,
+) -> List[NDArray]:
+    """
+    Compute the radial activities of images of the same shape with the same
+    polar grid, e.g. of the stress and rest acquisition of a study.
+
+    The images are sampled in a single pass (see `sample_polar_reps`).
+    See `compute_radial_activities` for the parameters.
+
+    Returns
+    -------
+    list of NDArray
+        radial activities of each image (see `compute_radial_activities`)
+    """
+    polar_reps = sample_polar_reps(
+        images,
+        center_z=center_z,
+        n_septal=n_septal,
+        n_lateral=n_lateral,
+        radii_step=radii_step,
+        azimuth_step=azimuth_step,
+    )
+    return [
+        _radial_activities(polar_rep, weighting, spacing, sigma, radii_step)
+        for polar_rep in polar_reps
+    ]
+
+
+def progressive_radial_activities(
+    image: NDArray,
+    resolutions: Sequence[Tuple[float, float]] = (COARSE_RESOLUTION, FULL_RESOLUTION),
+    coefficients: Optional[NDArray] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+    **kwargs,
+) -> Iterator[NDArray]:
+    """
+    Compute radial activities with increasing resolution.
+
+    A coarse result can be shown quickly while the full resolution
+    is still computed. The refinement is skipped if `cancelled`
+    returns True before it is computed, e.g., if the parameters have
+    changed in the meantime.
+
+    Parameters
+    ----------
+    image: NDArray
+        the image (in short-axis view)
+    resolutions: sequence of tuple of float
+        the radial step and the azimuth step in degrees of each result
+    coefficients: NDArray, optional
+        spline coefficients of the image - computed once for all resolutions if not provided
+    cancelled: callable, optional
+        checked before each resolution is computed - iteration stops if it returns True
+    kwargs:
+        further parameters of `compute_radial_activities`
+
+    Yields
+    ------
+    NDArray
+        radial activities (see `compute_radial_activities`)
+    """
+    coefficients = spline_coefficients(image) if coefficients is None else coefficients
+    for radii_step, azimuth_step in resolutions:
+        if cancelled is not None and cancelled():
+            return
+        yield compute_radial_activities(
+            image,
+            radii_step=radii_step,
+            azimuth_step=azimuth_step,
+            coefficients=coefficients,
+            **kwargs,
+        )
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
-from typing import Optional
+import functools
+import math
+from typing import List, Optional, Tuple
 
 import numpy as np
 from numpy.typing import NDArray
@@ -181,6 +183,72 @@ def segment_mask(
     return np.logical_and(angle_mask, radius_mask)
 
 
+def compute_segment_scores(radial_activities: NDArray) -> List[int]:
+    """
+    Compute the score of each segment in `SEGMENTS`.
+
+    The score is the average radial activity in the segment in percent.
+
+    Parameters
+    ----------
+    radial_activities: NDArray
+        normalized radial activities
+
+    Returns
+    -------
+    list of int
+    """
+    scores = []
+    for segment in SEGMENTS:
+        mask = segment_mask(radial_activities, segment)
+        activity = radial_activities[mask]
+
+        if activity.max() == 0 or math.isnan(activity.max()):
+            scores.append(0)
+        else:
+            scores.append(round(100 * np.average(activity)))
+    return scores
+
+
+@functools.lru_cache(maxsize=8)
+def segment_weights(shape: Tuple[int, int]) -> NDArray:
+    """
+    Weights to average radial activities of a shape per segment in `SEGMENTS`.
+
+    Returns
+    -------
+    NDArray
+        of shape (len(SEGMENTS), shape[0] * shape[1]) - each row sums to one
+    """
+    activity = np.empty(shape)
+    masks = np.stack([segment_mask(activity, segment).ravel() for segment in SEGMENTS])
+    weights = masks / masks.sum(axis=1, keepdims=True)
+    weights.flags.writeable = False
+    return weights
+
+
+def segment_means(radial_activities: NDArray) -> NDArray:
+    """
+    Average radial activities per segment in `SEGMENTS` (vectorized).
+
+    In contrast to `compute_segment_scores`, the averages are not rounded,
+    which makes them suitable for statistics over many studies.
+
+    Parameters
+    ----------
+    radial_activities: NDArray
+        of shape (..., rings, azimuths), e.g. a stack of many studies
+
+    Returns
+    -------
+    NDArray
+        of shape (..., len(SEGMENTS))
+    """
+    shape = radial_activities.shape[-2:]
+    flat = radial_activities.reshape((*radial_activities.shape[:-2], -1))
+    return flat @ segment_weights(shape).T
+
+
 def segment_vertices(segment: Segment, radius: int):
     corners = []
     cx, cy = radius, radius
@@ -1,38 +1,61 @@
-import time
+from typing import Optional, Tuple
 
 import cv2 as cv
 import numpy as np
-import scipy
 import SimpleITK as sitk
 from reacTk.decorator import asynchron
 from reacTk.widget.canvas.image import ImageData
-from widget_state import HigherOrderState, computed, NumberState
+from widget_state import BoolState, HigherOrderState, computed, NumberState, ObjectState
 
-from ..widget.slice_view import SITKData
-from ..util import pad_crop, get_empty_image
+from ..widget.slice_view import DerivedCache, SITKData, image_fingerprint
+from ..util import pad_crop, get_empty_image, to_short_axis
 
 from .config_view import ConfigViewState
-from .sampling import polar_grid, cartesian_grid
-from .segment import SEGMENTS, segment_vertices
-from .util import weight_polar_rep
+from .sampling import (
+    CANONICAL_SHAPE,
+    COARSE_RESOLUTION,
+    FULL_RESOLUTION,
+    progressive_radial_activities,
+    spline_coefficients,
+)
 
 
 class AppState(HigherOrderState):
     def __init__(self):
         super().__init__()
 
+        # short-axis images and radial activities are looked up before computing them (see `restore`)
+        self._derived = DerivedCache()
+
         # target range the image should span in mm
         self.input_image = SITKData(get_empty_image(spacing=(10.0, 10.0, 10.0)))
         self.target_range = 200
 
         self.config_view_state = ConfigViewState(self.sa_image)
 
-        self.radial_activities = ImageData(np.zeros((128, 32), dtype=np.uint8))
-        self.sa_image.on_change(lambda _: self.compute_radial_activities())
-        self.config_view_state.center_z.on_change(lambda _: self.compute_radial_activities())
-        self.config_view_state.pos_line_lateral.on_change(lambda _: self.compute_radial_activities())
-        self.config_view_state.pos_line_septal.on_change(lambda _: self.compute_radial_activities())
-        self.config_view_state.weighting.on_change(lambda _: self.compute_radial_activities())
+        self.radial_activities = ImageData(np.zeros(CANONICAL_SHAPE, dtype=np.float32))
+        # show a coarse polar map before it is refined to full resolution
+        self.progressive = BoolState(True)
+        # incremented on each request to detect outdated computations
+        self._generation = 0
+        # radial activities key and resolutions of the latest request
+        self._requested: Optional[Tuple] = None
+        # set while an image and its sampling parameters are restored (see `restore`)
+        self._restoring = False
+
+        config = self.config_view_state
+        for state in (
+            config.center_z,
+            config.pos_line_septal,
+            config.pos_line_lateral,
+            config.weighting,
+        ):
+            state.on_change(lambda _: self._on_config_change())
+        config.dragging.on_change(self._on_dragging_change)
+        config.updating.on_change(self._on_updating_change)
+        # registered after the config view state, so that the sampling parameters
+        # and the spline coefficients are updated for a new short-axis image first
+        self.sa_image.on_change(lambda _: self._on_config_change())
 
         self._validate_computed_states()
 
@@ -47,72 +70,162 @@ class AppState(HigherOrderState):
 
     @computed
     def sa_image(self, image: SITKData):
-        sitk_img = image.value[:]
-        sitk_img = sitk.PermuteAxes(sitk_img, (2, 0, 1))
-        center = sitk_img.TransformContinuousIndexToPhysicalPoint(
-            np.array(sitk_img.GetSize()) / 2.0
-        )
-        sitk_img = sitk.Resample(
-            sitk_img,
-            sitk.Euler3DTransform(center, 0.0, np.rad2deg(-90), 0.0),
-            sitk.sitkLinear,
-            0.0,
+        return SITKData(
+            self._derived.get("sa_image", image.fingerprint, lambda: to_short_axis(image.value))
         )
-        return SITKData(sitk_img)
 
     @computed
-    def central_slice(self, image: SITKData) -> ImageData:
-        img = image.value
-        img = sitk.GetArrayFromImage(img)
+    def sa_coefficients(self, sa_image: SITKData) -> ObjectState:
+        return ObjectState(spline_coefficients(sitk.GetArrayFromImage(sa_image.value)))
 
-        if img.max() == 0:
+    @computed
+    def central_slice(self, image: SITKData) -> ImageData:
+        if image.statistics().max == 0:
             return ImageData(np.zeros((128, 128, 3), dtype=np.uint8))
 
-        img = img / img.max()
+        img = sitk.GetArrayViewFromImage(image.value)
+        img = img / image.statistics().max
         img = img[img.shape[0] // 2]
         img = (255 * img).astype(np.uint8)
         img = cv.applyColorMap(img, cv.COLORMAP_INFERNO)
         img = cv.cvtColor(img, cv.COLOR_BGR2RGB)
         return ImageData(img)
 
-    @asynchron
-    def compute_radial_activities(self) -> None:
-        img = sitk.GetArrayFromImage(self.sa_image.value)
-        if img.max() == 0:
+    def restore(
+        self,
+        input_image: sitk.Image,
+        config: dict,
+        sa_image: Optional[sitk.Image] = None,
+        radial_activities: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Restore the polar map of an image, e.g. stored in a snapshot (see `myoloom.snapshot`).
+
+        The short-axis image and the radial activities are used instead
+        of computing them if they are provided.
+
+        Parameters
+        ----------
+        input_image: sitk.Image
+        config: dict
+            serialized sampling parameters of the `config_view_state`
+        sa_image: sitk.Image, optional
+        radial_activities: np.ndarray, optional
+        """
+        target_shape = (round(self.target_range.value / input_image.GetSpacing()[0]),) * 3
+        image = pad_crop(input_image, target_shape=target_shape)
+        if sa_image is not None:
+            self._derived.set("sa_image", image_fingerprint(image), sa_image)
+
+        # the sampling parameters estimated for the new image are replaced
+        # before the radial activities are computed
+        self._restoring = True
+        try:
+            self.input_image.set(input_image)
+            self.config_view_state.deserialize(config)
+        finally:
+            self._restoring = False
+
+        if radial_activities is not None:
+            self._derived.set("radial_activities", self._radial_activities_key(), radial_activities)
+        self.compute_radial_activities()
+
+    def full_radial_activities(self) -> Optional[np.ndarray]:
+        """
+        Radial activities at full resolution of the current image and sampling
+        parameters or None if they are not yet computed.
+        """
+        return self._derived.lookup("radial_activities", self._radial_activities_key())
+
+    def _radial_activities_key(self) -> Tuple:
+        return (
+            self.sa_image.fingerprint,
+            tuple(self.config_view_state.sampling_params().items()),
+            self.config_view_state.weighting.value,
+        )
+
+    def _on_config_change(self) -> None:
+        # the sampling parameters are changed one by one while they are estimated for a new image
+        if self._restoring or not self.config_view_state.is_initialized():
+            return
+        # the line positions of a frame are computed once after all of them are updated
+        if self.config_view_state.updating.value:
             return
+        self.compute_radial_activities()
 
-        sigma = 3
-        radii_step = 0.2
-        radii = np.arange(0, img.shape[1] / 2, radii_step)
-        azimuth_angles = np.deg2rad(np.arange(0, 360, 1))
-        polar_angles = np.deg2rad(np.arange(0, 90, (90 / 10) - 0.001))
+    def _on_dragging_change(self, dragging: BoolState) -> None:
+        # the preview is already up to date when a drag starts
+        if dragging.value:
+            return
+        self._on_config_change()
 
-        grid = polar_grid(img, radii, azimuth_angles, polar_angles, **self.config_view_state.sampling_params())
+    def _on_updating_change(self, updating: BoolState) -> None:
+        if updating.value:
+            return
+        self._on_config_change()
 
-        polar_rep = scipy.ndimage.map_coordinates(img, grid, order=3)
+    def compute_radial_activities(self) -> None:
+        """
+        Compute the radial activities of the polar map in the background.
+
+        While the sampling parameters are changed interactively (see
+        `ConfigViewState.dragging`), only a coarse preview is computed.
+        Otherwise, a coarse result is published first if `progressive`
+        is set and then refined to full resolution. A request equal to
+        the latest one is ignored, so that its computation is not restarted.
+        """
+        key = self._radial_activities_key()
+        cached = self._derived.lookup("radial_activities", key)
+        if cached is not None:
+            self._generation += 1
+            self._requested = None
+            self.radial_activities.set(cached)
+            return
 
-        if self.config_view_state.weighting.value:
-            pixel_size_mm = self.sa_image.value.GetSpacing()[0] * radii_step
-            polar_rep = weight_polar_rep(polar_rep, pixel_size_mm=pixel_size_mm, sigma=sigma)
+        if self.config_view_state.dragging.value:
+            resolutions = (COARSE_RESOLUTION,)
+        elif self.progressive.value:
+            resolutions = (COARSE_RESOLUTION, FULL_RESOLUTION)
+        else:
+            resolutions = (FULL_RESOLUTION,)
+        if self._requested == (key, resolutions):
+            return
 
-        radial_activities = np.max(polar_rep, axis=1)
+        self._generation += 1
+        self._requested = (key, resolutions)
+        self._compute_radial_activities(self._generation, resolutions, key)
 
-        # The polar rep can be/is likely imbalanced along the z axis.
-        # This is because it contains n=#polar_angles slices for the apex and m slices for the cylindrical region.
-        # According to the polar map model m should be 3*n.
-        # This is ensured by the following code.
-        activities_apex = radial_activities[: len(polar_angles)]
-        activities_other = radial_activities[len(polar_angles) :]
-        activities_other = cv.resize(
-            activities_other, (activities_other.shape[1], activities_apex.shape[0] * 3)
-        )
-        radial_activities = np.concat([activities_apex, activities_other], axis=0)
+    @asynchron
+    def _compute_radial_activities(self, generation: int, resolutions, key: Tuple) -> None:
+        if self.sa_image.statistics().max == 0:
+            return
+        # the sampling parameters are taken from the request instead of the (possibly
+        # changed) current state, so that the cached result matches its key
+        _, sampling_params, weighting = key
+        img = sitk.GetArrayFromImage(self.sa_image.value)
 
-        # normalize the activities
-        if radial_activities.max() > 0.0:
-            radial_activities = radial_activities / radial_activities.max()
+        results = progressive_radial_activities(
+            img,
+            resolutions=resolutions,
+            coefficients=self.sa_coefficients.value,
+            # skip the refinement if a newer computation has been requested
+            cancelled=lambda: generation != self._generation,
+            **dict(sampling_params),
+            weighting=weighting,
+            spacing=self.sa_image.value.GetSpacing()[0],
+        )
+        for radial_activities in results:
+            # a newer computation may have been requested while this one was computed
+            if generation != self._generation:
+                return
+            self.radial_activities.set(radial_activities)
+        # the refinement is not computed if it has been cancelled
+        if generation != self._generation:
+            return
+        # only results at full resolution are cached
+        if resolutions[-1] == FULL_RESOLUTION:
+            self._derived.set("radial_activities", key, radial_activities)
 
-        self.radial_activities.set(radial_activities)
     #
     # @computed
     # def activity_image(self, radial_activities: ImageData):
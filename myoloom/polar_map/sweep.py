@@ -0,0 +1,144 @@
+"""
+Sweeps over sampling parameters to study the robustness of polar maps.
+
+A sweep evaluates a grid of sampling parameters for a single short-axis image.
+The spline prefilter of the image is computed once and each polar sampling is
+shared by all parameter sets which only differ in the weighting (`sigma`).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+from typing import Iterable, List, Optional, Sequence, Union
+
+from numpy.typing import NDArray
+import pandas as pd
+import SimpleITK as sitk
+
+from .sampling import grid_params, reduce_polar_rep, sample_polar_rep, spline_coefficients
+from .segment import SEGMENTS, compute_segment_scores
+from .util import weight_polar_rep
+
+# parameters which can be varied in a sweep
+PARAMS = ("center_z", "pos_line_septal", "pos_line_lateral", "sigma", "radii_step")
+# parameters which define the polar sampling grid
+GRID_PARAMS = ("center_z", "pos_line_septal", "pos_line_lateral", "radii_step")
+
+
+def parameter_grid(**values: Sequence) -> List[dict]:
+    """
+    Create all combinations of parameter values.
+
+    Example:
+    parameter_grid(center_z=[10, 12], sigma=[2.0, 3.0])
+    -> [{"center_z": 10, "sigma": 2.0}, {"center_z": 10, "sigma": 3.0}, ...]
+    """
+    keys = list(values.keys())
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values.values())]
+
+
+def _evaluate(
+    image: NDArray,
+    coefficients: NDArray,
+    spacing: float,
+    weighting: bool,
+    params: List[dict],
+) -> List[List[int]]:
+    """
+    Evaluate parameter sets which share the same sampling grid.
+    """
+    _params = params[0]
+    polar_rep = sample_polar_rep(
+        image,
+        **grid_params(
+            center_z=_params["center_z"],
+            pos_line_septal=_params["pos_line_septal"],
+            pos_line_lateral=_params["pos_line_lateral"],
+        ),
+        radii_step=_params["radii_step"],
+        coefficients=coefficients,
+    )
+
+    scores = []
+    for _params in params:
+        _polar_rep = polar_rep
+        if weighting:
+            # weighting works in-place
+            _polar_rep = weight_polar_rep(
+                polar_rep.copy(),
+                pixel_size_mm=spacing * _params["radii_step"],
+                sigma=_params["sigma"],
+            )
+        scores.append(compute_segment_scores(reduce_polar_rep(_polar_rep)))
+    return scores
+
+
+def sweep(
+    image: Union[NDArray, sitk.Image],
+    params: Iterable[dict],
+    defaults: Optional[dict] = None,
+    weighting: bool = True,
+    spacing: Optional[float] = None,
+    max_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Compute segment scores for many sets of sampling parameters.
+
+    Parameters
+    ----------
+    image: NDArray or sitk.Image
+        the image in short-axis view
+    params: iterable of dict
+        parameter sets (see `parameter_grid`) - each may contain the keys in `PARAMS`
+    defaults: dict, optional
+        values of parameters not contained in a parameter set - they have to contain
+        `center_z`, `pos_line_septal`, and `pos_line_lateral` if these are not swept
+    weighting: bool
+        weight the polar representation
+    spacing: float, optional
+        spacing of the image in mm - taken from the image if it is an sitk.Image
+    max_workers: int, optional
+        number of threads used to evaluate parameter sets in parallel
+
+    Returns
+    -------
+    pd.DataFrame
+        tidy table with a row per parameter set and segment containing
+        the parameters, the segment (`segment_id`, `location`, `name`), and its `score`
+    """
+    if isinstance(image, sitk.Image):
+        spacing = image.GetSpacing()[0] if spacing is None else spacing
+        image = sitk.GetArrayFromImage(image)
+    spacing = 1.0 if spacing is None else spacing
+
+    _defaults = {"sigma": 3.0, "radii_step": 0.2}
+    _defaults.update(defaults if defaults is not None else {})
+    params = [{**_defaults, **_params} for _params in params]
+
+    # group parameter sets by their sampling grid so that it is computed only once
+    groups = {}
+    for _params in params:
+        key = tuple(_params[name] for name in GRID_PARAMS)
+        groups.setdefault(key, []).append(_params)
+
+    coefficients = spline_coefficients(image)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda group: _evaluate(image, coefficients, spacing, weighting, group),
+            groups.values(),
+        )
+
+        rows = []
+        for group, scores in zip(groups.values(), results):
+            for _params, _scores in zip(group, scores):
+                for segment, score in zip(SEGMENTS, _scores):
+                    rows.append(
+                        {
+                            **{name: _params[name] for name in PARAMS},
+                            "segment_id": segment.id,
+                            "location": segment.location,
+                            "name": segment.name,
+                            "score": score,
+                        }
+                    )
+
+    return pd.DataFrame(rows)
@@ -1,7 +1,10 @@
 import numpy as np
 from numpy.typing import NDArray
 
+from ..metrics import timed
 
+
+@timed("weighting")
 def weight_polar_rep(
     polar_rep: NDArray, pixel_size_mm: float, sigma: float = 5.0
 ) -> NDArray:
@@ -0,0 +1,222 @@
+"""
+Background preparation of studies for fast navigation through a worklist.
+
+Loading a study (reading, flipping, scaling, padding and, for short-axis
+images, resampling back to a transversal view) takes seconds. The `Prefetcher`
+prepares the next studies of a worklist in a background thread and keeps
+them in a memory-bounded cache so that switching studies is almost instant.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+import threading
+from typing import Iterable, Optional, Tuple
+
+import SimpleITK as sitk
+
+from .gated import is_gated, load_summed_image
+from .util import load_image, square_pad, is_short_axis, to_transversal
+
+
+@dataclass
+class PreparedImage:
+    """
+    A study which is prepared for display in the app.
+
+    Attributes
+    ----------
+    filename: str
+    sitk_img: sitk.Image
+        the image in transversal view
+    angles: tuple of float, optional
+        reorientation angles (x, z) restored from a short-axis image
+    """
+
+    filename: str
+    sitk_img: sitk.Image
+    angles: Optional[Tuple[float, float]] = None
+
+    def nbytes(self) -> int:
+        """
+        Memory consumed by the image data in bytes.
+        """
+        return (
+            self.sitk_img.GetNumberOfPixels()
+            * self.sitk_img.GetNumberOfComponentsPerPixel()
+            * self.sitk_img.GetSizeOfPixelComponent()
+        )
+
+
+def prepare_image(filename: str, backend: str = "sitk") -> PreparedImage:
+    """
+    Load an image and prepare it for the reorientation app.
+
+    Short-axis images are rotated back to a transversal view and
+    the angles of the rotation are returned, so that they can be
+    applied to the reorientation state. Of gated studies, the sum
+    of all gates is prepared (see `myoloom.gated.load_summed_image`).
+
+    Parameters
+    ----------
+    filename: str
+    backend: str
+        resampling backend (see `myoloom.resampling.BACKENDS`)
+
+    Returns
+    -------
+    PreparedImage
+    """
+    if is_gated(filename):
+        sitk_img, angles = load_summed_image(filename, backend=backend)
+        return PreparedImage(filename, sitk_img, angles)
+
+    if not is_short_axis(filename):
+        return PreparedImage(filename, square_pad(load_image(filename)))
+
+    """
+    To correctly display a short-axis image, we have to rotate the image
+    back to a transversal view and subsequently, apply the rotation angles
+    to the reorientation state.
+    """
+    sitk_img, angles = to_transversal(load_image(filename), backend=backend)
+    return PreparedImage(filename, sitk_img, angles)
+
+
+class StudyCache:
+    """
+    Thread-safe least-recently-used cache of prepared studies
+    whose memory consumption is bounded.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._items: OrderedDict[str, PreparedImage] = OrderedDict()
+
+    def __contains__(self, filename: str) -> bool:
+        with self._lock:
+            return filename in self._items
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(item.nbytes() for item in self._items.values())
+
+    def get(self, filename: str) -> Optional[PreparedImage]:
+        with self._lock:
+            if filename not in self._items:
+                return None
+
+            self._items.move_to_end(filename)
+            return self._items[filename]
+
+    def put(self, item: PreparedImage) -> None:
+        """
+        Add an item and evict the least recently used items until the
+        memory limit is satisfied. Items larger than the limit are not cached.
+        """
+        if item.nbytes() > self.max_bytes:
+            return
+
+        with self._lock:
+            self._items[item.filename] = item
+            self._items.move_to_end(item.filename)
+
+            while sum(_item.nbytes() for _item in self._items.values()) > self.max_bytes:
+                self._items.popitem(last=False)
+
+
+class Prefetcher:
+    """
+    Prepare studies in a background thread and keep them in a `StudyCache`.
+    """
+
+    def __init__(self, max_bytes: int = 1024**3, backend: str = "sitk"):
+        """
+        Parameters
+        ----------
+        max_bytes: int
+            memory limit of the cache - default is 1GiB
+        backend: str
+            resampling backend (see `myoloom.resampling.BACKENDS`)
+        """
+        self.cache = StudyCache(max_bytes)
+        self.backend = backend
+
+        # re-entrant because canceling a future runs its done callbacks immediately
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._futures: dict[str, Future] = {}
+
+    def _prepare(self, filename: str) -> PreparedImage:
+        prepared = self.cache.get(filename)
+        if prepared is None:
+            prepared = prepare_image(filename, backend=self.backend)
+            self.cache.put(prepared)
+        return prepared
+
+    def _submit(self, filename: str) -> Future:
+        future = self._executor.submit(self._prepare, filename)
+        self._futures[filename] = future
+        future.add_done_callback(lambda _: self._discard(filename, future))
+        return future
+
+    def _discard(self, filename: str, future: Future) -> None:
+        with self._lock:
+            if self._futures.get(filename) is future:
+                del self._futures[filename]
+
+    def get(self, filename: str) -> PreparedImage:
+        """
+        Retrieve a prepared study.
+
+        The study is taken from the cache, it is waited for if it is being
+        prefetched, or it is prepared immediately in the calling thread.
+
+        Parameters
+        ----------
+        filename: str
+
+        Returns
+        -------
+        PreparedImage
+        """
+        prepared = self.cache.get(filename)
+        if prepared is not None:
+            return prepared
+
+        with self._lock:
+            future = self._futures.get(filename)
+            # steal pending work instead of waiting for the queue
+            if future is not None and future.cancel():
+                future = None
+
+        if future is not None:
+            return future.result()
+        return self._prepare(filename)
+
+    def prefetch(self, filenames: Iterable[str]) -> None:
+        """
+        Prepare studies in the background.
+
+        Pending studies which are no longer requested are canceled.
+
+        Parameters
+        ----------
+        filenames: iterable of str
+            the studies to prepare in order of priority
+        """
+        filenames = [f for f in filenames if f not in self.cache]
+
+        with self._lock:
+            for filename, future in list(self._futures.items()):
+                if filename not in filenames:
+                    future.cancel()
+
+            for filename in filenames:
+                if filename not in self._futures:
+                    self._submit(filename)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
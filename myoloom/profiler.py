@@ -0,0 +1,296 @@
+"""
+Profiling of the reactive state graph.
+
+Changes of a state cascade through the graph: each change notifies callbacks
+which recompute `@computed` states, which notify their callbacks and so on
+(e.g. `img_reoriented` -> `img_sa` -> `quantized_image` -> `slice_image` ->
+canvas image). The profiler records each cascade as an interaction with a
+span per recomputed state and per expensive callback, including its duration,
+its trigger and its fan-out (the number of recomputations it triggers directly).
+
+The profiler is opt-in because it patches `State.notify_change` and
+`HigherOrderState._update_computed_state` while it is installed:
+
+    profiler = ReactiveProfiler()
+    with profiler:
+        app_state.reorientation.angle.x.value = 0.1
+    print(profiler.summary())
+    profiler.write_chrome_trace("trace.json")  # view with chrome://tracing or Perfetto
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+import json
+import os
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional
+
+from widget_state import HigherOrderState, State
+
+
+@dataclass
+class Span:
+    """
+    A timed evaluation in a cascade of state changes.
+
+    Attributes
+    ----------
+    name: str
+        name of the state or the callback
+    kind: str
+        "interaction" (the state change starting a cascade),
+        "computed" (recomputation of a computed state) or "callback"
+    start: float
+        start time in seconds (see `time.perf_counter`)
+    thread: int
+        id of the thread
+    trigger: str
+        name of the span which caused this evaluation
+    duration: float
+        duration in seconds including children
+    children: list of Span
+    """
+
+    name: str
+    kind: str
+    start: float
+    thread: int
+    trigger: str = ""
+    duration: float = 0.0
+    children: List["Span"] = field(default_factory=list)
+
+    @property
+    def fan_out(self) -> int:
+        """
+        Number of recomputations triggered directly by this span.
+        """
+        return sum(1 for child in self.children if child.kind == "computed")
+
+    @property
+    def self_duration(self) -> float:
+        """
+        Duration without children.
+        """
+        return self.duration - sum(child.duration for child in self.children)
+
+
+def state_name(state: State) -> str:
+    """
+    Name of a state as `<class of its parent>.<attribute>` if possible.
+    """
+    parent = state._parent
+    if parent is not None:
+        for key, value in parent.__dict__.items():
+            if value is state:
+                return f"{type(parent).__name__}.{key}"
+    return type(state).__name__
+
+
+def _callback_name(callback: Callable) -> str:
+    module = getattr(callback, "__module__", None) or ""
+    qualname = getattr(callback, "__qualname__", None) or type(callback).__name__
+    return f"{module}.{qualname}".lstrip(".")
+
+
+class ReactiveProfiler:
+    """
+    Record cascades of state changes.
+
+    Parameters
+    ----------
+    min_duration: float
+        callbacks (which are not recomputations of computed states) faster than
+        this duration in seconds and without children are not recorded
+    max_interactions: int
+        maximal number of interactions kept - older interactions are discarded
+    """
+
+    def __init__(self, min_duration: float = 0.5e-3, max_interactions: int = 10000):
+        self.min_duration = min_duration
+        self.interactions: Deque[Span] = deque(maxlen=max_interactions)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._installed = False
+        self._origin = time.perf_counter()
+
+        self._notify_change = None
+        self._update_computed_state = None
+
+    def __enter__(self) -> "ReactiveProfiler":
+        self.install()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.uninstall()
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _begin(self, name: str, kind: str) -> Span:
+        stack = self._stack()
+        span = Span(
+            name=name,
+            kind=kind,
+            start=time.perf_counter(),
+            thread=threading.get_ident(),
+            trigger=stack[-1].name if len(stack) > 0 else "",
+        )
+        stack.append(span)
+        return span
+
+    def _end(self, span: Span) -> None:
+        span.duration = time.perf_counter() - span.start
+
+        stack = self._stack()
+        stack.pop()
+
+        if span.kind == "callback":
+            if len(span.children) == 0 and span.duration < self.min_duration:
+                return
+            # a callback which only recomputes a computed state is represented by it
+            if len(span.children) == 1 and span.children[0].kind == "computed":
+                span = span.children[0]
+
+        if len(stack) > 0:
+            stack[-1].children.append(span)
+        elif span.kind == "interaction" and len(span.children) > 0:
+            with self._lock:
+                self.interactions.append(span)
+
+    def install(self) -> None:
+        """
+        Start recording by patching the state classes.
+        """
+        if self._installed:
+            return
+        self._installed = True
+
+        self._notify_change = State.notify_change
+        self._update_computed_state = HigherOrderState._update_computed_state
+        profiler = self
+
+        def notify_change(state: State) -> None:
+            if not state._active:
+                return
+
+            stack = profiler._stack()
+            interaction = None
+            if len(stack) == 0:
+                interaction = profiler._begin(state_name(state), "interaction")
+
+            try:
+                for callback in state._callbacks:
+                    span = profiler._begin(_callback_name(callback), "callback")
+                    try:
+                        callback(state)
+                    finally:
+                        profiler._end(span)
+            finally:
+                if interaction is not None:
+                    profiler._end(interaction)
+
+        def update_computed_state(state: HigherOrderState, name: str) -> None:
+            span = profiler._begin(f"{type(state).__name__}.{name}", "computed")
+            try:
+                profiler._update_computed_state(state, name)
+            finally:
+                profiler._end(span)
+
+        State.notify_change = notify_change
+        HigherOrderState._update_computed_state = update_computed_state
+
+    def uninstall(self) -> None:
+        """
+        Stop recording and restore the state classes.
+        """
+        if not self._installed:
+            return
+        self._installed = False
+
+        State.notify_change = self._notify_change
+        HigherOrderState._update_computed_state = self._update_computed_state
+
+    def clear(self) -> None:
+        with self._lock:
+            self.interactions.clear()
+
+    def chrome_trace(self) -> Dict:
+        """
+        Create a trace in the Chrome trace event format.
+
+        Returns
+        -------
+        dict
+            can be stored as json and viewed with chrome://tracing or Perfetto
+        """
+        events = []
+
+        def add(span: Span):
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.kind,
+                    "ph": "X",
+                    "ts": (span.start - self._origin) * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": span.thread,
+                    "args": {"trigger": span.trigger, "fan_out": span.fan_out},
+                }
+            )
+            for child in span.children:
+                add(child)
+
+        with self._lock:
+            interactions = list(self.interactions)
+        for interaction in interactions:
+            add(interaction)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, filename: str) -> None:
+        with open(filename, mode="w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self, last: Optional[int] = None, min_duration: float = 0.0) -> str:
+        """
+        Create a flame summary of the recorded interactions.
+
+        Each interaction is printed as a tree of spans with their
+        (inclusive) duration, self duration and fan-out.
+
+        Parameters
+        ----------
+        last: int, optional
+            only summarize the last interactions
+        min_duration: float
+            omit spans faster than this duration in seconds
+
+        Returns
+        -------
+        str
+        """
+        with self._lock:
+            interactions = list(self.interactions)
+        interactions = interactions if last is None else interactions[-last:]
+
+        lines = []
+
+        def add(span: Span, depth: int):
+            if span.duration < min_duration:
+                return
+            lines.append(
+                f"{1000 * span.duration:>9.2f}ms {1000 * span.self_duration:>9.2f}ms"
+                f" {span.fan_out:>4d}  {'  ' * depth}{span.name}"
+            )
+            for child in span.children:
+                add(child, depth + 1)
+
+        for interaction in interactions:
+            lines.append(f"{'total':>11} {'self':>11} {'fan':>4}  interaction")
+            add(interaction, 0)
+            lines.append("")
+        return "\n".join(lines)
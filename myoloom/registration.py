@@ -0,0 +1,82 @@
+"""
+Registration of studies of the same patient, e.g. rest to stress acquisitions.
+"""
+
+import SimpleITK as sitk
+
+from .metrics import timed
+from .util import change_spacing
+
+
+@timed("registration")
+def register_rigid(
+    fixed: sitk.Image,
+    moving: sitk.Image,
+    shrink_factors: tuple[int, ...] = (4, 2, 1),
+    smoothing_sigmas: tuple[float, ...] = (2.0, 1.0, 0.0),
+    iterations: int = 100,
+    sampling_percentage: float = 0.1,
+    min_spacing: float = 4.0,
+) -> sitk.Euler3DTransform:
+    """
+    Rigidly register a moving image to a fixed image.
+
+    The normalized correlation is used as metric because the intensities
+    of the images may differ by a scale, e.g. due to different doses
+    of stress and rest acquisitions.
+
+    Parameters
+    ----------
+    fixed: sitk.Image
+    moving: sitk.Image
+    shrink_factors: tuple of int
+        shrink factor of each resolution level
+    smoothing_sigmas: tuple of float
+        smoothing sigma in voxels of each resolution level
+    iterations: int
+        maximal number of iterations per resolution level
+    sampling_percentage: float
+        fraction of voxels (on a regular grid) used to evaluate the metric
+    min_spacing: float
+        images with a finer spacing are downsampled to this spacing in mm before the
+        registration - a finer resolution does not improve the registration of SPECT
+        images but is slow
+
+    Returns
+    -------
+    sitk.Euler3DTransform
+        maps physical points of the fixed image to physical points of the
+        moving image (see `myoloom.resampling.resample_linear`)
+    """
+    fixed, moving = (
+        change_spacing(img, (min_spacing,) * 3) if min(img.GetSpacing()) < min_spacing else img
+        for img in (fixed, moving)
+    )
+
+    initial = sitk.CenteredTransformInitializer(
+        fixed,
+        moving,
+        sitk.Euler3DTransform(),
+        sitk.CenteredTransformInitializerFilter.MOMENTS,
+    )
+
+    registration = sitk.ImageRegistrationMethod()
+    registration.SetMetricAsCorrelation()
+    registration.SetMetricSamplingStrategy(registration.REGULAR)
+    registration.SetMetricSamplingPercentage(sampling_percentage, seed=0)
+    registration.SetInterpolator(sitk.sitkLinear)
+    registration.SetOptimizerAsRegularStepGradientDescent(
+        learningRate=1.0, minStep=1e-3, numberOfIterations=iterations
+    )
+    registration.SetOptimizerScalesFromPhysicalShift()
+    registration.SetShrinkFactorsPerLevel(list(shrink_factors))
+    registration.SetSmoothingSigmasPerLevel(list(smoothing_sigmas))
+    registration.SetInitialTransform(initial, inPlace=False)
+
+    transform = registration.Execute(
+        sitk.Cast(fixed, sitk.sitkFloat32), sitk.Cast(moving, sitk.sitkFloat32)
+    )
+    # the result is a composite transform only containing the optimized euler transform
+    if isinstance(transform, sitk.CompositeTransform):
+        transform = transform.GetNthTransform(0)
+    return sitk.Euler3DTransform(transform)
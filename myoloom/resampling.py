@@ -0,0 +1,228 @@
+"""
+Linear resampling of images with affine transforms.
+
+Two backends are available:
+  * "sitk" uses `sitk.Resample`
+  * "opencv" computes the affine sample coordinates per output slice and performs
+    trilinear interpolation with two bilinear `cv.remap` calls (on the input slices
+    below and above each coordinate) which are blended along z
+
+Both backends map points outside the input image to a default value and
+replicate the border voxels for points within half a voxel of the image border,
+so that results are equivalent up to the sub-pixel precision of `cv.remap`
+(1/32 of a voxel).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+from numpy.typing import NDArray
+import SimpleITK as sitk
+
+BACKENDS = ("sitk", "opencv")
+
+# cv.remap requires images with less than SHRT_MAX rows
+_MAX_ROWS = 32767 - 1
+
+
+def affine_index_map(
+    sitk_img: sitk.Image, transform: sitk.Transform, reference: sitk.Image
+) -> Tuple[NDArray, NDArray]:
+    """
+    Compute the affine map from indices of the reference image to
+    continuous indices of the image.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+        the image which is resampled
+    transform: sitk.Transform
+        affine transform from physical points of the reference to physical points of the image
+    reference: sitk.Image
+        image defining the output grid
+
+    Returns
+    -------
+    NDArray, NDArray
+        matrix of shape (3, 3) and offset of shape (3,) so that
+        `matrix @ index + offset` is the continuous index in the image
+    """
+    # retrieve the affine transform by probing it (works for composite transforms)
+    origin = np.array(transform.TransformPoint((0.0, 0.0, 0.0)))
+    affine = np.stack(
+        [np.array(transform.TransformPoint(tuple(axis))) - origin for axis in np.eye(3)],
+        axis=1,
+    )
+
+    def index_to_physical(img: sitk.Image) -> Tuple[NDArray, NDArray]:
+        direction = np.array(img.GetDirection()).reshape((3, 3))
+        return direction * np.array(img.GetSpacing()), np.array(img.GetOrigin())
+
+    scale_ref, origin_ref = index_to_physical(reference)
+    scale_img, origin_img = index_to_physical(sitk_img)
+    scale_img_inv = np.linalg.inv(scale_img)
+
+    matrix = scale_img_inv @ affine @ scale_ref
+    offset = scale_img_inv @ (affine @ origin_ref + origin - origin_img)
+    return matrix, offset
+
+
+def _remap_tile(
+    volume: NDArray, x: NDArray, y: NDArray, z: NDArray, out: NDArray
+) -> None:
+    """
+    Trilinear interpolation of a volume at (clamped) continuous indices.
+
+    The slices required by the tile are stacked into a 2D image so that a
+    single `cv.remap` samples each coordinate from its lower slice and another
+    one from its upper slice. Tiles requiring too many slices are split.
+    """
+    n_slices, height, _ = volume.shape
+
+    z_lower = np.floor(z)
+    first = int(z_lower.min())
+    last = min(int(z_lower.max()) + 1, n_slices - 1)
+
+    if (last - first + 1) * height > _MAX_ROWS and z.size > 1:
+        axis = 0 if z.shape[0] >= z.shape[1] else 1
+        half = z.shape[axis] // 2
+        for part in (slice(None, half), slice(half, None)):
+            idx = (part, slice(None)) if axis == 0 else (slice(None), part)
+            _remap_tile(volume, x[idx], y[idx], z[idx], out[idx])
+        return
+
+    weight = z - z_lower
+    stack = volume[first : last + 1].reshape((-1, volume.shape[2]))
+
+    y_lower = y + (z_lower - first) * height
+    y_upper = np.minimum(y_lower + height, y + (last - first) * height)
+
+    lower = cv.remap(stack, x, y_lower, cv.INTER_LINEAR)
+    upper = cv.remap(stack, x, y_upper, cv.INTER_LINEAR)
+
+    upper -= lower
+    upper *= weight
+    np.add(lower, upper, out=out)
+
+
+def _remap_slice(
+    volume: NDArray,
+    matrix: NDArray,
+    offset: NDArray,
+    k: int,
+    out: NDArray,
+    default_value: float,
+) -> None:
+    height, width = out.shape
+    xs = np.arange(width, dtype=np.float32)[np.newaxis]
+    ys = np.arange(height, dtype=np.float32)[:, np.newaxis]
+
+    valid = np.ones(out.shape, dtype=bool)
+    coords = []
+    # volume axes are (z, y, x) while indices are (x, y, z)
+    for axis, size in enumerate(volume.shape[::-1]):
+        coord = (
+            np.float32(matrix[axis, 0]) * xs
+            + np.float32(matrix[axis, 1]) * ys
+            + np.float32(matrix[axis, 2] * k + offset[axis])
+        )
+        valid &= (coord >= -0.5) & (coord < size - 0.5)
+        np.clip(coord, 0, size - 1, out=coord)
+        coords.append(coord)
+
+    _remap_tile(volume, *coords, out)
+    out[~valid] = default_value
+
+
+def resample_opencv(
+    sitk_img: sitk.Image,
+    transform: sitk.Transform,
+    reference: sitk.Image,
+    default_value: float = 0.0,
+    max_workers: Optional[int] = None,
+) -> sitk.Image:
+    """
+    Resample an image with trilinear interpolation using `cv.remap`.
+
+    Output slices are computed in parallel by a thread pool
+    as `cv.remap` releases the GIL.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+    transform: sitk.Transform
+        affine transform from physical points of the output to physical points of the image
+    reference: sitk.Image
+        image defining the output grid
+    default_value: float
+        value of output voxels outside of the image
+    max_workers: int, optional
+        number of threads - defaults to the number of CPUs
+
+    Returns
+    -------
+    sitk.Image
+        with the geometry of the reference and the pixel type of the image
+    """
+    matrix, offset = affine_index_map(sitk_img, transform, reference)
+
+    array = sitk.GetArrayViewFromImage(sitk_img)
+    volume = np.ascontiguousarray(array, dtype=np.float32)
+    out = np.empty(reference.GetSize()[::-1], dtype=np.float32)
+
+    max_workers = os.cpu_count() if max_workers is None else max_workers
+    if max_workers <= 1:
+        for k in range(out.shape[0]):
+            _remap_slice(volume, matrix, offset, k, out[k], default_value)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_remap_slice, volume, matrix, offset, k, out[k], default_value)
+                for k in range(out.shape[0])
+            ]
+            for future in futures:
+                future.result()
+
+    resampled = sitk.GetImageFromArray(out.astype(array.dtype, copy=False))
+    resampled.CopyInformation(reference)
+    return resampled
+
+
+def resample_linear(
+    sitk_img: sitk.Image,
+    transform: sitk.Transform,
+    reference: Optional[sitk.Image] = None,
+    default_value: float = 0.0,
+    backend: str = "sitk",
+) -> sitk.Image:
+    """
+    Resample an image with linear interpolation.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+    transform: sitk.Transform
+        affine transform from physical points of the output to physical points of the image
+    reference: sitk.Image, optional
+        image defining the output grid - defaults to the image itself
+    default_value: float
+        value of output voxels outside of the image
+    backend: str
+        one of `BACKENDS`
+
+    Returns
+    -------
+    sitk.Image
+    """
+    reference = sitk_img if reference is None else reference
+
+    if backend == "sitk":
+        return sitk.Resample(
+            sitk_img, reference, transform, sitk.sitkLinear, default_value
+        )
+    if backend == "opencv":
+        return resample_opencv(sitk_img, transform, reference, default_value)
+    raise ValueError(f"Unknown resampling backend {backend}, expected one of {BACKENDS}")
@@ -0,0 +1,201 @@
+"""
+Columnar export of pipeline results.
+
+Results are stored as Parquet files with a row per study (or per gate or
+acquisition of a study) containing:
+  * labels: `filename`, `study` (e.g. "stress"/"rest") and `gate` (e.g. "sum" or the gate index)
+  * reorientation: `angle_x/y/z` and `center_idx_x/y/z`
+  * sampling parameters: `center_z`, `pos_line_septal`, `pos_line_lateral`,
+    `n_septal` and `n_lateral` (see `myoloom.polar_map.sampling.grid_params`)
+  * segment statistics: `segment_score_<id>` and `segment_mean_<id>` of each segment in `SEGMENTS`
+    and the `summed_score` if a normal database is used
+  * the radial activities in the canonical shape (`CANONICAL_SHAPE`) as a fixed-size list
+
+Rows are written incrementally in row groups (see `ResultsWriter`), so that a batch
+run does not keep all radial activities in memory. Because the format is columnar,
+tables can be queried without loading the radial activities, and row groups
+are skipped based on filters:
+
+    read_results("results.parquet", columns=["filename", "segment_score_17"])
+    read_radial_activities("results.parquet", filters=[("study", "==", "stress")])
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .polar_map.sampling import CANONICAL_SHAPE, grid_params, to_canonical
+from .polar_map.segment import SEGMENTS, segment_means
+
+LABEL_COLUMNS = ("filename", "study", "gate")
+REORIENTATION_COLUMNS = (
+    "angle_x",
+    "angle_y",
+    "angle_z",
+    "center_idx_x",
+    "center_idx_y",
+    "center_idx_z",
+)
+SAMPLING_COLUMNS = ("center_z", "pos_line_septal", "pos_line_lateral", "n_septal", "n_lateral")
+SEGMENT_SCORE_COLUMNS = tuple(f"segment_score_{segment.id}" for segment in SEGMENTS)
+SEGMENT_MEAN_COLUMNS = tuple(f"segment_mean_{segment.id}" for segment in SEGMENTS)
+
+SCHEMA = pa.schema(
+    [
+        *[pa.field(name, pa.string()) for name in LABEL_COLUMNS],
+        *[pa.field(name, pa.float64()) for name in REORIENTATION_COLUMNS],
+        *[pa.field(name, pa.int32()) for name in SAMPLING_COLUMNS],
+        *[pa.field(name, pa.int16()) for name in SEGMENT_SCORE_COLUMNS],
+        *[pa.field(name, pa.float32()) for name in SEGMENT_MEAN_COLUMNS],
+        pa.field("summed_score", pa.int16()),
+        pa.field(
+            "radial_activities",
+            pa.list_(pa.float32(), CANONICAL_SHAPE[0] * CANONICAL_SHAPE[1]),
+        ),
+    ],
+    metadata={"radial_activities_shape": ",".join(map(str, CANONICAL_SHAPE))},
+)
+
+
+class ResultsWriter:
+    """
+    Write pipeline results incrementally to a Parquet file.
+
+    Rows are buffered and written as a row group once `row_group_size`
+    rows are collected. The file is complete once the writer is closed,
+    which is best ensured by using it as a context manager:
+
+        with ResultsWriter("results.parquet") as writer:
+            for filename in filenames:
+                writer.write(process(filename))
+
+    Parameters
+    ----------
+    filename: str
+    row_group_size: int
+        number of rows per row group - a row requires about 90KB because
+        of the radial activities
+    compression: str
+        compression codec (see `pyarrow.parquet.ParquetWriter`)
+    """
+
+    def __init__(self, filename: str, row_group_size: int = 64, compression: str = "zstd"):
+        self.filename = filename
+        self.row_group_size = row_group_size
+        self.n_rows = 0
+
+        self._writer = pq.ParquetWriter(filename, SCHEMA, compression=compression)
+        self._rows: List[dict] = []
+
+    def __enter__(self) -> "ResultsWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def write(
+        self,
+        result,
+        study: Optional[str] = None,
+        gate: Optional[object] = None,
+        summed_score: Optional[int] = None,
+    ) -> None:
+        """
+        Add the result of a study.
+
+        Parameters
+        ----------
+        result: myoloom.pipeline.PipelineResult
+        study: str, optional
+            e.g. "stress" or "rest" of paired studies
+        gate: str or int, optional
+            e.g. "sum" or the index of the gate of gated studies
+        summed_score: int, optional
+            see `myoloom.polar_map.normals.NormalDatabase.summed_score`
+        """
+        radial_activities = to_canonical(result.radial_activities)
+        self._rows.append(
+            {
+                "filename": result.filename,
+                "study": study,
+                "gate": None if gate is None else str(gate),
+                **dict(zip(REORIENTATION_COLUMNS, (*result.angles, *result.center))),
+                **result.config,
+                **grid_params(**result.config),
+                **dict(zip(SEGMENT_SCORE_COLUMNS, result.segment_scores)),
+                **dict(zip(SEGMENT_MEAN_COLUMNS, segment_means(radial_activities))),
+                "summed_score": summed_score,
+                "radial_activities": radial_activities.ravel(),
+            }
+        )
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered rows as a row group.
+        """
+        if len(self._rows) == 0:
+            return
+        self._writer.write_table(pa.Table.from_pylist(self._rows, schema=SCHEMA))
+        self.n_rows += len(self._rows)
+        self._rows.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+
+
+def read_results(
+    filename: str,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[list] = None,
+    radial_activities: bool = False,
+) -> pd.DataFrame:
+    """
+    Read (parts of) a results table.
+
+    Parameters
+    ----------
+    filename: str
+    columns: sequence of str, optional
+        columns to read - defaults to all columns except the radial activities
+    filters: list, optional
+        row filters, e.g. `[("study", "==", "stress")]` (see `pyarrow.parquet.read_table`)
+    radial_activities: bool
+        also read the radial activities if no columns are specified
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    if columns is None:
+        columns = [
+            name for name in SCHEMA.names if radial_activities or name != "radial_activities"
+        ]
+    return pq.read_table(filename, columns=list(columns), filters=filters).to_pandas()
+
+
+def read_radial_activities(filename: str, filters: Optional[list] = None) -> NDArray[np.float32]:
+    """
+    Read the radial activities of a results table.
+
+    Parameters
+    ----------
+    filename: str
+    filters: list, optional
+        row filters (see `read_results`)
+
+    Returns
+    -------
+    NDArray[np.float32]
+        of shape (n, *CANONICAL_SHAPE), e.g. to build a normal
+        database (see `myoloom.polar_map.normals`)
+    """
+    table = pq.read_table(filename, columns=["radial_activities"], filters=filters)
+    values = table.column("radial_activities").combine_chunks().flatten()
+    return values.to_numpy().reshape((-1, *CANONICAL_SHAPE))
@@ -0,0 +1,196 @@
+"""
+Snapshots of reviews.
+
+A snapshot stores the serialized app state (see `AppState.serialize`) together
+with the data derived from it in a single compressed file (`.npz`):
+  * the prepared image (`sitk_img`) so that the study does not have to be read again
+  * the reoriented and the short-axis image (`img_reoriented` and `img_sa`)
+  * the sampling parameters of the polar map and, if they are up to date,
+    its short-axis image and radial activities
+
+Restoring a snapshot reopens a review without loading the study and without
+resampling (see `AppState.restore`), so that many saved reviews can be audited
+quickly. Snapshots are written by the menu if the file extension is `.npz` and
+can be opened like JSON states:
+
+    python -m myoloom --state review.npz
+"""
+
+from dataclasses import dataclass, field
+import json
+import zipfile
+from typing import Dict, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+import SimpleITK as sitk
+
+from .polar_map.state import AppState as PolarMapState
+from .state import AppState
+
+SNAPSHOT_EXTENSION = ".npz"
+SNAPSHOT_VERSION = 1
+IMAGES = ("sitk_img", "img_reoriented", "img_sa")
+POLAR_MAP_CONFIG = ("center_z", "pos_line_septal", "pos_line_lateral", "weighting")
+
+
+@dataclass
+class Snapshot:
+    """
+    Content of a snapshot.
+
+    Attributes
+    ----------
+    state: dict
+        the serialized app state
+    images: dict of str and sitk.Image
+        any of `IMAGES` and the short-axis image of the polar map (`polar_map_sa_image`)
+    polar_map: dict, optional
+        sampling parameters of the polar map (see `POLAR_MAP_CONFIG`)
+    radial_activities: NDArray, optional
+        radial activities of the polar map at full resolution
+    """
+
+    state: dict
+    images: Dict[str, sitk.Image] = field(default_factory=dict)
+    polar_map: Optional[dict] = None
+    radial_activities: Optional[NDArray] = None
+
+
+def is_snapshot(filename: str) -> bool:
+    """
+    Test if a file is a snapshot instead of a JSON state.
+    """
+    return zipfile.is_zipfile(filename)
+
+
+def create_snapshot(
+    app_state: AppState,
+    polar_map_state: Optional[PolarMapState] = None,
+    images: bool = True,
+) -> Snapshot:
+    """
+    Create a snapshot of the current review.
+
+    Parameters
+    ----------
+    app_state: AppState
+    polar_map_state: PolarMapState, optional
+    images: bool
+        include the derived images - otherwise the study
+        is loaded and resampled when the snapshot is restored
+    """
+    snapshot = Snapshot(app_state.serialize())
+    if images:
+        snapshot.images = {name: getattr(app_state, name).value for name in IMAGES}
+
+    if polar_map_state is None:
+        return snapshot
+
+    config = polar_map_state.config_view_state
+    snapshot.polar_map = {name: getattr(config, name).value for name in POLAR_MAP_CONFIG}
+
+    # the polar map is only updated after a delay and may not be up to date
+    if not images or polar_map_state.input_image.fingerprint != app_state.img_reoriented.fingerprint:
+        return snapshot
+
+    snapshot.images["polar_map_sa_image"] = polar_map_state.sa_image.value
+    snapshot.radial_activities = polar_map_state.full_radial_activities()
+    return snapshot
+
+
+def write_snapshot(filename: str, snapshot: Snapshot) -> None:
+    """
+    Write a snapshot as a compressed `.npz` file.
+
+    Images are stored as arrays with their spacing, origin and direction.
+    """
+    state = {"version": SNAPSHOT_VERSION, "app": snapshot.state, "polar_map": snapshot.polar_map}
+    arrays = {"state": np.frombuffer(json.dumps(state).encode("utf-8"), dtype=np.uint8)}
+    for name, image in snapshot.images.items():
+        arrays[name] = sitk.GetArrayViewFromImage(image)
+        arrays[f"{name}_spacing"] = np.array(image.GetSpacing())
+        arrays[f"{name}_origin"] = np.array(image.GetOrigin())
+        arrays[f"{name}_direction"] = np.array(image.GetDirection())
+    if snapshot.radial_activities is not None:
+        arrays["radial_activities"] = snapshot.radial_activities
+
+    np.savez_compressed(filename, **arrays)
+
+
+def read_snapshot(filename: str) -> Snapshot:
+    """
+    Read a snapshot written by `write_snapshot`.
+    """
+    with np.load(filename) as data:
+        state = json.loads(data["state"].tobytes().decode("utf-8"))
+        if state["version"] > SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Snapshot {filename} has version {state['version']}"
+                f" but only versions up to {SNAPSHOT_VERSION} are supported"
+            )
+
+        images = {}
+        for name in (*IMAGES, "polar_map_sa_image"):
+            if name not in data:
+                continue
+            image = sitk.GetImageFromArray(data[name])
+            image.SetSpacing(data[f"{name}_spacing"].tolist())
+            image.SetOrigin(data[f"{name}_origin"].tolist())
+            image.SetDirection(data[f"{name}_direction"].tolist())
+            images[name] = image
+
+        radial_activities = data["radial_activities"] if "radial_activities" in data else None
+
+    return Snapshot(state["app"], images, state["polar_map"], radial_activities)
+
+
+def restore_snapshot(
+    snapshot: Snapshot, app_state: AppState, polar_map_state: Optional[PolarMapState] = None
+) -> None:
+    """
+    Restore a review from a snapshot (see `AppState.restore` and `PolarMapState.restore`).
+    """
+    app_state.restore(snapshot.state, snapshot.images)
+
+    if polar_map_state is None or snapshot.polar_map is None:
+        return
+    polar_map_state.restore(
+        app_state.img_reoriented.value,
+        snapshot.polar_map,
+        sa_image=snapshot.images.get("polar_map_sa_image"),
+        radial_activities=snapshot.radial_activities,
+    )
+
+
+def save_state(
+    filename: str,
+    app_state: AppState,
+    polar_map_state: Optional[PolarMapState] = None,
+) -> None:
+    """
+    Save a review as a snapshot if the file extension is `SNAPSHOT_EXTENSION`
+    and as a JSON state otherwise.
+    """
+    if filename.endswith(SNAPSHOT_EXTENSION):
+        write_snapshot(filename, create_snapshot(app_state, polar_map_state))
+        return
+
+    with open(filename, mode="w") as f:
+        json.dump(app_state.serialize(), f, indent=2)
+
+
+def load_state(
+    filename: str,
+    app_state: AppState,
+    polar_map_state: Optional[PolarMapState] = None,
+) -> None:
+    """
+    Restore a review saved with `save_state` - either a snapshot or a JSON state.
+    """
+    if is_snapshot(filename):
+        restore_snapshot(read_snapshot(filename), app_state, polar_map_state)
+        return
+
+    with open(filename, mode="r") as f:
+        app_state.restore(json.load(f))
@@ -9,6 +9,7 @@ from .reorientation import (
     ReorientationState,
 )
 from .resolution import ResolutionState
+from .worklist import WorklistState
 
 __all__ = [
     "AngleState",
@@ -16,4 +17,5 @@ __all__ = [
     "CenterState",
     "ReorientationState",
     "ResolutionState",
+    "WorklistState",
 ]
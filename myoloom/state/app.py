@@ -1,8 +1,8 @@
-import time
+from typing import Dict, Optional, Tuple
 
-import numpy as np
 import SimpleITK as sitk
 from widget_state import (
+    BoolState,
     NumberState,
     HigherOrderState,
     StringState,
@@ -11,8 +11,10 @@ from widget_state import (
 
 from reacTk.decorator import asynchron
 
-from ..widget.slice_view import SITKData
-from ..util import load_image, square_pad, get_empty_image, is_short_axis
+from ..widget.slice_view import DerivedCache, SITKData, image_fingerprint
+from ..localization import estimate_reorientation
+from ..prefetch import Prefetcher
+from ..util import get_empty_image, reorient, to_short_axis
 from .reorientation import (
     AngleState,
     CenterState,
@@ -24,12 +26,35 @@ from .resolution import ResolutionState
 class AppState(HigherOrderState):
     def __init__(
         self,
+        prefetcher: Optional[Prefetcher] = None,
+        auto_reorientation: bool = True,
+        resampling_backend: str = "sitk",
     ):
+        """
+        Parameters
+        ----------
+        prefetcher: Prefetcher, optional
+            prefetcher used to load images - images are loaded
+            without caching if not provided
+        auto_reorientation: bool
+            estimate the reorientation automatically when an image is loaded
+        resampling_backend: str
+            backend used to reorient images (see `myoloom.resampling.BACKENDS`)
+        """
         super().__init__()
 
+        self._prefetcher = prefetcher if prefetcher is not None else Prefetcher(0)
+        self._resampling_backend = resampling_backend
+        # reoriented images are looked up before resampling (see `restore`)
+        self._derived = DerivedCache()
+        # image of a snapshot which replaces loading the file while restoring
+        self._restored_image: Optional[sitk.Image] = None
+        self._restoring = False
+
         self.filename = StringState("")
         self.clip_percentage = NumberState(1.0)
         self.rectangle_size = NumberState(8)
+        self.auto_reorientation = BoolState(auto_reorientation)
 
         self.sitk_img = SITKData(get_empty_image())
 
@@ -39,7 +64,7 @@ class AppState(HigherOrderState):
         )
 
         self.filename.on_change(lambda _: self.load_image())
-        self.sitk_img.on_change(lambda _: self.reset_reorientation())
+        self.sitk_img.on_change(lambda _: self.init_reorientation())
 
     def reset_reorientation(self):
         """
@@ -52,55 +77,93 @@ class AppState(HigherOrderState):
             state.angle.set(0.0, 0.0, 0.0)
             state.center.set(size[0] / 2.0, size[1] / 2.0, size[2] / 2.0)
 
+    def init_reorientation(self):
+        """
+        Initialize the reorientation of a newly loaded image.
+
+        The reorientation is estimated automatically (see `estimate_reorientation`)
+        if enabled and possible. Otherwise, it is reset.
+        """
+        # the reorientation of a restored state is kept
+        if self._restoring:
+            return
+
+        estimate = None
+        if self.auto_reorientation.value:
+            estimate = estimate_reorientation(self.sitk_img.value)
+
+        if estimate is None:
+            self.reset_reorientation()
+            return
+
+        with self.reorientation as state:
+            state.angle.set(*estimate.angles)
+            state.center.set(*estimate.center)
+
     def load_image(self):
         if self.filename.value == "":
             self.sitk_img.value = get_empty_image()
             return
 
-        if is_short_axis(self.filename.value):
-            """
-            To correctly display a short-axis image, we have to rotate the image
-            back to a transversal view and subsequently, apply the rotation angles
-            to the reorientation state.
-            """
-            sitk_img = load_image(self.filename.value)
-
-            # retrieve image center for rotation (around the center)
-            center_image_idx = list(map(lambda x: x / 2, sitk_img.GetSize()))
-            center_image_phys = sitk_img.TransformContinuousIndexToPhysicalPoint(
-                center_image_idx
-            )
+        if self._restored_image is not None:
+            self.sitk_img.value = self._restored_image
+            return
 
-            # retrieve rotation matrix (from transversal to short-axis)
-            rot_mat = np.array(sitk_img.GetDirection()).reshape((3, 3))
-
-            # rotate to transversal view (inverse rotation)
-            euler_trans = sitk.Euler3DTransform(center_image_phys)
-            euler_trans.SetMatrix(rot_mat.T.flatten())
-            sitk_img = sitk.Resample(
-                sitk_img,
-                euler_trans,
-                sitk.sitkLinear,
-                0.0,
-            )
-            # resample does not update the Direction, so we set this manually
-            sitk_img.SetDirection((1, 0, 0, 0, 1, 0, 0, 0, 1))
-
-            # update image
-            self.sitk_img.value = sitk_img
-
-            # update angles in reorientation state
-            euler_trans.SetMatrix(rot_mat.flatten())
-            with self.reorientation:
-                self.reorientation.angle.x.value = euler_trans.GetAngleX() + np.deg2rad(
-                    90
-                )  # we have to revert the -90° rotation around x which rotates a HLA into an SA image
-                # self.reorientation.angle.y.value = euler_trans.GetAngleY()
-                self.reorientation.angle.z.value = euler_trans.GetAngleZ()
+        prepared = self._prefetcher.get(self.filename.value)
+
+        # update image
+        self.sitk_img.value = prepared.sitk_img
+        if prepared.angles is None:
             return
 
-        self.sitk_img.value = square_pad(load_image(self.filename.value))
-        self.reset_reorientation()
+        # update angles in reorientation state of a short-axis image
+        with self.reorientation:
+            self.reorientation.angle.x.value = prepared.angles[0]
+            self.reorientation.angle.z.value = prepared.angles[1]
+
+    def restore(
+        self, serialized: dict, images: Optional[Dict[str, sitk.Image]] = None
+    ) -> None:
+        """
+        Restore a serialized state (see `serialize`) together with images
+        derived from it, e.g. stored in a snapshot (see `myoloom.snapshot`).
+
+        The image is not loaded from its file if `sitk_img` is provided and
+        the reorientation is not estimated. If the reoriented and short-axis
+        images are provided, they are used instead of resampling.
+
+        Parameters
+        ----------
+        serialized: dict
+        images: dict of str and sitk.Image, optional
+            images of `sitk_img`, `img_reoriented` and `img_sa`
+        """
+        images = {} if images is None else images
+
+        self._restoring = True
+        self._restored_image = images.get("sitk_img")
+        try:
+            # notifications of the image and the reorientation are deferred
+            # until both are restored, so that they are reoriented only once
+            with self.sitk_img, self.reorientation:
+                self.deserialize(serialized)
+
+                if "img_reoriented" not in images:
+                    return
+                img_reoriented = images["img_reoriented"]
+                self._derived.set("img_reoriented", self._reorientation_key(), img_reoriented)
+                if "img_sa" in images:
+                    self._derived.set("img_sa", image_fingerprint(img_reoriented), images["img_sa"])
+        finally:
+            self._restoring = False
+            self._restored_image = None
+
+    def _reorientation_key(self) -> Tuple:
+        return (
+            self.sitk_img.fingerprint,
+            tuple(self.reorientation.center.values()),
+            tuple(self.reorientation.angle.values()),
+        )
 
     @computed
     def sitk_img_saggital(self, sitk_img: SITKData) -> SITKData:
@@ -110,50 +173,31 @@ class AppState(HigherOrderState):
     def img_reoriented(
         self, sitk_img: SITKData, reorientation: ReorientationState
     ) -> SITKData:
-        since = time.time()
-        reoriented = sitk_img.value[:]
-
-        center_image = list(map(lambda x: x // 2, reoriented.GetSize()))
-        center_heart = list(reorientation.center.values())
-
-        center_image = np.array(
-            reoriented.TransformContinuousIndexToPhysicalPoint(center_image)
-        )
-        center_heart = np.array(
-            reoriented.TransformContinuousIndexToPhysicalPoint(center_heart)
-        )
-        offset = center_heart - center_image
-
-        translation = sitk.TranslationTransform(3, offset)
-        rotation = sitk.Euler3DTransform(center_image, *reorientation.angle.values())
-
-        resampled = sitk.Resample(
-            reoriented,
-            reoriented,
-            sitk.CompositeTransform([translation, rotation]),
-            sitk.sitkLinear,
-            0.0,
+        return SITKData(
+            self._derived.get(
+                "img_reoriented",
+                self._reorientation_key(),
+                lambda: reorient(
+                    sitk_img.value,
+                    center=tuple(reorientation.center.values()),
+                    angles=tuple(reorientation.angle.values()),
+                    backend=self._resampling_backend,
+                ),
+            )
         )
-        return SITKData(resampled)
 
     @computed
     def img_sa(self, img_reoriented: SITKData) -> SITKData:
         if img_reoriented.value is None:
             return SITKData(get_empty_image())
 
-        _img = img_reoriented.value[:]
-        _img = sitk.PermuteAxes(_img, (2, 0, 1))
-
-        center = _img.TransformContinuousIndexToPhysicalPoint(
-            np.array(_img.GetSize()) / 2.0
-        )
-        _img = sitk.Resample(
-            _img,
-            sitk.Euler3DTransform(center, 0.0, np.rad2deg(-90), 0.0),
-            sitk.sitkLinear,
-            0.0,
+        return SITKData(
+            self._derived.get(
+                "img_sa",
+                img_reoriented.fingerprint,
+                lambda: to_short_axis(img_reoriented.value, backend=self._resampling_backend),
+            )
         )
-        return SITKData(_img)
 
     @computed
     def img_vla(self, img_reoriented: SITKData) -> SITKData:
@@ -0,0 +1,102 @@
+import os
+from typing import List, Optional
+
+from widget_state import HigherOrderState, IntState, ObjectState, StringState
+
+from ..catalog import STUDY_VIEWS, Catalog
+from ..prefetch import Prefetcher
+
+
+def list_files(directory: str) -> List[str]:
+    """
+    List all (non-hidden) files in a directory in alphabetical order.
+    """
+    filenames = sorted(os.listdir(directory))
+    filenames = [os.path.join(directory, f) for f in filenames if not f.startswith(".")]
+    return list(filter(os.path.isfile, filenames))
+
+
+class WorklistState(HigherOrderState):
+    """
+    State of a worklist which allows navigating through a list of studies.
+
+    On navigation, the next studies of the worklist are prefetched.
+    """
+
+    def __init__(
+        self,
+        filename: StringState,
+        prefetcher: Optional[Prefetcher] = None,
+        n_prefetch: int = 3,
+        catalog: Optional[Catalog] = None,
+        filters: Optional[dict] = None,
+    ):
+        """
+        Parameters
+        ----------
+        filename: StringState
+            the filename of the currently displayed study which is
+            updated on navigation
+        prefetcher: Prefetcher, optional
+            prefetcher used to prepare the next studies in the background
+        n_prefetch: int
+            number of studies that are prefetched
+        catalog: Catalog, optional
+            catalog used to select the DICOM series of a directory tree
+            instead of listing the files of the directory
+        filters: dict, optional
+            filters of the series selected from the catalog (see `Catalog.query`)
+            - only studies which can be reoriented (see `STUDY_VIEWS`) by default
+        """
+        super().__init__()
+
+        self.filenames = ObjectState([])
+        self.index = IntState(0)
+        self.n_prefetch = IntState(n_prefetch)
+
+        self._filename = filename
+        self._prefetcher = prefetcher
+        self._catalog = catalog
+        self._filters = {"view": STUDY_VIEWS} if filters is None else filters
+
+        self.index.on_change(lambda _: self.open_current())
+
+    def set_files(self, filenames: List[str]) -> None:
+        """
+        Set the studies of the worklist and open the first one.
+
+        Parameters
+        ----------
+        filenames: list of str
+            either a list of files or a list containing a single directory
+        """
+        if len(filenames) == 1 and os.path.isdir(filenames[0]):
+            if self._catalog is None:
+                filenames = list_files(filenames[0])
+            else:
+                self._catalog.refresh(filenames[0])
+                filenames = self._catalog.filenames(filenames[0], **self._filters)
+
+        self.filenames.value = filenames
+        if self.index.value == 0:
+            self.open_current()
+        else:
+            self.index.value = 0
+
+    def open_current(self) -> None:
+        if len(self.filenames.value) == 0:
+            return
+
+        if self._prefetcher is not None:
+            start = self.index.value + 1
+            self._prefetcher.prefetch(
+                self.filenames.value[start : start + self.n_prefetch.value]
+            )
+
+        self._filename.value = self.filenames.value[self.index.value]
+
+    def next(self) -> None:
+        self.index.value = min(self.index.value + 1, len(self.filenames.value) - 1)
+
+    def previous(self) -> None:
+        self.index.value = max(self.index.value - 1, 0)
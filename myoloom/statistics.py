@@ -0,0 +1,104 @@
+"""
+Intensity statistics of images.
+
+Statistics are computed once per image (see `SITKData.statistics`) so that
+normalization, display and sampling do not repeatedly reduce full volumes.
+"""
+
+from functools import cached_property
+from typing import Any, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+import SimpleITK as sitk
+
+
+class IntensityStatistics:
+    """
+    Intensity statistics of an image.
+
+    The minimum and maximum are computed on creation. The histogram
+    (and thus percentiles) is computed on first access because it is
+    considerably more expensive.
+
+    Parameters
+    ----------
+    img: NDArray
+        the image - it must not be modified afterwards
+    bins: int
+        number of bins of the histogram
+    owner: object, optional
+        owner of the memory of `img` if it is a view, e.g. an SITK image
+        (see `from_image`), which is kept alive for the lazy statistics
+    """
+
+    def __init__(self, img: NDArray, bins: int = 1024, owner: Optional[Any] = None):
+        self._img = img
+        self._owner = owner
+        self.bins = bins
+
+        self.min = float(img.min())
+        self.max = float(img.max())
+
+    @classmethod
+    def from_image(cls, sitk_img: sitk.Image, bins: int = 1024) -> "IntensityStatistics":
+        """
+        Statistics of an SITK image which are computed on a view of its
+        data without copying - the image is kept alive by the statistics.
+        """
+        return cls(sitk.GetArrayViewFromImage(sitk_img), bins=bins, owner=sitk_img)
+
+    @property
+    def is_constant(self) -> bool:
+        return self.max == self.min
+
+    @cached_property
+    def bin_edges(self) -> NDArray:
+        return np.linspace(self.min, self.max, self.bins + 1)
+
+    @cached_property
+    def histogram(self) -> NDArray:
+        """
+        Number of voxels per bin (see `bin_edges`).
+        """
+        if self.is_constant:
+            histogram = np.zeros(self.bins, dtype=np.intp)
+            histogram[0] = self._img.size
+            return histogram
+
+        idx = ((self._img - self.min) * (self.bins / (self.max - self.min))).astype(np.intp)
+        np.minimum(idx, self.bins - 1, out=idx)
+        return np.bincount(idx.ravel(), minlength=self.bins)
+
+    @cached_property
+    def _cdf(self) -> NDArray:
+        return np.cumsum(self.histogram) / self._img.size
+
+    def percentile(self, q: float) -> float:
+        """
+        Approximate a percentile of the intensities from the histogram.
+
+        The approximation error is at most the width of a bin.
+
+        Parameters
+        ----------
+        q: float
+            percentile in [0, 100]
+
+        Returns
+        -------
+        float
+        """
+        if self.is_constant:
+            return self.min
+
+        cdf = self._cdf
+        idx = min(int(np.searchsorted(cdf, q / 100.0, side="left")), self.bins - 1)
+
+        # interpolate linearly within the bin
+        lower = cdf[idx - 1] if idx > 0 else 0.0
+        fraction = (q / 100.0 - lower) / max(cdf[idx] - lower, 1e-12)
+        fraction = min(max(fraction, 0.0), 1.0)
+
+        bin_edges = self.bin_edges
+        return float(bin_edges[idx] + fraction * (bin_edges[idx + 1] - bin_edges[idx]))
@@ -0,0 +1,85 @@
+"""
+Classification of DICOM files in the catalog (see `myoloom.catalog`).
+
+Run with:
+
+    python -m pytest myoloom/test_catalog.py
+"""
+
+import os
+
+import pytest
+
+from myoloom.catalog import STUDY_VIEWS, Catalog, read_series_info
+from myoloom.phantom import lv_phantom, write_dicom
+
+
+@pytest.fixture(scope="module")
+def filename(tmp_path_factory) -> str:
+    filename = str(tmp_path_factory.mktemp("dicom") / "image.dcm")
+    write_dicom(lv_phantom(32), filename)
+    return filename
+
+
+def truncate(filename: str, target: str, size: int) -> str:
+    with open(filename, "rb") as f:
+        data = f.read(size)
+    with open(target, "wb") as f:
+        f.write(data)
+    return target
+
+
+def test_read_series_info(filename: str):
+    info = read_series_info(filename, 0.0, os.path.getsize(filename))
+    assert info.dicom
+    assert info.series_uid is not None
+    assert info.view == "transversal"
+
+
+@pytest.mark.parametrize("size", [400, 1500, 20000])
+def test_truncated(filename: str, tmp_path, size: int):
+    truncated = truncate(filename, str(tmp_path / "truncated.dcm"), size)
+    assert not read_series_info(truncated, 0.0, size).dicom
+
+
+def test_refresh(filename: str, tmp_path):
+    truncate(filename, str(tmp_path / "truncated.dcm"), 400)
+    truncate(filename, str(tmp_path / "image.dcm"), os.path.getsize(filename))
+    with open(tmp_path / "corrupt.dcm", "wb") as f:
+        f.write(b"\0" * 128 + b"DICM" + b"\xff" * 64)
+    # a valid header whose number of frames (0028,0008) is not a number
+    with open(filename, "rb") as f:
+        data = f.read()
+    invalid = data.replace(b"\x28\x00\x08\x00IS\x02\x0032", b"\x28\x00\x08\x00IS\x02\x00xx")
+    assert invalid != data
+    with open(tmp_path / "invalid.dcm", "wb") as f:
+        f.write(invalid)
+
+    with Catalog(":memory:") as catalog:
+        assert catalog.refresh(str(tmp_path)) == (4, 0, 0)
+        assert catalog.filenames(str(tmp_path)) == [str(tmp_path / "image.dcm")]
+
+
+def test_query(tmp_path):
+    image = lv_phantom(32)
+    for patient_id in ("p1", "p2"):
+        for study in ("stress", "rest"):
+            attributes = {"PatientID": patient_id, "SeriesDescription": f"MPI {study}"}
+            basename = str(tmp_path / f"{patient_id}_{study}")
+            write_dicom(image, f"{basename}.dcm", attributes=attributes)
+            write_dicom(image, f"{basename}_hla.dcm", attributes=attributes, view="hla")
+    # a stress series without a rest series
+    attributes = {"PatientID": "p3", "SeriesDescription": "Stress"}
+    write_dicom(image, str(tmp_path / "p3_stress.dcm"), attributes=attributes)
+
+    with Catalog(":memory:") as catalog:
+        catalog.refresh(str(tmp_path))
+
+        filenames = catalog.filenames(str(tmp_path), view=STUDY_VIEWS, study="rest")
+        assert filenames == [str(tmp_path / f"{p}_rest.dcm") for p in ("p1", "p2")]
+        assert len(catalog.filenames(str(tmp_path), view="horizontal_long_axis")) == 4
+
+        assert catalog.pairs(str(tmp_path), view=STUDY_VIEWS) == [
+            (str(tmp_path / f"{p}_stress.dcm"), str(tmp_path / f"{p}_rest.dcm"))
+            for p in ("p1", "p2")
+        ]
@@ -0,0 +1,39 @@
+"""
+Naming of exported studies (see `myoloom.export`).
+
+Run with:
+
+    python -m pytest myoloom/test_export.py
+"""
+
+import os
+
+import pytest
+
+from myoloom.export import study_names
+
+
+def test_study_names():
+    filenames = ["1.2.840.113619.2.55.1.dcm", "1.2.840.113619.2.55.2.dcm", "study.nii.gz"]
+    assert list(study_names(filenames).values()) == [
+        "1.2.840.113619.2.55.1",
+        "1.2.840.113619.2.55.2",
+        "study",
+    ]
+
+
+def test_study_names_of_subdirectories():
+    filenames = [os.path.join("data", "p1", "image.dcm"), os.path.join("data", "p2", "image.dcm")]
+    assert list(study_names(filenames).values()) == ["p1_image", "p2_image"]
+
+
+@pytest.mark.parametrize(
+    "filenames",
+    [
+        ["image.dcm", "image.dcm"],
+        [os.path.join("a", "b.dcm"), "a_b.dcm", os.path.join("c", "b.dcm")],
+    ],
+)
+def test_duplicate_study_names(filenames: list):
+    with pytest.raises(ValueError):
+        study_names(filenames)
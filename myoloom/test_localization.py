@@ -0,0 +1,75 @@
+"""
+Estimation of the reorientation and the sampling parameters (see `myoloom.localization`).
+
+Run with:
+
+    python -m pytest myoloom/test_localization.py
+"""
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from myoloom.localization import (
+    APEX_DIRECTION,
+    estimate_reorientation,
+    estimate_sampling_params,
+    long_axis_angles,
+)
+from myoloom.phantom import lv_phantom
+from myoloom.pipeline import polar_map_image
+from myoloom.util import reorient
+
+
+@pytest.mark.parametrize(
+    "direction", [tuple(APEX_DIRECTION), (1.0, -0.6, -1.2), (1.2, -1.0, -0.7)]
+)
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"noise": 0.1, "seed": 0},
+        {"fwhm": 8.0, "noise": 0.1, "seed": 1},
+        {"extracardiac": 0.3, "fwhm": 8.0},
+    ],
+)
+def test_reorientation(direction, kwargs):
+    size, field_of_view, offset = 64, 300.0, np.array([10.0, -5.0, 10.0])
+    phantom = lv_phantom(
+        size, field_of_view=field_of_view, offset=tuple(offset), direction=direction, **kwargs
+    )
+    estimate = estimate_reorientation(phantom)
+    assert estimate is not None
+
+    # heart center of the phantom as a continuous index (see `lv_phantom`)
+    spacing = field_of_view / size
+    center = (np.array([size] * 3) / 2.0) * spacing + offset
+    assert np.abs(np.array(estimate.center) - center / spacing).max() < 0.5
+    assert np.abs(np.array(estimate.angles) - long_axis_angles(np.array(direction))).max() < 0.03
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"fwhm": 8.0},
+        {"noise": 0.1, "seed": 0},
+        {"noise": 0.1, "seed": 1},
+        {"fwhm": 10.0, "noise": 0.1, "seed": 2},
+        {"fwhm": 10.0, "noise": 0.1, "seed": 4},
+    ],
+)
+def test_sampling_params(kwargs):
+    phantom = lv_phantom(64, **kwargs)
+    estimate = estimate_reorientation(phantom)
+    assert estimate is not None
+
+    sa_image = polar_map_image(reorient(phantom, estimate.center, estimate.angles))
+    config = estimate_sampling_params(sitk.GetArrayFromImage(sa_image))
+    assert config is not None
+
+    # the base of the phantom is perpendicular to its long axis, but noise may
+    # shift the septal base beyond the lateral base, which the lines of the
+    # `ConfigView` cannot be dragged to
+    assert config["center_z"] < config["pos_line_septal"] <= config["pos_line_lateral"]
+    assert config["pos_line_lateral"] - config["pos_line_septal"] <= 1
@@ -0,0 +1,40 @@
+"""
+Expected segment scores of phantoms (see `myoloom.phantom`).
+
+Run with:
+
+    python -m pytest myoloom/test_phantom.py
+"""
+
+import numpy as np
+import pytest
+
+from myoloom.phantom import Defect, expected_segment_scores, random_phantom
+from myoloom.pipeline import process_image
+
+# maximal deviation of a segment score and of the mean over all segments
+# caused by noise of 5% of the myocardial activity
+NOISE_TOLERANCE = 12
+MEAN_NOISE_TOLERANCE = 5
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_expected_segment_scores(seed: int):
+    rng = np.random.default_rng(seed)
+    sitk_img, defects, direction = random_phantom(rng, n_defects=2, noise=0.05)
+
+    expected = np.array(expected_segment_scores(defects, direction=direction))
+    scores = np.array(process_image("phantom", sitk_img).segment_scores)
+
+    difference = np.abs(scores - expected)
+    assert difference.max() <= NOISE_TOLERANCE
+    assert difference.mean() <= MEAN_NOISE_TOLERANCE
+
+
+@pytest.mark.parametrize("segment", [1, 9, 14, 17])
+def test_defect(segment: int):
+    reference = np.array(expected_segment_scores())
+    scores = np.array(expected_segment_scores([Defect(segment, severity=0.6)]))
+
+    # partial volume effects and the normalization reduce the contrast of the defect
+    assert reference[segment - 1] - scores[segment - 1] >= 30
@@ -0,0 +1,89 @@
+"""
+Equivalence of the resampling backends (see `myoloom.resampling`).
+
+Run with:
+
+    python -m pytest myoloom/test_resampling.py
+"""
+
+import numpy as np
+from numpy.typing import NDArray
+import pytest
+import SimpleITK as sitk
+
+from myoloom.phantom import lv_phantom
+from myoloom.resampling import resample_linear
+from myoloom.util import reorient, to_short_axis
+
+# sub-pixel precision of `cv.remap` - coordinates are rounded to 1/32 of a voxel
+REMAP_PRECISION = 1.0 / 32
+
+
+def remap_tolerance(array: NDArray) -> float:
+    """
+    Maximal difference between the backends when resampling an array.
+
+    `cv.remap` rounds the x and y index of each sample by at most half of its
+    precision, which changes a bilinear interpolation by at most this offset
+    times the largest difference between neighboring voxels along each axis.
+    The z axis is interpolated in floating point by both backends.
+    """
+    array = array.astype(np.float64)
+    steps = [np.abs(np.diff(array, axis=axis)).max() for axis in (1, 2)]
+    rounding = 1e-5 * np.abs(array).max()
+    return 0.5 * REMAP_PRECISION * sum(steps) + rounding
+
+
+@pytest.fixture(scope="module")
+def phantom() -> sitk.Image:
+    return lv_phantom(64, fwhm=8.0, noise=0.05, seed=0)
+
+
+def assert_equivalent(expected: sitk.Image, actual: sitk.Image, tolerance: float):
+    assert actual.GetSize() == expected.GetSize()
+    assert actual.GetSpacing() == expected.GetSpacing()
+    difference = np.abs(
+        sitk.GetArrayViewFromImage(expected).astype(np.float64)
+        - sitk.GetArrayViewFromImage(actual)
+    )
+    assert difference.max() <= tolerance
+
+
+@pytest.mark.parametrize(
+    "angles", [(0.0, 0.0, 0.0), (-0.6, 0.0, 2.3), (0.35, 0.0, -1.2)]
+)
+def test_reorient(phantom: sitk.Image, angles):
+    center = (30.5, 33.0, 31.25)
+    assert_equivalent(
+        reorient(phantom, center, angles),
+        reorient(phantom, center, angles, backend="opencv"),
+        remap_tolerance(sitk.GetArrayViewFromImage(phantom)),
+    )
+
+
+def test_to_short_axis(phantom: sitk.Image):
+    reoriented = reorient(phantom, (30.5, 33.0, 31.25), (-0.6, 0.0, 2.3))
+    assert_equivalent(
+        to_short_axis(reoriented),
+        to_short_axis(reoriented, backend="opencv"),
+        remap_tolerance(sitk.GetArrayViewFromImage(reoriented)),
+    )
+
+
+def test_reference_grid(phantom: sitk.Image):
+    # a finer and shifted output grid, partially outside of the image
+    reference = sitk.Image([80, 72, 40], sitk.sitkFloat32)
+    reference.SetSpacing((3.0, 3.5, 5.0))
+    reference.SetOrigin((-20.0, 15.0, 30.0))
+    transform = sitk.Euler3DTransform((150.0, 150.0, 150.0), 0.2, -0.1, 0.4)
+
+    assert_equivalent(
+        resample_linear(phantom, transform, reference, default_value=-1.0),
+        resample_linear(phantom, transform, reference, default_value=-1.0, backend="opencv"),
+        remap_tolerance(sitk.GetArrayViewFromImage(phantom)),
+    )
+
+
+def test_unknown_backend(phantom: sitk.Image):
+    with pytest.raises(ValueError):
+        resample_linear(phantom, sitk.Transform(3, sitk.sitkIdentity), backend="numpy")
@@ -0,0 +1,55 @@
+"""
+Sampling of polar representations (see `myoloom.polar_map.sampling`).
+
+Run with:
+
+    python -m pytest myoloom/test_sampling.py
+"""
+
+import numpy as np
+from numpy.typing import NDArray
+import pytest
+import SimpleITK as sitk
+
+from myoloom.localization import estimate_reorientation, estimate_sampling_params
+from myoloom.phantom import Defect, lv_phantom
+from myoloom.pipeline import polar_map_image
+from myoloom.polar_map.sampling import (
+    cached_polar_grid,
+    grid_params,
+    sample_polar_rep,
+    sample_polar_reps,
+)
+from myoloom.util import reorient
+
+
+def short_axis_image(phantom: sitk.Image) -> NDArray:
+    estimate = estimate_reorientation(phantom)
+    sa_image = polar_map_image(reorient(phantom, estimate.center, estimate.angles))
+    return sitk.GetArrayFromImage(sa_image)
+
+
+@pytest.fixture(scope="module")
+def images() -> list:
+    return [
+        short_axis_image(lv_phantom(64, fwhm=8.0)),
+        short_axis_image(
+            lv_phantom(64, defects=[Defect("apex", 0.6)], extracardiac=0.3, noise=0.1, seed=0)
+        ),
+    ]
+
+
+@pytest.mark.parametrize("radii_step, azimuth_step", [(0.2, 1.0), (1.0, 6.0)])
+def test_sample_polar_reps(images, radii_step: float, azimuth_step: float):
+    params = grid_params(**estimate_sampling_params(images[0]))
+    kwargs = dict(radii_step=radii_step, azimuth_step=azimuth_step, **params)
+
+    # the grid exceeds the first slice, so that the apex is sampled at the border
+    grid_z = cached_polar_grid(images[0].shape, **kwargs)[0]
+    assert grid_z.min() < 0
+
+    expected = [sample_polar_rep(image, **kwargs) for image in images]
+    for order in (slice(None), slice(None, None, -1)):
+        polar_reps = sample_polar_reps(images[order], **kwargs)
+        for polar_rep, _expected in zip(polar_reps, expected[order]):
+            np.testing.assert_allclose(polar_rep, _expected, rtol=1e-10, atol=1e-10)
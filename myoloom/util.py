@@ -2,14 +2,18 @@
 Utility functions that mainly are about image operations.
 """
 
-import math
-from typing import Optional, Tuple
+from typing import Optional, Sequence, Tuple
 
 import numpy as np
+from numpy.typing import NDArray
 from PIL import Image, ImageTk
 import pydicom
 import SimpleITK as sitk
 
+from .metrics import timed
+from .resampling import resample_linear
+from .statistics import IntensityStatistics
+
 
 def change_spacing(
     sitk_img: sitk.Image,
@@ -119,12 +123,75 @@ def center_pad(
     return sitk.ConstantPad(sitk_img, lowerPad, upperPad, value)
 
 
+def extract_region(
+    sitk_img: sitk.Image,
+    index: Sequence[int],
+    size: Sequence[int],
+    value: float = 0,
+) -> sitk.Image:
+    """
+    Extract a region of an SITK image which may exceed the image in a single pass.
+
+    Only the part of the region overlapping the image is copied
+    (`sitk.RegionOfInterest`) and the remainder is padded with a
+    constant value at once (`sitk.ConstantPad`), so that no intermediate
+    image of the full padded size is allocated. The image itself is
+    returned if the region equals the image.
+
+    Note: in contrast to `pad_crop`, the index and size are in SITK channel order.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+    index: sequence of int
+        first index of the region - negative values lie before the image
+    size: sequence of int
+        size of the region, which has to overlap the image
+    value: float
+        value used for padding
+
+    Returns
+    -------
+    sitk.Image
+    """
+    source_shape = np.array(sitk_img.GetSize())
+    index = np.array(index)
+    size = np.array(size)
+
+    lower = np.clip(index, 0, source_shape)
+    upper = np.clip(index + size, 0, source_shape)
+    if np.any(upper <= lower):
+        raise ValueError(f"Region {index.tolist()} of size {size.tolist()} is outside of the image")
+
+    if np.any(lower > 0) or np.any(upper < source_shape):
+        sitk_img = sitk.RegionOfInterest(sitk_img, (upper - lower).tolist(), lower.tolist())
+
+    lower_pad = lower - index
+    upper_pad = index + size - upper
+    if np.any(lower_pad > 0) or np.any(upper_pad > 0):
+        sitk_img = sitk.ConstantPad(sitk_img, lower_pad.tolist(), upper_pad.tolist(), value)
+    return sitk_img
+
+
+def _center_index(source_shape: NDArray, target_shape: NDArray) -> NDArray:
+    """
+    First index of the region of `center_pad` followed by `center_crop` (in SITK channel order).
+
+    The larger half of a difference is padded before and cropped
+    after the image for odd differences.
+    """
+    diff = source_shape - target_shape
+    return np.where(diff > 0, np.ceil(diff / 2), np.floor(diff / 2)).astype(int)
+
+
+@timed("pad_crop")
 def pad_crop(
     sitk_img: sitk.Image, target_shape: Tuple[int, int, int], value: float = 0
 ) -> sitk.Image:
     """
-    First `center_pad` and then `center_crop` a SITK image to a target
-    shape.
+    Center pad and crop a SITK image to a target shape - equivalent to
+    first `center_pad` and then `center_crop` but in a single pass
+    (see `extract_region`).
 
     Note: channel order in the target shape corresponds to numpy channel
     order and channels with negative target values will not be padded.
@@ -140,7 +207,42 @@ def pad_crop(
     -------
     sitk.Image
     """
-    return center_crop(center_pad(sitk_img, target_shape, value), target_shape)
+    source_shape = np.array(sitk_img.GetSize())
+    # channel order is inverted between sitk images and numpy arrays
+    target_shape = np.array(target_shape)[::-1]
+    target_shape = np.where(target_shape < 0, source_shape, target_shape)
+
+    index = _center_index(source_shape, target_shape)
+    return extract_region(sitk_img, index, target_shape, value)
+
+
+@timed("square_pad_crop")
+def square_pad_crop(
+    sitk_img: sitk.Image, target_shape: Tuple[int, int, int], value: float = 0
+) -> sitk.Image:
+    """
+    First `square_pad` and then `pad_crop` a SITK image to a target shape in a single pass.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+    target_shape: tuple of int
+        see `pad_crop`
+    value: float
+        value used for padding
+
+    Returns
+    -------
+    sitk.Image
+    """
+    source_shape = np.array(sitk_img.GetSize())
+    square_shape = np.full_like(source_shape, source_shape.max())
+    target_shape = np.array(target_shape)[::-1]
+    target_shape = np.where(target_shape < 0, square_shape, target_shape)
+
+    # the index of the region in the square image is shifted by the square padding
+    index = _center_index(square_shape, target_shape) + _center_index(source_shape, square_shape)
+    return extract_region(sitk_img, index, target_shape, value)
 
 
 def resample(
@@ -169,6 +271,192 @@ def resample(
     )
 
 
+@timed("reorient")
+def reorient(
+    sitk_img: sitk.Image,
+    center: Tuple[float, float, float],
+    angles: Tuple[float, float, float],
+    backend: str = "sitk",
+) -> sitk.Image:
+    """
+    Reorient an image so that the heart is centered and its long axis
+    is aligned as in a horizontal long axis view.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+        the image in transversal view
+    center: tuple of float
+        heart center as a continuous index
+    angles: tuple of float
+        rotation around the x, y, and z axes in radians
+    backend: str
+        resampling backend (see `myoloom.resampling.BACKENDS`)
+
+    Returns
+    -------
+    sitk.Image
+    """
+    return resample_linear(
+        sitk_img, reorientation_transform(sitk_img, center, angles), backend=backend
+    )
+
+
+def reorientation_transform(
+    sitk_img: sitk.Image,
+    center: Tuple[float, float, float],
+    angles: Tuple[float, float, float],
+) -> sitk.CompositeTransform:
+    """
+    Transform used by `reorient` which maps physical points of
+    the reoriented image to physical points of the image.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+    center, angles:
+        see `reorient`
+
+    Returns
+    -------
+    sitk.CompositeTransform
+    """
+    center_image = list(map(lambda x: x // 2, sitk_img.GetSize()))
+
+    center_image = np.array(sitk_img.TransformContinuousIndexToPhysicalPoint(center_image))
+    center_heart = np.array(sitk_img.TransformContinuousIndexToPhysicalPoint(center))
+    offset = center_heart - center_image
+
+    translation = sitk.TranslationTransform(3, offset)
+    rotation = sitk.Euler3DTransform(center_image, *angles)
+    return sitk.CompositeTransform([translation, rotation])
+
+
+@timed("to_short_axis")
+def to_short_axis(sitk_img: sitk.Image, backend: str = "sitk") -> sitk.Image:
+    """
+    Convert a reoriented image (see `reorient`) into short axis view.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+    backend: str
+        resampling backend (see `myoloom.resampling.BACKENDS`)
+
+    Returns
+    -------
+    sitk.Image
+    """
+    return resample_linear(
+        sitk.PermuteAxes(sitk_img, (2, 0, 1)),
+        short_axis_transform(sitk_img),
+        backend=backend,
+    )
+
+
+def short_axis_transform(sitk_img: sitk.Image) -> sitk.Euler3DTransform:
+    """
+    Transform used by `to_short_axis` which maps physical points of the
+    short-axis image to physical points of the reoriented image.
+
+    Permuting the axes of the reoriented image does not change the physical
+    points of its voxels, so that only this rotation about the image center remains.
+    """
+    center = sitk_img.TransformContinuousIndexToPhysicalPoint(
+        np.array(sitk_img.GetSize()) / 2.0
+    )
+    return sitk.Euler3DTransform(center, 0.0, np.rad2deg(-90), 0.0)
+
+
+def is_axis_aligned(sitk_img: sitk.Image, tolerance: float = 1e-6) -> bool:
+    """
+    Test if the direction of an image only permutes and flips the axes.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+    tolerance: float
+        absolute tolerance of the entries of the direction matrix
+
+    Returns
+    -------
+    bool
+    """
+    direction = np.abs(np.array(sitk_img.GetDirection()).reshape((3, 3)))
+    return bool(np.all((direction < tolerance) | (direction > 1.0 - tolerance)))
+
+
+def short_axis_angles(direction: Tuple[float, ...]) -> Tuple[float, float]:
+    """
+    Compute the reorientation angles of a short-axis image from its direction.
+
+    Parameters
+    ----------
+    direction: tuple of float
+        direction of a short-axis image, which is the rotation from the transversal view
+
+    Returns
+    -------
+    tuple of float
+        the rotation angles around the x and z axes which have to be applied
+        to the reorientation state to obtain the short-axis view
+    """
+    euler_trans = sitk.Euler3DTransform()
+    euler_trans.SetMatrix(tuple(np.array(direction, dtype=float).flatten()))
+    return (
+        # we have to revert the -90° rotation around x which rotates a HLA into an SA image
+        euler_trans.GetAngleX() + np.deg2rad(90),
+        euler_trans.GetAngleZ(),
+    )
+
+
+def to_transversal(
+    sitk_img: sitk.Image, backend: str = "sitk"
+) -> Tuple[sitk.Image, Tuple[float, float]]:
+    """
+    Rotate a short-axis image back to a transversal view.
+
+    If the direction only permutes and flips the axes (see `is_axis_aligned`),
+    the voxels are rearranged exactly instead of being interpolated.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+        a short-axis image whose direction is the rotation from the transversal view
+    backend: str
+        resampling backend (see `myoloom.resampling.BACKENDS`)
+
+    Returns
+    -------
+    sitk.Image
+        the image in transversal view
+    tuple of float
+        the rotation angles around the x and z axes which have to be applied
+        to the reorientation state to obtain the short-axis view again
+    """
+    # retrieve rotation matrix (from transversal to short-axis)
+    rot_mat = np.array(sitk_img.GetDirection()).reshape((3, 3))
+    angles = short_axis_angles(rot_mat)
+
+    if is_axis_aligned(sitk_img):
+        transversal = sitk.DICOMOrient(sitk_img, "LPS")
+    else:
+        # retrieve image center for rotation (around the center)
+        center_image_idx = list(map(lambda x: x / 2, sitk_img.GetSize()))
+        center_image_phys = sitk_img.TransformContinuousIndexToPhysicalPoint(
+            center_image_idx
+        )
+
+        # rotate to transversal view (inverse rotation)
+        euler_trans = sitk.Euler3DTransform(center_image_phys)
+        euler_trans.SetMatrix(rot_mat.T.flatten())
+        transversal = resample_linear(sitk_img, euler_trans, backend=backend)
+
+    # resample does not update the Direction, so we set this manually
+    transversal.SetDirection((1, 0, 0, 0, 1, 0, 0, 0, 1))
+    return transversal, angles
+
+
 def get_empty_image(
     size: Tuple[int, int, int] = (96, 96, 96),
     spacing: Tuple[float, float, float] = (4.0, 4.0, 4.0),
@@ -190,6 +478,7 @@ def get_empty_image(
     return sitk_img
 
 
+@timed("load_image")
 def load_image(filename: str, target_range: float = 300) -> sitk.Image:
     """
     Load an SITK image from a filename.
@@ -220,7 +509,32 @@ def load_image(filename: str, target_range: float = 300) -> sitk.Image:
     _sitk_img = sitk_reader.Execute()
 
     # on casting and other operations the meta information is removed
-    sitk_img = _sitk_img[:]
+    return correct_image(_sitk_img[:], _sitk_img, target_range=target_range)
+
+
+def correct_image(
+    sitk_img: sitk.Image, header, target_range: float = 300
+) -> sitk.Image:
+    """
+    Apply the corrections of `load_image` to an image read from a file.
+
+    This is separated from `load_image` so that images which are not read
+    as a whole, e.g. the gates of a gated study (see `myoloom.gated`), are
+    corrected in the same way.
+
+    Parameters
+    ----------
+    sitk_img: sitk.Image
+        the image (without meta information)
+    header: sitk.Image or sitk.ImageFileReader
+        provides the meta information of the file with `GetMetaData`
+    target_range: float
+        see `load_image`
+
+    Returns
+    -------
+    sitk.Image
+    """
     sitk_img = sitk.Cast(sitk_img, sitk.sitkFloat64)
 
     try:
@@ -228,7 +542,7 @@ def load_image(filename: str, target_range: float = 300) -> sitk.Image:
         Change the stacking direction of slices in an image based
         on the tag "SpacingBetweenSlices=0x00180088".
         """
-        spacing_between_slices = float(_sitk_img.GetMetaData("0018|0088"))
+        spacing_between_slices = float(header.GetMetaData("0018|0088"))
         if spacing_between_slices < 0:
             sitk_img = sitk_img[:, :, ::-1]
     except RuntimeError:
@@ -238,7 +552,7 @@ def load_image(filename: str, target_range: float = 300) -> sitk.Image:
         """
         Rescale if the header contains the privat tag "PixelScaleFactor=0x00331038".
         """
-        scale = float(_sitk_img.GetMetaData("0033|1038"))
+        scale = float(header.GetMetaData("0033|1038"))
         sitk_img = 1.0 * sitk_img / scale
     except RuntimeError:
         pass
@@ -251,20 +565,18 @@ def load_image(filename: str, target_range: float = 300) -> sitk.Image:
         In these cases the spacing is twice the thickness, which is wrong, but it is
         used by SimpleITK. This code ensures that the thickness will be used instead.
         """
-        _ = _sitk_img.GetMetaData(
+        _ = header.GetMetaData(
             "0018|0088"
         )  # test if `SpacingBetweenSlices` is available
-        slice_thickness = float(_sitk_img.GetMetaData("0018|0050"))
+        slice_thickness = float(header.GetMetaData("0018|0050"))
 
         sitk_img.SetSpacing((*sitk_img.GetSpacing()[:2], slice_thickness))
     except RuntimeError as e:
         pass
 
-    sitk_img = square_pad(sitk_img)
-
     target_shape = round(target_range / sitk_img.GetSpacing()[0])
     target_shape = (target_shape,) * 3
-    sitk_img = pad_crop(sitk_img, target_shape=target_shape)
+    sitk_img = square_pad_crop(sitk_img, target_shape=target_shape)
 
     return sitk_img
 
@@ -286,20 +598,20 @@ def square_pad(sitk_img: sitk.Image, pad_value: float = 0.0) -> sitk.Image:
     -------
     sitk.Image
     """
-    max_size = max(sitk_img.GetSize())
-
-    padding_lower = []
-    padding_upper = []
-    for s in sitk_img.GetSize():
-        padding_lower.append(math.ceil((max_size - s) / 2))
-        padding_upper.append(math.floor((max_size - s) / 2))
-
-    return sitk.ConstantPad(
-        sitk_img, tuple(padding_lower), tuple(padding_upper), pad_value
+    source_shape = np.array(sitk_img.GetSize())
+    square_shape = np.full_like(source_shape, source_shape.max())
+    return extract_region(
+        sitk_img, _center_index(source_shape, square_shape), square_shape, pad_value
     )
 
 
-def normalize_image(img: np.array, clip: Optional[float] = None) -> np.array:
+@timed("normalize_image")
+def normalize_image(
+    img: np.array,
+    clip: Optional[float] = None,
+    statistics: Optional[IntensityStatistics] = None,
+    clip_percentile: Optional[float] = None,
+) -> np.array:
     """
     Normalize an image and convert its type to `np.uint8` for display.
 
@@ -309,18 +621,29 @@ def normalize_image(img: np.array, clip: Optional[float] = None) -> np.array:
         the image to be normalized
     clip: optional float
         clip the maximum value in the image to this value before normalization
+    statistics: IntensityStatistics, optional
+        statistics of the image - computed if not provided
+    clip_percentile: optional float
+        clip the maximum value to this percentile (in [0, 100]) of the intensities
+        instead of `clip` - it is determined from the histogram of the statistics
 
     Returns
     -------
     np.array
     """
-    if img.max() - img.min() == 0.0:
+    statistics = IntensityStatistics(img) if statistics is None else statistics
+    if clip_percentile is not None:
+        clip = statistics.percentile(clip_percentile)
+
+    lower = statistics.min
+    upper = statistics.max if clip is None else min(max(clip, lower), statistics.max)
+    if upper - lower == 0.0:
         return np.zeros(img.shape, np.uint8)
 
-    img = np.clip(img, a_min=img.min(), a_max=clip)
-    img = (img - img.min()) / (img.max() - img.min())
-    img = (255 * img).astype(np.uint8)
-    return img
+    img = np.clip(img.astype(np.float64, copy=False), a_min=lower, a_max=upper)
+    img -= lower
+    img *= 255.0 / (upper - lower)
+    return img.astype(np.uint8)
 
 
 def is_short_axis(filename: str) -> bool:
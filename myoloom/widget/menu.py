@@ -2,29 +2,37 @@
 Components of the menu bar.
 """
 
-import json
 import os
+from typing import Optional
 
 import pandas as pd
 import tkinter as tk
 from tkinter import filedialog
 
+from ..export import FORMATS, dicom_attributes, reoriented_views, write_views
+from ..metrics import timer
 from ..polar_map.polar_map import polar_map_state
-from ..state import AppState
+from ..polar_map.state import AppState as PolarMapAppState
+from ..snapshot import load_state, save_state
+from ..state import AppState, WorklistState
 from .file_dialog import FileDialog
+from .metrics_view import MetricsView
 
 
 class MenuFile(tk.Menu):
     """
     The File menu containing options to
       * open an image
-      * save the current state
+      * save the current state - as a snapshot including the derived
+        images if the file extension is `.npz` (see `myoloom.snapshot`)
       * restore the state
     """
 
-    def __init__(self, menu_bar, root, app_state):
+    def __init__(self, menu_bar, root, app_state, worklist=None, polar_map_app_state=None):
         super().__init__(menu_bar)
         self.app_state = app_state
+        self.worklist = worklist
+        self.polar_map_app_state = polar_map_app_state
 
         menu_bar.add_cascade(menu=self, label="File")
         root.bind(
@@ -50,6 +58,19 @@ class MenuFile(tk.Menu):
         self.add_command(
             label="Export Segment Scores", command=self.export_segment_scores
         )
+        self.add_command(label="Export Volumes", command=self.export_volumes)
+
+        if self.worklist is not None:
+            self.add_separator()
+            self.add_command(label="Open Worklist", command=self.open_worklist)
+            self.add_command(
+                label="Next", command=self.worklist.next, accelerator="Ctrl+N"
+            )
+            self.add_command(
+                label="Previous", command=self.worklist.previous, accelerator="Ctrl+P"
+            )
+            root.bind("<Control-n>", lambda event: self.worklist.next())
+            root.bind("<Control-p>", lambda event: self.worklist.previous())
 
         # create a variable for the filename to save as
         self.save_filename = tk.StringVar(value="")
@@ -70,6 +91,16 @@ class MenuFile(tk.Menu):
         """
         FileDialog(self.app_state)
 
+    def open_worklist(self):
+        """
+        Query the user to select a folder of images to be reviewed one after another.
+        """
+        directory = filedialog.askdirectory()
+        if directory == "" or directory == ():
+            return
+
+        self.worklist.set_files([directory])
+
     def save(self):
         """
         Save the current reorientation to a file.
@@ -77,8 +108,7 @@ class MenuFile(tk.Menu):
         if self.save_filename.get() == "":
             return
 
-        with open(self.save_filename.get(), mode="w") as f:
-            json.dump(self.app_state.serialize(), f, indent=2)
+        save_state(self.save_filename.get(), self.app_state, self.polar_map_app_state)
 
     def export_segment_scores(self):
         filename = filedialog.asksaveasfilename()
@@ -103,17 +133,19 @@ class MenuFile(tk.Menu):
             table = pd.concat((table, table_new), ignore_index=False)
         else:
             table = table_new
-        table.to_csv(filename, index=False)
+        with timer("export"):
+            table.to_csv(filename, index=False)
 
     def save_as(self):
         self.app_state.filename_save.set(filedialog.asksaveasfilename())
         self.save()
 
     def load(self):
-        filename = filedialog.askopenfile()
+        filename = filedialog.askopenfilename()
+        if filename == "" or filename == ():
+            return
 
-        with open(filename, mode="r") as f:
-            self.app_state.deserialize(json.load(f))
+        load_state(filename, self.app_state, self.polar_map_app_state)
 
     def import_reorientation(self):
         """
@@ -147,6 +179,34 @@ class MenuFile(tk.Menu):
             state.center.z.value = center[2]
         pass
 
+    def export_volumes(self):
+        """
+        Query the user to select a file for exporting the reoriented SA, HLA and
+        VLA volumes (see `myoloom.export`). The format is derived from the extension
+        and the view is appended to the filename.
+        """
+        filename = filedialog.asksaveasfilename(
+            defaultextension=FORMATS["nifti"],
+            filetypes=[("NIfTI", f"*{FORMATS['nifti']}"), ("DICOM", f"*{FORMATS['dicom']}")],
+        )
+        if filename == "" or filename == ():
+            return
+
+        format = "dicom" if filename.endswith(FORMATS["dicom"]) else "nifti"
+        basename = filename.removesuffix(FORMATS[format])
+
+        views = reoriented_views(
+            self.app_state.sitk_img.value,
+            center=tuple(self.app_state.reorientation.center.values()),
+            angles=tuple(self.app_state.reorientation.angle.values()),
+            img_sa=self.app_state.img_sa.value,
+        )
+        attributes = None
+        if format == "dicom":
+            attributes = dicom_attributes(self.app_state.filename.value)
+        with timer("export"):
+            write_views(views, basename, format=format, attributes=attributes)
+
     def export_reorientation(self):
         filename = filedialog.asksaveasfilename()
 
@@ -176,7 +236,8 @@ class MenuFile(tk.Menu):
         _dataframe = pd.DataFrame(_dataframe)
 
         # data.sort_values(by="filename", inplace=True)
-        _dataframe.to_csv(filename, index=False)
+        with timer("export"):
+            _dataframe.to_csv(filename, index=False)
 
     def save_as(self):
         """
@@ -191,11 +252,33 @@ class MenuBar(tk.Menu):
     Menu bar of the app.
     """
 
-    def __init__(self, parent, app_state: AppState):
+    def __init__(
+        self,
+        parent,
+        app_state: AppState,
+        worklist: Optional[WorklistState] = None,
+        polar_map_app_state: Optional[PolarMapAppState] = None,
+    ):
         super().__init__(parent)
 
         parent.option_add("*tearOff", False)
         parent["menu"] = self
 
         self.app_state = app_state
-        self.menu_file = MenuFile(self, parent, app_state)
+        self.menu_file = MenuFile(
+            self, parent, app_state, worklist=worklist, polar_map_app_state=polar_map_app_state
+        )
+        self.menu_debug = MenuDebug(self)
+
+
+class MenuDebug(tk.Menu):
+    """
+    The Debug menu containing options to
+      * show the latency metrics of the session
+    """
+
+    def __init__(self, menu_bar):
+        super().__init__(menu_bar)
+
+        menu_bar.add_cascade(menu=self, label="Debug")
+        self.add_command(label="Metrics", command=MetricsView)
@@ -0,0 +1,61 @@
+"""
+Debug panel displaying the latency metrics of the session.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+from ..metrics import METRICS, Metrics
+
+COLUMNS = ("count", "mean_ms", "p50_ms", "p95_ms", "max_ms")
+
+
+class MetricsView(tk.Toplevel):
+    """
+    Window with a table of all metrics (see `myoloom.metrics`)
+    which is refreshed periodically.
+    """
+
+    def __init__(self, metrics: Metrics = METRICS, interval: int = 1000):
+        super().__init__()
+        self.title("Metrics")
+
+        self.metrics = metrics
+        self.interval = interval
+        # id of the scheduled refresh which is cancelled when the window is destroyed
+        self._refresh_id = None
+
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.table = ttk.Treeview(self, columns=COLUMNS)
+        self.table.heading("#0", text="metric")
+        for column in COLUMNS:
+            self.table.heading(column, text=column)
+            self.table.column(column, width=90, anchor=tk.E)
+        self.table.grid(row=0, column=0, columnspan=2, sticky="nswe")
+
+        ttk.Button(self, text="Reset", command=self.reset).grid(row=1, column=0, pady=5)
+        ttk.Button(self, text="Close", command=self.destroy).grid(row=1, column=1, pady=5)
+
+        self.refresh()
+
+    def reset(self):
+        self.metrics.clear()
+        self.table.delete(*self.table.get_children())
+
+    def refresh(self):
+        for name, summary in self.metrics.summary().items():
+            values = [summary["count"]] + [f"{summary[key]:.1f}" for key in COLUMNS[1:]]
+            if self.table.exists(name):
+                self.table.item(name, values=values)
+            else:
+                self.table.insert("", tk.END, iid=name, text=name, values=values)
+
+        self._refresh_id = self.after(self.interval, self.refresh)
+
+    def destroy(self):
+        if self._refresh_id is not None:
+            self.after_cancel(self._refresh_id)
+            self._refresh_id = None
+        super().destroy()
@@ -0,0 +1,123 @@
+"""
+Scheduling of updates triggered by user interactions.
+"""
+
+import tkinter as tk
+from typing import Callable, Dict, Hashable, Optional
+
+from widget_state import BoolState
+
+
+class FrameScheduler:
+    """
+    Coalesce updates of interaction handlers (e.g. `<B1-Motion>`) into
+    one update per frame.
+
+    Handlers schedule an update under a key instead of performing it.
+    Only the latest update per key is kept and all pending updates are
+    performed together after the frame interval.
+
+    Parameters
+    ----------
+    widget: tk.Widget
+        widget used to schedule the updates with `after`
+    flushing: BoolState, optional
+        set while the pending updates are performed, so that observers of
+        the updated states can react once after all of them
+    interval: int
+        frame interval in milliseconds
+    """
+
+    def __init__(
+        self, widget: tk.Widget, flushing: Optional[BoolState] = None, interval: int = 16
+    ):
+        self._widget = widget
+        self._flushing = flushing
+        self._interval = interval
+
+        self._pending: Dict[Hashable, Callable[[], None]] = {}
+        self._after_id: Optional[str] = None
+
+    def schedule(self, key: Hashable, update: Callable[[], None]) -> None:
+        """
+        Schedule an update which replaces a pending update with the same key.
+        """
+        self._pending[key] = update
+        if self._after_id is None:
+            self._after_id = self._widget.after(self._interval, self.flush)
+
+    def flush(self) -> None:
+        """
+        Perform all pending updates immediately.
+        """
+        if self._after_id is not None:
+            self._widget.after_cancel(self._after_id)
+            self._after_id = None
+
+        pending, self._pending = self._pending, {}
+        if len(pending) == 0:
+            return
+
+        if self._flushing is None:
+            for update in pending.values():
+                update()
+            return
+
+        self._flushing.value = True
+        try:
+            for update in pending.values():
+                update()
+        finally:
+            self._flushing.value = False
+
+
+class Debouncer:
+    """
+    Delay an update until no further update has been requested for some time.
+
+    This avoids expensive updates while a user is still interacting,
+    e.g. changing the reorientation of an image.
+
+    Parameters
+    ----------
+    widget: tk.Widget
+        widget used to schedule the update with `after`
+    delay: int
+        default delay in milliseconds
+    """
+
+    def __init__(self, widget: tk.Widget, delay: int = 300):
+        self._widget = widget
+        self._delay = delay
+
+        self._update: Optional[Callable[[], None]] = None
+        self._after_id: Optional[str] = None
+
+    def schedule(self, update: Callable[[], None], delay: Optional[int] = None) -> None:
+        """
+        Schedule an update and replace a pending update.
+
+        Parameters
+        ----------
+        update: callable
+        delay: int, optional
+            delay in milliseconds - the default delay is used if not provided
+        """
+        if self._after_id is not None:
+            self._widget.after_cancel(self._after_id)
+
+        self._update = update
+        delay = self._delay if delay is None else delay
+        self._after_id = self._widget.after(delay, self.flush)
+
+    def flush(self) -> None:
+        """
+        Perform a pending update immediately.
+        """
+        if self._after_id is not None:
+            self._widget.after_cancel(self._after_id)
+            self._after_id = None
+
+        update, self._update = self._update, None
+        if update is not None:
+            update()
@@ -1,9 +1,10 @@
+import threading
 import time
 import tkinter as tk
 from tkinter import ttk
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import zlib
 
-import cv2 as cv
 import numpy as np
 import SimpleITK as sitk
 
@@ -18,18 +19,126 @@ from widget_state import (
     NumberState,
 )
 
-from ..util import normalize_image
+from ..statistics import IntensityStatistics
+from ..windowing import quantize, window_lut, window_upper
 from .scale import Scale, ScaleState
 
 
+def image_fingerprint(sitk_img: Optional[sitk.Image]) -> Optional[Tuple]:
+    """
+    Fingerprint of an SITK image consisting of its geometry, its pixel type
+    and a checksum (crc32) of its content.
+
+    Equal fingerprints indicate equal images. Computing the checksum
+    is much cheaper than the resampling or normalization of an image.
+    """
+    if sitk_img is None:
+        return None
+
+    return (
+        sitk_img.GetSize(),
+        sitk_img.GetSpacing(),
+        sitk_img.GetOrigin(),
+        sitk_img.GetDirection(),
+        sitk_img.GetPixelID(),
+        zlib.crc32(sitk.GetArrayViewFromImage(sitk_img)),
+    )
+
+
 class SITKData(BasicState[sitk.Image]):
     """
     Reactive container for an SITK image.
+
+    Notifications are only triggered if the assigned image differs
+    from the previous one (see `image_fingerprint`).
+    Intensity statistics are cached alongside the image (see `statistics`).
     """
 
     def __init__(self, value: sitk.Image):
+        self._fingerprint = image_fingerprint(value)
+        # statistics are cached together with the image they were computed of,
+        # because they are also requested by background threads (see `statistics`)
+        self._statistics: Optional[Tuple[sitk.Image, IntensityStatistics]] = None
+        self._statistics_lock = threading.Lock()
         super().__init__(value, verify_change=False)
 
+    def __setattr__(self, name: str, new_value: sitk.Image) -> None:
+        if name == "value" and hasattr(self, "value"):
+            fingerprint = image_fingerprint(new_value)
+            if fingerprint is not None and fingerprint == self._fingerprint:
+                return
+            self._fingerprint = fingerprint
+
+        super().__setattr__(name, new_value)
+
+    @property
+    def fingerprint(self) -> Optional[Tuple]:
+        """
+        Fingerprint of the current image (see `image_fingerprint`).
+        """
+        return self._fingerprint
+
+    def statistics(self) -> IntensityStatistics:
+        """
+        Intensity statistics of the image which are computed once per image.
+
+        This is thread-safe: statistics are only cached if the image
+        was not replaced while they were computed.
+        """
+        sitk_img = self.value
+        with self._statistics_lock:
+            cached = self._statistics
+        if cached is not None and cached[0] is sitk_img:
+            return cached[1]
+
+        statistics = IntensityStatistics.from_image(sitk_img)
+        with self._statistics_lock:
+            if self.value is sitk_img:
+                self._statistics = (sitk_img, statistics)
+        return statistics
+
+
+class DerivedCache:
+    """
+    Cache of the last value derived under each name, e.g. the image of a
+    computed state, together with a key of the inputs it was derived from.
+
+    Computed states look up their value before deriving it again, so that
+    notifications without a change of the inputs and restored snapshots
+    (see `myoloom.snapshot`) do not trigger a resampling. Only a single
+    value is kept per name.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Hashable, Any]] = {}
+
+    def lookup(self, name: str, key: Hashable) -> Optional[Any]:
+        """
+        Get the value derived under a name from inputs with the given key
+        or None if it is not cached.
+        """
+        cached = self._values.get(name)
+        if cached is None or cached[0] != key:
+            return None
+        return cached[1]
+
+    def get(self, name: str, key: Hashable, derive: Callable[[], Any]) -> Any:
+        """
+        Get the value derived under a name from inputs with the given key
+        or derive and cache it if it is not cached.
+        """
+        value = self.lookup(name, key)
+        if value is None:
+            value = derive()
+            self._values[name] = (key, value)
+        return value
+
+    def set(self, name: str, key: Hashable, value: Any) -> None:
+        """
+        Provide the value derived under a name from inputs with the given key.
+        """
+        self._values[name] = (key, value)
+
 
 class SliceViewState(HigherOrderState):
     def __init__(
@@ -38,6 +147,7 @@ class SliceViewState(HigherOrderState):
         slice: Optional[NumberState] = None,
         clip_percentage: Optional[NumberState] = None,
         colormap: Optional[NumberState] = None,
+        clip_percentile: Optional[NumberState] = None,
     ):
         super().__init__()
 
@@ -54,47 +164,60 @@ class SliceViewState(HigherOrderState):
         self.clip_percentage = (
             clip_percentage if clip_percentage is not None else NumberState(1.0)
         )
+        # a percentile window replaces the clip percentage if set
+        self.clip_percentile = (
+            clip_percentile if clip_percentile is not None else NumberState(None)
+        )
         self.colormap = colormap if colormap is not None else NumberState(None)
 
         self._validate_computed_states()
 
     @computed
-    def normalized_image(
-        self, sitk_img: SITKData, clip_percentage: NumberState
-    ) -> ImageData:
-        image = sitk.GetArrayFromImage(sitk_img.value)
-        if image.max() == image.min() == 0.0:
-            return ImageData(np.zeros(image.shape, np.uint8))
+    def quantized_image(self, sitk_img: SITKData) -> ImageData:
+        """
+        Quantize the image once so that windowing only requires a lookup table.
+        """
+        return ImageData(
+            quantize(sitk.GetArrayViewFromImage(sitk_img.value), sitk_img.statistics())
+        )
 
-        image = np.clip(
-            image, a_min=image.min(), a_max=clip_percentage.value * image.max()
+    @computed
+    def lut(
+        self,
+        sitk_img: SITKData,
+        clip_percentage: NumberState,
+        clip_percentile: NumberState,
+        colormap: NumberState,
+    ) -> ObjectState:
+        """
+        Lookup table of the current window (see `window_lut`).
+        """
+        statistics = sitk_img.statistics()
+        upper = window_upper(
+            statistics,
+            clip_percentage=clip_percentage.value,
+            clip_percentile=clip_percentile.value,
         )
-        image = (image - image.min()) / (image.max() - image.min())
-        image = (255 * image).astype(np.uint8)
-        return ImageData(image)
+        return ObjectState(window_lut(statistics, upper, colormap=colormap.value))
 
     @computed
     def slice_image(
         self,
-        normalized_image: ImageData,
+        quantized_image: ImageData,
+        lut: ObjectState,
         slice: NumberState,
-        colormap: NumberState,
     ) -> ImageData:
         """
-        Convert the SITK image to an np.array and normalize the image.
+        Select a slice of the image and apply the window to it.
         """
-        image = normalized_image.value
+        image = quantized_image.value
 
         try:
             slice_image = image[slice.value]
         except IndexError:
-            return ImageData(np.zeros(image.shape[:2], np.uint8))
-
-        if colormap.value is not None:
-            slice_image = cv.applyColorMap(slice_image, colormap.value)
-            slice_image = cv.cvtColor(slice_image, cv.COLOR_BGR2RGB)
+            return ImageData(np.zeros(image.shape[1:], np.uint8))
 
-        return ImageData(slice_image)
+        return ImageData(lut.value[slice_image])
 
 
 class SliceView(ttk.Frame):
@@ -0,0 +1,109 @@
+"""
+Windowing of images for display.
+
+An image is quantized once into `LEVELS` intensity levels. Changing the window
+(e.g. with the normalization slider) then only requires a new lookup table
+with an entry per level, which is applied to the displayed slices. Thus, the
+cost of a window change is independent of the size of the volume.
+"""
+
+from typing import Optional
+
+import cv2 as cv
+import numpy as np
+from numpy.typing import NDArray
+
+from .statistics import IntensityStatistics
+
+# number of intensity levels of quantized images
+LEVELS = 4096
+
+
+def quantize(
+    img: NDArray, statistics: IntensityStatistics, levels: int = LEVELS
+) -> NDArray[np.uint16]:
+    """
+    Quantize an image linearly from its minimum to its maximum into intensity levels.
+
+    Parameters
+    ----------
+    img: NDArray
+    statistics: IntensityStatistics
+        statistics of the image
+    levels: int
+        number of levels - at most 2^16
+
+    Returns
+    -------
+    NDArray[np.uint16]
+    """
+    if statistics.is_constant:
+        return np.zeros(img.shape, np.uint16)
+
+    scale = (levels - 1) / (statistics.max - statistics.min)
+    quantized = img - statistics.min
+    quantized *= scale
+    quantized += 0.5
+    return quantized.astype(np.uint16)
+
+
+def window_upper(
+    statistics: IntensityStatistics,
+    clip_percentage: Optional[float] = None,
+    clip_percentile: Optional[float] = None,
+) -> float:
+    """
+    Upper bound of a window either as a fraction of the maximum
+    or as a percentile of the intensities.
+    """
+    if clip_percentile is not None:
+        return statistics.percentile(clip_percentile)
+    if clip_percentage is not None:
+        return clip_percentage * statistics.max
+    return statistics.max
+
+
+def window_lut(
+    statistics: IntensityStatistics,
+    upper: float,
+    colormap: Optional[int] = None,
+    levels: int = LEVELS,
+) -> NDArray[np.uint8]:
+    """
+    Create a lookup table mapping the levels of a quantized image (see `quantize`)
+    to display values.
+
+    The intensities from the image minimum to `upper` are mapped to [0, 255]
+    as done by `myoloom.util.normalize_image`.
+
+    Parameters
+    ----------
+    statistics: IntensityStatistics
+        statistics of the image
+    upper: float
+        intensity mapped to the maximal display value
+    colormap: int, optional
+        OpenCV colormap applied to the display values
+    levels: int
+        number of levels of the quantized image
+
+    Returns
+    -------
+    NDArray[np.uint8]
+        of shape (levels,) or (levels, 3) as RGB if a colormap is provided
+    """
+    lower = statistics.min
+    upper = min(max(upper, lower), statistics.max)
+
+    if upper - lower == 0.0:
+        lut = np.zeros(levels, np.uint8)
+    else:
+        intensities = np.linspace(statistics.min, statistics.max, levels)
+        lut = np.clip((intensities - lower) / (upper - lower), 0.0, 1.0)
+        lut = (255 * lut).astype(np.uint8)
+
+    if colormap is not None:
+        lut = cv.applyColorMap(lut[:, np.newaxis], colormap)[:, 0]
+        lut = lut[:, ::-1].copy()  # BGR to RGB
+
+    return lut